@@ -0,0 +1,82 @@
+"""Benchmark del motor de copia en proceso frente a robocopy / shutil.copytree.
+
+Genera un árbol sintético (muchos archivos pequeños y algunos grandes) en un
+directorio temporal y mide el tiempo de copia con distintas configuraciones.
+
+Uso:
+    python benchmarks/bench_copy.py --archivos 20000 --grandes 4 --workers 1 4 8 16
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.copy_engine import CopyEngine
+
+
+def generar_arbol(raiz, archivos, grandes, tamano_pequeno, tamano_grande):
+    """Crea un árbol de prueba con subdirectorios de 500 archivos"""
+    datos_pequenos = os.urandom(tamano_pequeno)
+    for i in range(archivos):
+        sub = os.path.join(raiz, f"dir_{i // 500:04d}")
+        if i % 500 == 0:
+            os.makedirs(sub, exist_ok=True)
+        with open(os.path.join(sub, f"archivo_{i:06d}.bin"), 'wb') as f:
+            f.write(datos_pequenos)
+    bloque = os.urandom(1024 * 1024)
+    for i in range(grandes):
+        with open(os.path.join(raiz, f"grande_{i}.bin"), 'wb') as f:
+            for _ in range(tamano_grande // len(bloque)):
+                f.write(bloque)
+
+
+def medir(nombre, funcion, destino, total_bytes):
+    shutil.rmtree(destino, ignore_errors=True)
+    inicio = time.perf_counter()
+    funcion(destino)
+    duracion = time.perf_counter() - inicio
+    mbps = total_bytes / duracion / (1024 * 1024) if duracion else 0
+    print(f"{nombre:<28} {duracion:8.2f} s  {mbps:8.1f} MB/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--archivos', type=int, default=20000)
+    parser.add_argument('--grandes', type=int, default=4)
+    parser.add_argument('--tamano-pequeno', type=int, default=16 * 1024)
+    parser.add_argument('--tamano-grande', type=int, default=64 * 1024 * 1024)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--buffer', type=int, default=1024 * 1024)
+    parser.add_argument('--dir', help="Directorio de trabajo (por defecto uno temporal)")
+    args = parser.parse_args()
+
+    base = tempfile.mkdtemp(prefix="bench_copy_", dir=args.dir)
+    origen = os.path.join(base, "origen")
+    destino = os.path.join(base, "destino")
+    try:
+        os.makedirs(origen)
+        generar_arbol(origen, args.archivos, args.grandes, args.tamano_pequeno, args.tamano_grande)
+        total = args.archivos * args.tamano_pequeno + args.grandes * args.tamano_grande
+        print(f"Árbol: {args.archivos} archivos pequeños, {args.grandes} grandes, "
+              f"{total / (1024 * 1024):.0f} MB")
+
+        if sys.platform == "win32":
+            medir("robocopy", lambda d: subprocess.run(
+                f'robocopy "{origen}" "{d}" /E /COPY:DAT /DCOPY:T /R:3 /W:5 /NP /NFL /NDL /NJH /NJS',
+                shell=True, stdout=subprocess.DEVNULL), destino, total)
+        medir("shutil.copytree", lambda d: shutil.copytree(origen, d), destino, total)
+
+        for workers in args.workers:
+            motor = CopyEngine(workers=workers, buffer_size=args.buffer)
+            medir(f"CopyEngine workers={workers}", lambda d: motor.copiar_arbol(origen, d), destino, total)
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
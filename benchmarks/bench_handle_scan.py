@@ -0,0 +1,87 @@
+"""Benchmark de los escáneres de archivos abiertos (/proc frente a psutil).
+
+Lanza procesos hijo que mantienen abiertos archivos en un directorio
+temporal, mide cuánto tarda cada escáner en recorrer todos los procesos
+del sistema y comprueba que ambos encuentran los mismos hijos.
+
+Uso:
+    python benchmarks/bench_handle_scan.py --procesos 2000 --repeticiones 5
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.handle_index import ESCANERES
+
+# Cada hijo abre un archivo propio y se queda dormido hasta que se le mata
+HIJO = "import sys, time; f = open(sys.argv[1], 'w'); time.sleep(3600)"
+
+
+def lanzar_hijos(directorio, cantidad):
+    hijos = []
+    for i in range(cantidad):
+        ruta = os.path.join(directorio, f"abierto_{i:05d}.txt")
+        hijos.append(subprocess.Popen([sys.executable, "-c", HIJO, ruta]))
+    return hijos
+
+
+def esperar_archivos(directorio, cantidad, limite=60):
+    inicio = time.monotonic()
+    while len(os.listdir(directorio)) < cantidad and time.monotonic() - inicio < limite:
+        time.sleep(0.1)
+
+
+def medir(escaner, directorio, repeticiones):
+    tiempos = []
+    encontrados = set()
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        procesos = escaner.escanear()
+        tiempos.append(time.perf_counter() - inicio)
+    for pid, (_, rutas) in procesos.items():
+        if any(ruta.startswith(directorio + os.sep) for ruta in rutas):
+            encontrados.add(pid)
+    return tiempos, len(procesos), encontrados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--procesos', type=int, default=500,
+                        help="Procesos hijo con un archivo abierto")
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--escaneres', nargs='+', default=list(ESCANERES))
+    parser.add_argument('--dir', help="Directorio de trabajo (por defecto uno temporal)")
+    args = parser.parse_args()
+
+    directorio = os.path.realpath(tempfile.mkdtemp(prefix="bench_handles_", dir=args.dir))
+    hijos = lanzar_hijos(directorio, args.procesos)
+    try:
+        esperar_archivos(directorio, args.procesos)
+        pids_hijos = {hijo.pid for hijo in hijos}
+        print(f"{args.procesos} procesos hijo con archivos en {directorio}")
+
+        for nombre in args.escaneres:
+            clase = ESCANERES[nombre]
+            if not clase.disponible():
+                print(f"{nombre:<8} no disponible en esta plataforma")
+                continue
+            tiempos, total, encontrados = medir(clase(), directorio, args.repeticiones)
+            print(f"{nombre:<8} mejor {min(tiempos):7.3f} s  media {sum(tiempos) / len(tiempos):7.3f} s  "
+                  f"{total:6d} procesos con archivos  "
+                  f"{len(encontrados & pids_hijos)}/{len(pids_hijos)} hijos detectados")
+    finally:
+        for hijo in hijos:
+            hijo.kill()
+        for hijo in hijos:
+            hijo.wait()
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""Benchmark del arranque de la interfaz: tiempo de import y hasta el primer pintado.
+
+Cada medición se hace en un proceso nuevo con la plataforma offscreen de Qt,
+así que no necesita pantalla y no arrastra módulos ya cargados:
+
+- importación: python -X importtime -c "import ui.main_window", con el total
+  y los módulos más costosos (acumulado y propio).
+- primer pintado: desde que se crea ChangeFormatUSB hasta su primer
+  paintEvent y hasta que empieza y termina su arranque diferido, además
+  del proceso completo. El arranque diferido debe empezar después del
+  primer pintado; si en alguna ejecución no es así, termina con error.
+
+Uso:
+    python benchmarks/bench_startup.py --repeticiones 5 --top 15
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULO = "ui.main_window"
+# Si la ventana no llega a pintarse, el hijo no se queda colgado
+LIMITE_MS = 30000
+
+
+def entorno():
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen", PYTHONDONTWRITEBYTECODE="1")
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [RAIZ, env.get('PYTHONPATH')]))
+    return env
+
+
+def medir_importacion():
+    """Devuelve {módulo: (propio_us, acumulado_us)} de un import en frío"""
+    proceso = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {MODULO}"],
+                             cwd=RAIZ, env=entorno(), capture_output=True, text=True)
+    if proceso.returncode != 0:
+        raise RuntimeError(proceso.stderr.strip().splitlines()[-1])
+    modulos = {}
+    for linea in proceso.stderr.splitlines():
+        if not linea.startswith("import time:") or "self [us]" in linea:
+            continue
+        propio, acumulado, nombre = linea[len("import time:"):].split("|")
+        modulos[nombre.strip()] = (int(propio), int(acumulado))
+    return modulos
+
+
+def medir_pintado():
+    """Hijo: crea la ventana y anota cuándo se pinta y cuándo termina el arranque"""
+    from PyQt5.QtCore import QObject, QEvent, QTimer
+    from PyQt5.QtWidgets import QApplication, QWidget
+
+    app = QApplication(sys.argv)
+    inicio_import = time.perf_counter()
+    import ui.main_window as main_window
+    marcas = {'import': time.perf_counter() - inicio_import}
+
+    # El aviso de permisos es modal y detendría la medición
+    main_window.ChangeFormatUSB.show_admin_warning = lambda self: None
+    arranque_original = main_window.ChangeFormatUSB.finish_startup
+
+    def finish_startup(self):
+        marcas['inicio_arranque'] = time.perf_counter() - inicio_ventana
+        arranque_original(self)
+
+    main_window.ChangeFormatUSB.finish_startup = finish_startup
+    inicio_ventana = time.perf_counter()
+    ventana = main_window.ChangeFormatUSB()
+    marcas['constructor'] = time.perf_counter() - inicio_ventana
+
+    class PrimerPintado(QObject):
+        def eventFilter(self, objeto, evento):
+            if (evento.type() == QEvent.Paint and 'pintado' not in marcas
+                    and isinstance(objeto, QWidget) and objeto.window() is ventana):
+                marcas['pintado'] = time.perf_counter() - inicio_ventana
+                terminar_si_listo()
+            return False
+
+    def terminar_si_listo():
+        if 'pintado' in marcas and 'arranque_diferido' in marcas:
+            QTimer.singleShot(0, ventana.close)
+
+    def al_terminar_arranque():
+        marcas['arranque_diferido'] = time.perf_counter() - inicio_ventana
+        terminar_si_listo()
+
+    filtro = PrimerPintado()
+    app.installEventFilter(filtro)
+    ventana.startup_finished.connect(al_terminar_arranque)
+    ventana.show()
+    QTimer.singleShot(LIMITE_MS, app.quit)
+    app.exec_()
+    print(json.dumps({clave: valor * 1000 for clave, valor in marcas.items()}), flush=True)
+    # Ya está medido: salir sin que el recolector destruya los objetos Qt en
+    # cualquier orden, que a veces hace fallar al proceso y perder la medición
+    os._exit(0)
+
+
+def lanzar_pintado():
+    inicio = time.perf_counter()
+    proceso = subprocess.run([sys.executable, os.path.abspath(__file__), "--hijo"],
+                             cwd=RAIZ, env=entorno(), capture_output=True, text=True)
+    total = (time.perf_counter() - inicio) * 1000
+    if proceso.returncode != 0 or not proceso.stdout.strip():
+        raise RuntimeError((proceso.stderr.strip() or "sin salida").splitlines()[-1])
+    marcas = json.loads(proceso.stdout.strip().splitlines()[-1])
+    marcas['proceso'] = total
+    return marcas
+
+
+def mediana(valores):
+    return statistics.median(valores) if valores else float('nan')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help="módulos más costosos a mostrar")
+    parser.add_argument('--hijo', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.hijo:
+        medir_pintado()
+        return
+
+    totales = []
+    modulos = {}
+    for _ in range(args.repeticiones):
+        medicion = medir_importacion()
+        totales.append(medicion[MODULO][1] / 1000)
+        for nombre, tiempos in medicion.items():
+            modulos.setdefault(nombre, []).append(tiempos)
+    print(f"import {MODULO}: mediana {mediana(totales):.1f} ms "
+          f"(mín {min(totales):.1f}, máx {max(totales):.1f}) en {args.repeticiones} procesos")
+
+    resumen = {nombre: (mediana([p for p, _ in tiempos]) / 1000,
+                        mediana([a for _, a in tiempos]) / 1000)
+               for nombre, tiempos in modulos.items()}
+    print(f"\n{'módulo':<40} {'propio ms':>10} {'acumulado ms':>13}")
+    for nombre, (propio, acumulado) in sorted(resumen.items(), key=lambda m: -m[1][1])[:args.top]:
+        print(f"{nombre:<40} {propio:>10.1f} {acumulado:>13.1f}")
+
+    print()
+    mediciones = [lanzar_pintado() for _ in range(args.repeticiones)]
+    for clave, texto in (('import', "import de la interfaz"),
+                         ('constructor', "constructor de la ventana"),
+                         ('pintado', "hasta el primer pintado"),
+                         ('inicio_arranque', "hasta el inicio del arranque diferido"),
+                         ('arranque_diferido', "hasta el fin del arranque diferido"),
+                         ('proceso', "proceso completo (arranque a cierre)")):
+        valores = [m[clave] for m in mediciones if clave in m]
+        print(f"{texto:<38} mediana {mediana(valores):8.1f} ms")
+    if any('pintado' not in m for m in mediciones):
+        print("Aviso: alguna ejecución no llegó a pintar la ventana")
+    adelantadas = [m for m in mediciones
+                   if 'inicio_arranque' not in m or m['inicio_arranque'] < m.get('pintado', float('inf'))]
+    if adelantadas:
+        print(f"Error: en {len(adelantadas)} de {len(mediciones)} ejecuciones el arranque diferido "
+              f"empezó antes del primer pintado")
+        sys.exit(1)
+    print("El arranque diferido empezó después del primer pintado en todas las ejecuciones")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+"""Línea de comandos de Change Format USB, sin interfaz gráfica.
+
+Escribe una línea JSON por evento en la salida estándar (progreso,
+resultados y errores) para poder usarla desde scripts de
+aprovisionamiento. No importa Qt: los módulos pesados se cargan solo
+cuando el comando los necesita.
+
+Uso:
+    python cli.py convertir E: F: --fs NTFS
+    python cli.py convertir --lista unidades.txt --fs exFAT --concurrentes 4
+    python cli.py vigilar --fs FAT32
+    python cli.py unidades
+    python cli.py clonar D:\\plantilla E: F: G: --fs exFAT
+    python cli.py historial --conversiones 5
+"""
+import argparse
+import fnmatch
+import json
+import os
+import queue
+import sys
+import time
+
+import config
+
+# Códigos de salida
+SALIDA_OK = 0
+SALIDA_FALLOS = 1
+SALIDA_SIN_PERMISOS = 2
+SALIDA_INTERRUMPIDO = 130
+
+
+def emitir(evento, **datos):
+    """Escribe un evento como una línea JSON"""
+    linea = json.dumps({'evento': evento, 't': round(time.time(), 3), **datos},
+                       ensure_ascii=False, default=str)
+    sys.stdout.write(linea + "\n")
+    sys.stdout.flush()
+
+
+def comprobar_permisos(args):
+    """Formatear unidades reales exige administrador; las simuladas no"""
+    if args.simular or sys.platform != "win32":
+        return True
+    import ctypes
+    try:
+        if ctypes.windll.shell32.IsUserAnAdmin():
+            return True
+    except Exception:
+        pass
+    emitir("error", mensaje="Se necesitan permisos de administrador para formatear unidades")
+    return False
+
+
+def leer_unidades(args):
+    unidades = list(args.unidades)
+    if args.lista:
+        archivo = sys.stdin if args.lista == "-" else open(args.lista, encoding='utf-8')
+        with archivo:
+            unidades += [linea.strip() for linea in archivo
+                         if linea.strip() and not linea.startswith("#")]
+    return unidades
+
+
+def volumenes_simulados(args):
+    """Volúmenes sobre directorios para --simular (None sin él).
+
+    La tabla de volúmenes se guarda junto al staging para que varias
+    ejecuciones vean el sistema de archivos que dejó la anterior.
+    """
+    if not args.simular:
+        return None
+    import tempfile
+    from core.fake_drive import VolumenesSimulados
+
+    base = os.path.join(tempfile.gettempdir(), "ChangeFormatUsb-simulado")
+    return VolumenesSimulados(os.path.join(base, "staging"),
+                              registro=os.path.join(base, "volumenes.json"))
+
+
+def crear_cola(args, eventos, volumenes=None):
+    from core.conversion_queue import ConversionQueue
+
+    if volumenes is not None:
+        from core.format_converter import FormatConverter
+
+        def fabrica(turno):
+            return FormatConverter(runner=volumenes.ejecutor(), turno=turno, volumenes=volumenes)
+    else:
+        fabrica = None  # FormatConverter sobre volúmenes reales
+    return ConversionQueue(max_concurrentes=args.concurrentes, fabrica_convertidor=fabrica,
+                           al_cambiar=lambda trabajo: eventos.put(('trabajo', trabajo)))
+
+
+def informar_trabajo(trabajo):
+    datos = trabajo.como_dict()
+    datos.pop('progreso')
+    emitir("resultado" if not trabajo.activo else "estado", **datos)
+
+
+def bucle_eventos(cola, eventos, al_evento=None, seguir=None):
+    """Atiende cambios de los trabajos y publica su progreso hasta que la cola se vacíe.
+
+    Todo se escribe desde este hilo; el progreso se muestrea como mucho
+    PROGRESS_MAX_UPDATES_PER_SEC veces por segundo. Devuelve si algún
+    trabajo falló.
+    """
+    from core.conversion_queue import ERROR
+
+    intervalo = 1.0 / config.PROGRESS_MAX_UPDATES_PER_SEC
+    fallos = False
+    while True:
+        try:
+            tipo, dato = eventos.get(timeout=intervalo)
+        except queue.Empty:
+            tipo = None
+        if tipo == 'trabajo':
+            informar_trabajo(dato)
+            fallos |= dato.estado == ERROR
+        elif tipo is not None and al_evento:
+            al_evento(tipo, dato)
+        for trabajo in cola.activos():
+            estado = trabajo.progreso.tomar()
+            if estado is not None:
+                emitir("progreso", id=trabajo.id, unidad=trabajo.unidad, **estado)
+        if tipo is None and not cola.activos() and eventos.empty() and not (seguir and seguir()):
+            return fallos
+
+
+def comando_convertir(args):
+    unidades = leer_unidades(args)
+    if not unidades:
+        emitir("error", mensaje="No se indicó ninguna unidad")
+        return SALIDA_FALLOS
+    if not comprobar_permisos(args):
+        return SALIDA_SIN_PERMISOS
+    eventos = queue.SimpleQueue()
+    volumenes = volumenes_simulados(args)
+    cola = crear_cola(args, eventos, volumenes)
+    fallos = False
+    for unidad in unidades:
+        if volumenes is not None:
+            unidad = volumenes.registrar(unidad)
+        try:
+            cola.encolar(unidad, args.fs, tamano_cluster=args.cluster)
+        except ValueError as e:
+            emitir("error", unidad=unidad, mensaje=str(e))
+            fallos = True
+    try:
+        fallos |= bucle_eventos(cola, eventos)
+    except KeyboardInterrupt:
+        cola.detener(timeout=10)
+        while not eventos.empty():
+            informar_trabajo(eventos.get()[1])
+        return SALIDA_INTERRUMPIDO
+    return SALIDA_FALLOS if fallos else SALIDA_OK
+
+
+def es_usb(unidad, usb_manager):
+    letras = {drive['letter'].upper() for drive in usb_manager.get_usb_devices(force=True)}
+    return unidad.rstrip("\\").upper() in letras
+
+
+def comando_vigilar(args):
+    """Convierte cada unidad USB que se conecte hasta que se interrumpa"""
+    if args.simular:
+        # Los directorios simulados no se "conectan": el watcher solo vería montajes reales
+        emitir("error", mensaje="vigilar no admite --simular; usa convertir con los directorios")
+        return SALIDA_FALLOS
+    if not comprobar_permisos(args):
+        return SALIDA_SIN_PERMISOS
+    from core.device_watcher import DeviceWatcher, EVENTO_AGREGADO, EVENTO_ELIMINADO
+    from core.usb_manager import USBManager
+
+    eventos = queue.SimpleQueue()
+    cola = crear_cola(args, eventos)
+    usb_manager = USBManager()
+    watcher = DeviceWatcher()
+    watcher.suscribir(lambda evento: eventos.put(('dispositivo', evento)))
+    if not watcher.start():
+        emitir("error", mensaje="No hay backend de notificación de dispositivos")
+        usb_manager.shutdown()
+        return SALIDA_FALLOS
+    # Unidades ya tratadas: al volver a montarse tras formatear no se repiten
+    atendidas = set()
+
+    def al_evento(tipo, evento):
+        unidad = evento['unidad']
+        emitir("dispositivo", tipo=evento['tipo'], unidad=unidad)
+        if evento['tipo'] == EVENTO_ELIMINADO:
+            atendidas.discard(unidad)
+            return
+        if evento['tipo'] != EVENTO_AGREGADO or unidad in atendidas:
+            return
+        if not es_usb(unidad, usb_manager):
+            emitir("omitida", unidad=unidad, mensaje="No es una unidad USB extraíble")
+            return
+        atendidas.add(unidad)
+        try:
+            cola.encolar(unidad, args.fs, tamano_cluster=args.cluster)
+        except ValueError as e:
+            emitir("error", unidad=unidad, mensaje=str(e))
+
+    emitir("vigilando", backend=watcher.backend.nombre, fs=args.fs)
+    try:
+        bucle_eventos(cola, eventos, al_evento, seguir=lambda: True)
+    except KeyboardInterrupt:
+        cola.detener(timeout=10)
+        while not eventos.empty():
+            tipo, dato = eventos.get()
+            if tipo == 'trabajo':
+                informar_trabajo(dato)
+    finally:
+        watcher.stop()
+        usb_manager.shutdown()
+    return SALIDA_INTERRUMPIDO
+
+
+def comando_unidades(args):
+    from core.usb_manager import USBManager
+
+    usb_manager = USBManager()
+    try:
+        for drive in usb_manager.get_usb_devices(force=True):
+            emitir("unidad", **drive)
+    finally:
+        usb_manager.shutdown()
+    return SALIDA_OK
+
+
+def comando_historial(args):
+    """Dispositivos del historial con su rendimiento y sus últimas conversiones"""
+    from core.device_history import DeviceHistory
+
+    historial = DeviceHistory()
+    try:
+        for dispositivo in historial.resumen():
+            conversiones = (historial.conversiones(dispositivo['id'], args.conversiones)
+                            if args.conversiones else [])
+            emitir("dispositivo", **dispositivo, ultimas_conversiones=conversiones)
+    finally:
+        historial.cerrar()
+    return SALIDA_OK
+
+
+def omitir_en_clon():
+    """Deja fuera del clon los artefactos del sistema"""
+    patrones = [patron.lower() for patron in config.SYSTEM_ARTIFACTS]
+
+    def omitir(relativo):
+        raiz = relativo.replace("\\", "/").split("/", 1)[0].lower()
+        return any(fnmatch.fnmatchcase(raiz, patron) for patron in patrones)
+    return omitir
+
+
+def comando_clonar(args):
+    if not comprobar_permisos(args):
+        return SALIDA_SIN_PERMISOS
+    from core.clone import FanOutCloner, formateador_unidades
+
+    destinos = args.destinos
+    volumenes = volumenes_simulados(args)
+    if volumenes is not None:
+        destinos = [volumenes.registrar(destino) for destino in destinos]
+    if args.sin_formatear:
+        formatear = None
+    elif volumenes is not None:
+        def formatear(destino, archivos):
+            volumenes.formatear(destino, args.fs)
+    else:
+        formatear = formateador_unidades(args.fs, args.cluster)
+    clonador = FanOutCloner(args.origen, destinos, formatear=formatear, omitir=omitir_en_clon())
+    try:
+        resultados = clonador.clonar(lambda estado: emitir("progreso", **estado))
+    except KeyboardInterrupt:
+        clonador.cancelar()
+        return SALIDA_INTERRUMPIDO
+    for resultado in resultados:
+        emitir("resultado", **resultado)
+    for relativo, error in clonador.errores_origen:
+        emitir("error", origen=args.origen, archivo=relativo, mensaje=error)
+    fallos = clonador.errores_origen or any(r['error'] or r['incompletos'] for r in resultados)
+    return SALIDA_FALLOS if fallos else SALIDA_OK
+
+
+def tamano_cluster(valor):
+    """Acepta bytes (4096) o la notación de format (64K, 1M)"""
+    valor = valor.strip().upper()
+    multiplicador = {'K': 1024, 'M': 1024 * 1024}.get(valor[-1:], 1)
+    try:
+        return int(valor.rstrip('KM')) * multiplicador
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Tamaño de clúster inválido: {valor}")
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description=__doc__.splitlines()[0])
+    parser.add_argument('--simular', action='store_true',
+                        help="las unidades son directorios (core.fake_drive.VolumenesSimulados)")
+    comandos = parser.add_subparsers(dest='comando', required=True)
+
+    def opciones_formato(sub, requerido=True):
+        sub.add_argument('--fs', required=requerido, type=str.upper,
+                         choices=[fs.upper() for fs in config.SUPPORTED_FORMATS],
+                         help="sistema de archivos de destino")
+        sub.add_argument('--cluster', type=tamano_cluster,
+                         help="tamaño de clúster (por defecto se elige según los archivos)")
+
+    convertir = comandos.add_parser('convertir', help="convierte una o varias unidades")
+    convertir.add_argument('unidades', nargs='*', help="letras de unidad (E: F: ...)")
+    convertir.add_argument('--lista', help="archivo con una unidad por línea ('-' para stdin)")
+    convertir.add_argument('--concurrentes', type=int, help="conversiones a la vez")
+    opciones_formato(convertir)
+    convertir.set_defaults(funcion=comando_convertir)
+
+    vigilar = comandos.add_parser('vigilar', help="convierte cada unidad USB que se conecte")
+    vigilar.add_argument('--concurrentes', type=int, help="conversiones a la vez")
+    opciones_formato(vigilar)
+    vigilar.set_defaults(funcion=comando_vigilar)
+
+    unidades = comandos.add_parser('unidades', help="lista las unidades USB conectadas")
+    unidades.set_defaults(funcion=comando_unidades)
+
+    historial = comandos.add_parser('historial', help="rendimiento y conversiones de cada dispositivo")
+    historial.add_argument('--conversiones', type=int, default=10, metavar='N',
+                           help="últimas conversiones de cada dispositivo (0 para ninguna)")
+    historial.set_defaults(funcion=comando_historial)
+
+    clonar = comandos.add_parser('clonar', help="formatea varias unidades y copia el mismo contenido")
+    clonar.add_argument('origen', help="directorio o unidad de origen")
+    clonar.add_argument('destinos', nargs='+', help="unidades de destino")
+    clonar.add_argument('--sin-formatear', action='store_true',
+                        help="escribe sobre los destinos sin formatearlos")
+    opciones_formato(clonar, requerido=False)
+    clonar.set_defaults(funcion=comando_clonar)
+    return parser
+
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+    if args.comando == 'clonar' and not args.fs and not args.sin_formatear:
+        emitir("error", mensaje="clonar necesita --fs o --sin-formatear")
+        return SALIDA_FALLOS
+    # El registro (archivo y JSONL) se configura después de validar los argumentos
+    from logger import logger
+    logger.info(f"Línea de comandos: {' '.join(sys.argv[1:] if argv is None else argv)}")
+    return args.funcion(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,4 +3,102 @@ APP_NAME = "Change Format USB"
 APP_VERSION = "1.0beta"
 AUTHOR = "Vicemi"
 REFRESH_INTERVAL = 2000  # ms
-SUPPORTED_FORMATS = ["NTFS", "FAT32", "exFAT", "ReFS"]
\ No newline at end of file
+SUPPORTED_FORMATS = ["NTFS", "FAT32", "exFAT", "ReFS"]
+
+# Motor de copia
+COPY_BACKEND = "python"  # "python" (motor en proceso) o "robocopy"
+COPY_WORKERS = 8
+COPY_BUFFER_SIZE = 1024 * 1024  # bytes por hilo
+
+# Backup durante la conversión
+BACKUP_MODE = "directorio"  # "directorio" (árbol copiado) o "archivo" (tar en streaming)
+BACKUP_SAMPLE_BYTES = 16 * 1024 * 1024  # muestra para decidir la compresión
+BACKUP_MAX_COMPRESSION_RATIO = 0.9  # por encima no compensa comprimir
+
+# Estimaciones para el progreso y la ETA antes de tener mediciones
+DEFAULT_READ_THROUGHPUT = 30 * 1024 * 1024  # bytes/s leyendo de la USB
+DEFAULT_WRITE_THROUGHPUT = 15 * 1024 * 1024  # bytes/s escribiendo en la USB
+FORMAT_ESTIMATE_SECONDS = 15
+MOUNT_ESTIMATE_SECONDS = 5
+CONVERT_ESTIMATE_SECONDS = 60
+
+# Progreso en la interfaz
+PROGRESS_MAX_UPDATES_PER_SEC = 10  # actualizaciones por segundo como máximo
+
+# Detección de dispositivos
+DEVICE_WATCHER_BACKEND = "auto"  # "auto", "windows", "udev", "mounts" o "fake"
+DEVICE_FALLBACK_REFRESH_INTERVAL = 30000  # ms, sondeo de respaldo con notificaciones activas
+DEVICE_CACHE_TTL = 1.5  # s de validez de la instantánea de dispositivos
+DEVICE_PROBE_WORKERS = 4  # unidades sondeadas en paralelo
+DEVICE_PROBE_TIMEOUT = 1.0  # s antes de mostrar una unidad como "detectando"
+DEVICE_PROBE_RESULT_TTL = 5.0  # s durante los que se reutiliza un sondeo terminado
+
+# Detección de procesos que usan la unidad
+HANDLE_SCAN_BACKEND = "auto"  # "auto", "proc" (solo Linux) o "psutil"
+HANDLE_INDEX_TTL = 2.0  # s que se reutiliza el índice de archivos abiertos
+HANDLE_SCAN_WORKERS = 8
+HANDLE_SCAN_PROCESS_TIMEOUT = 1.0  # s máximos por proceso consultando open_files()
+HANDLE_SCAN_TIMEOUT = 10.0  # s máximos para un escaneo completo con psutil
+
+# Esperas de montaje y desmontaje
+READY_WAIT_INITIAL = 0.01  # s, primer intervalo de comprobación
+READY_WAIT_MAX_INTERVAL = 0.5  # s, intervalo máximo del backoff
+MOUNT_READY_TIMEOUT = 15  # s esperando a que la unidad vuelva a montarse
+DISMOUNT_TIMEOUT = 10  # s reintentando el desmontaje
+RETRY_BACKOFF_INITIAL = 0.25  # s de pausa tras el primer intento fallido
+RETRY_BACKOFF_MAX = 4  # s de pausa máxima entre reintentos
+
+# Métricas de cada conversión
+METRICS_DIR = "metrics"  # registros JSON por conversión
+METRICS_PROMETHEUS_FILE = "metrics/changeformatusb.prom"  # para el textfile collector de node_exporter
+
+# Planificación de la conversión
+STAGING_DIRS = []  # directorios adicionales para el backup (además de %SystemDrive%\Temp)
+DEFAULT_STAGING_THROUGHPUT = 200 * 1024 * 1024  # bytes/s en el disco de staging
+PER_FILE_OVERHEAD_SECONDS = 0.002  # coste fijo por archivo creado
+
+# Entradas de la raíz que no cuentan como datos del usuario (patrones sin distinguir mayúsculas)
+SYSTEM_ARTIFACTS = [
+    "System Volume Information",
+    "$RECYCLE.BIN",
+    "RECYCLER",
+    ".Trashes",
+    ".Trash-*",
+    ".Spotlight-V100",
+    ".fseventsd",
+    ".TemporaryItems",
+    "IndexerVolumeGuid",
+    "WPSettings.dat",
+]
+
+# Tamaño de clúster al formatear
+CLUSTER_MAX_SLACK_RATIO = 0.03  # desperdicio máximo respecto a los datos restaurados
+CLUSTER_ALLOCATION_COST = 0.00002  # s por clúster asignado al escribir
+
+# Benchmark de unidades
+BENCHMARK_FILE_SIZE = 64 * 1024 * 1024  # bytes del archivo temporal de prueba
+BENCHMARK_BLOCK_SIZE = 1024 * 1024  # bytes por operación secuencial
+BENCHMARK_RANDOM_OPS = 2000  # operaciones 4K aleatorias por prueba
+
+# Historial de rendimiento por dispositivo
+DEVICE_HISTORY_DB = "metrics/device_history.sqlite3"
+DEVICE_HISTORY_SAMPLES = 5  # mediciones recientes con las que se estima
+DEVICE_DEGRADED_RATIO = 0.5  # escritura reciente por debajo de esta fracción de la mejor
+
+# Registro
+LOG_DIR = "logs"
+LOG_FILE = "changeformatusb.log"
+LOG_LEVEL = "DEBUG"
+LOG_MAX_BYTES = 10 * 1024 * 1024  # tamaño a partir del cual rota el archivo
+LOG_BACKUP_COUNT = 5  # archivos rotados que se conservan
+LOG_RING_SIZE = 5000  # registros recientes guardados en memoria
+LOG_JSONL_FILE = "changeformatusb.jsonl"  # registro estructurado con índice para el visor
+LOG_JSONL_MAX_BYTES = 50 * 1024 * 1024
+LOG_VIEWER_PAGE_SIZE = 500  # registros que carga el visor en cada página
+
+# Cola de conversiones simultáneas
+CONVERSION_MAX_CONCURRENT = 2  # conversiones en curso a la vez; el resto espera en la cola
+STAGING_IO_SLOTS = COPY_WORKERS  # bloques en vuelo sobre el disco de staging entre todas
+
+# Clonado de un origen a varias unidades
+CLONE_WINDOW_CHUNKS = 64  # bloques leídos del origen que esperan a los destinos lentos
@@ -1,7 +1,6 @@
 import ctypes
 import sys
 import os
-import win32com.shell.shell as shell
 from logger import logger
 
 def is_admin():
@@ -14,6 +13,7 @@ def is_admin():
 def run_as_admin():
     """Relanza la aplicación con privilegios de administrador"""
     if not is_admin():
+        import win32com.shell.shell as shell
         logger.warning("Reiniciando con privilegios de administrador")
         
         # Obtener la ruta del ejecutable
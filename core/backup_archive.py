@@ -0,0 +1,275 @@
+import os
+import time
+import gzip
+import zlib
+import tarfile
+import logging
+import config
+from core.copy_engine import CopyEngine, EstadisticasCopia, CopiaCancelada, _sin_turno
+
+logger = logging.getLogger(__name__)
+
+MODO_SIN_COMPRESION = "store"
+MODO_COMPRIMIDO = "gzip"
+
+
+class _LectorContado:
+    """Envuelve un archivo de lectura, notifica los bytes leídos y calcula su CRC32"""
+    def __init__(self, archivo, callback_progreso, turno=_sin_turno):
+        self.archivo = archivo
+        self.callback_progreso = callback_progreso
+        self.turno = turno
+        self.crc = 0
+
+    def read(self, n=-1):
+        with self.turno():
+            datos = self.archivo.read(n)
+        if datos:
+            self.crc = zlib.crc32(datos, self.crc)
+            if self.callback_progreso:
+                self.callback_progreso(len(datos), 0)
+        return datos
+
+
+def medir_compresion(archivos, origen, bytes_muestra=None):
+    """Comprime una muestra de archivos y devuelve (bytes_por_segundo, ratio).
+
+    La muestra se toma repartida entre los archivos para no sesgar el
+    resultado hacia el primer directorio.
+    """
+    bytes_muestra = bytes_muestra or config.BACKUP_SAMPLE_BYTES
+    if not archivos:
+        return 0.0, 1.0
+
+    paso = max(1, len(archivos) // 64)
+    por_archivo = max(64 * 1024, bytes_muestra // min(64, len(archivos)))
+    compresor = zlib.compressobj(1)
+    leidos = 0
+    comprimidos = 0
+    duracion = 0.0
+    for relativo, _ in archivos[::paso]:
+        try:
+            with open(os.path.join(origen, relativo), 'rb') as f:
+                datos = f.read(por_archivo)
+        except OSError:
+            continue
+        inicio = time.perf_counter()
+        comprimidos += len(compresor.compress(datos))
+        duracion += time.perf_counter() - inicio
+        leidos += len(datos)
+        if leidos >= bytes_muestra:
+            break
+    inicio = time.perf_counter()
+    comprimidos += len(compresor.flush())
+    duracion += time.perf_counter() - inicio
+
+    if not leidos:
+        return 0.0, 1.0
+    return leidos / max(duracion, 1e-6), comprimidos / leidos
+
+
+def medir_escritura(directorio, bytes_muestra=None):
+    """Mide el throughput de escritura secuencial en el directorio de staging"""
+    bytes_muestra = bytes_muestra or config.BACKUP_SAMPLE_BYTES
+    ruta = os.path.join(directorio, ".medicion_escritura.tmp")
+    bloque = os.urandom(1024 * 1024)
+    try:
+        inicio = time.perf_counter()
+        with open(ruta, 'wb', buffering=0) as f:
+            escritos = 0
+            while escritos < bytes_muestra:
+                escritos += f.write(bloque)
+            os.fsync(f.fileno())
+        return escritos / max(time.perf_counter() - inicio, 1e-6)
+    except OSError as e:
+        logger.warning(f"No se pudo medir la escritura en {directorio}: {str(e)}")
+        return 0.0
+    finally:
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+
+
+def elegir_compresion(origen, archivos, directorio_staging, espacio_libre=None):
+    """Elige entre archivo sin comprimir o compresión rápida.
+
+    Compara el tiempo estimado de escribir los datos tal cual con el de
+    comprimirlos (CPU) y escribir el resultado. Si el espacio libre no
+    alcanza sin comprimir pero sí comprimido, se comprime siempre.
+    Devuelve un diccionario con el modo elegido y las mediciones.
+    """
+    total = sum(st.st_size for _, st in archivos)
+    cpu, ratio = medir_compresion(archivos, origen)
+    disco = medir_escritura(directorio_staging)
+
+    modo = MODO_SIN_COMPRESION
+    if cpu > 0 and disco > 0 and ratio < config.BACKUP_MAX_COMPRESSION_RATIO:
+        tiempo_sin = total / disco
+        tiempo_con = total / cpu + total * ratio / disco
+        if tiempo_con < tiempo_sin:
+            modo = MODO_COMPRIMIDO
+    if (espacio_libre is not None and modo == MODO_SIN_COMPRESION
+            and espacio_libre < total * 1.2 <= espacio_libre / max(ratio, 1e-6)):
+        modo = MODO_COMPRIMIDO
+
+    decision = {
+        'modo': modo,
+        'ratio': ratio if modo == MODO_COMPRIMIDO else 1.0,
+        'cpu': cpu,
+        'disco': disco,
+        'bytes': total,
+    }
+    logger.info(f"Compresión de backup: {modo} (ratio {ratio:.2f}, "
+                f"CPU {cpu / 1048576:.1f} MB/s, disco {disco / 1048576:.1f} MB/s)")
+    return decision
+
+
+class BackupArchive:
+    """Backup en un único archivo tar, opcionalmente comprimido con gzip.
+
+    El contenido se escribe y se lee en streaming: nunca existe una copia
+    descomprimida en disco y el sistema solo crea un archivo en staging.
+    """
+
+    def __init__(self, directorio, modo=MODO_SIN_COMPRESION, turno=None):
+        self.modo = modo
+        # Turno en el disco de staging por bloque (ver CopyEngine)
+        self.turno = turno or _sin_turno
+        nombre = "backup.tar.gz" if modo == MODO_COMPRIMIDO else "backup.tar"
+        self.ruta = os.path.join(directorio, nombre)
+
+    @classmethod
+    def buscar(cls, directorio, turno=None):
+        """Devuelve el archivo de backup existente en el directorio, si lo hay"""
+        for modo in (MODO_COMPRIMIDO, MODO_SIN_COMPRESION):
+            archivo = cls(directorio, modo, turno)
+            if os.path.exists(archivo.ruta):
+                return archivo
+        return None
+
+    def _abrir_escritura(self, salida):
+        if self.modo == MODO_COMPRIMIDO:
+            return gzip.GzipFile(fileobj=salida, mode='wb', compresslevel=1, mtime=0)
+        return salida
+
+    def crear(self, origen, archivos=None, directorios=None, callback_progreso=None, al_completar=None):
+        """Vuelca el contenido de origen al archivo de backup.
+
+        al_completar(relativo, st, crc) se llama tras archivar cada archivo.
+        """
+        inicio = time.monotonic()
+        stats = EstadisticasCopia()
+        if archivos is None or directorios is None:
+            directorios, archivos = CopyEngine().escanear(origen)
+
+        with open(self.ruta, 'wb', buffering=config.COPY_BUFFER_SIZE) as salida:
+            flujo = self._abrir_escritura(salida)
+            try:
+                with tarfile.open(fileobj=flujo, mode='w|', bufsize=config.COPY_BUFFER_SIZE,
+                                  format=tarfile.PAX_FORMAT) as tar:
+                    for relativo in sorted(directorios):
+                        try:
+                            tar.add(os.path.join(origen, relativo),
+                                    arcname=relativo.replace(os.sep, '/'), recursive=False)
+                            stats.directorios += 1
+                        except OSError as e:
+                            stats.errores.append((relativo, str(e)))
+
+                    for relativo, st in archivos:
+                        ruta = os.path.join(origen, relativo)
+                        try:
+                            info = tar.gettarinfo(ruta, arcname=relativo.replace(os.sep, '/'))
+                            with open(ruta, 'rb') as f:
+                                lector = _LectorContado(f, callback_progreso, self.turno)
+                                tar.addfile(info, lector)
+                        except CopiaCancelada:
+                            raise
+                        except OSError as e:
+                            logger.warning("Error archivando %s: %s", relativo, e)
+                            stats.errores.append((relativo, str(e)))
+                            continue
+                        stats.archivos += 1
+                        stats.bytes += info.size
+                        if al_completar:
+                            al_completar(relativo, st, lector.crc)
+                        if callback_progreso:
+                            callback_progreso(0, 1)
+            finally:
+                if flujo is not salida:
+                    flujo.close()
+
+        stats.duracion = time.monotonic() - inicio
+        logger.info(f"Backup archivado en {self.ruta} ({os.path.getsize(self.ruta)} bytes): {stats}")
+        return stats
+
+    def extraer(self, destino, callback_progreso=None, omitir=None, al_completar=None):
+        """Restaura el contenido del archivo de backup en destino.
+
+        omitir(relativo) permite saltar archivos ya restaurados y
+        al_completar(relativo, st, crc) verifica cada archivo escrito; si
+        devuelve False el archivo se cuenta como error.
+        """
+        inicio = time.monotonic()
+        stats = EstadisticasCopia()
+        destino_abs = os.path.abspath(destino)
+        directorios = []
+        buffer = bytearray(config.COPY_BUFFER_SIZE)
+        vista = memoryview(buffer)
+
+        with tarfile.open(self.ruta, mode='r|*', bufsize=config.COPY_BUFFER_SIZE) as tar:
+            for miembro in tar:
+                ruta = os.path.abspath(os.path.join(destino_abs, *miembro.name.split('/')))
+                if os.path.commonpath([destino_abs, ruta]) != destino_abs:
+                    logger.warning("Entrada fuera del destino ignorada: %s", miembro.name)
+                    continue
+                try:
+                    if miembro.isdir():
+                        os.makedirs(ruta, exist_ok=True)
+                        directorios.append((ruta, miembro.mtime))
+                        stats.directorios += 1
+                    elif miembro.isfile():
+                        if omitir and omitir(miembro.name):
+                            stats.omitidos += 1
+                            continue
+                        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+                        fuente = tar.extractfile(miembro)
+                        crc = 0
+                        with open(ruta, 'wb', buffering=0) as salida:
+                            while True:
+                                with self.turno():
+                                    leidos = fuente.readinto(vista)
+                                    if not leidos:
+                                        break
+                                    pendiente = vista[:leidos]
+                                    crc = zlib.crc32(pendiente, crc)
+                                    # Sin buffer, write() puede escribir menos de lo pedido
+                                    while pendiente:
+                                        escritos = salida.write(pendiente)
+                                        pendiente = pendiente[escritos:]
+                                if callback_progreso:
+                                    callback_progreso(leidos, 0)
+                        os.utime(ruta, (miembro.mtime, miembro.mtime))
+                        if not miembro.mode & 0o200:
+                            os.chmod(ruta, miembro.mode)
+                        if al_completar and al_completar(miembro.name, os.stat(ruta), crc) is False:
+                            raise OSError(f"Verificación CRC fallida en {miembro.name}")
+                        stats.archivos += 1
+                        stats.bytes += miembro.size
+                        if callback_progreso:
+                            callback_progreso(0, 1)
+                except CopiaCancelada:
+                    raise
+                except OSError as e:
+                    logger.warning("Error restaurando %s: %s", miembro.name, e)
+                    stats.errores.append((miembro.name, str(e)))
+
+        for ruta, mtime in reversed(directorios):
+            try:
+                os.utime(ruta, (mtime, mtime))
+            except OSError:
+                pass
+
+        stats.duracion = time.monotonic() - inicio
+        logger.info(f"Backup {self.ruta} restaurado en {destino}: {stats}")
+        return stats
@@ -0,0 +1,171 @@
+import os
+import mmap
+import time
+import random
+import tempfile
+import threading
+import logging
+import config
+
+logger = logging.getLogger(__name__)
+
+TAMANO_ALEATORIO = 4096
+_PREFIJO_TEMPORAL = ".changeformatusb_bench_"
+
+
+class DriveBenchmark:
+    """Mide lectura/escritura secuencial y 4K aleatoria sobre un archivo temporal.
+
+    Funciona con cualquier directorio: la raíz de una USB en Windows o un
+    directorio normal en Linux. Donde el sistema lo permite el archivo se
+    abre con O_DIRECT para no medir la caché; si no, se sincroniza tras
+    escribir y se pide al kernel que descarte la caché antes de leer.
+    """
+
+    def __init__(self, ruta, tamano=None, bloque=None, operaciones_aleatorias=None):
+        self.ruta = ruta
+        self.tamano = tamano or config.BENCHMARK_FILE_SIZE
+        self.bloque = bloque or config.BENCHMARK_BLOCK_SIZE
+        self.operaciones_aleatorias = operaciones_aleatorias or config.BENCHMARK_RANDOM_OPS
+        # El tamaño se redondea a bloques completos
+        self.tamano = max(self.bloque, self.tamano // self.bloque * self.bloque)
+        self._detener = threading.Event()
+        self.directo = False
+
+    def detener(self):
+        self._detener.set()
+
+    def _abrir(self, ruta, flags):
+        flags |= getattr(os, 'O_BINARY', 0)
+        directo = getattr(os, 'O_DIRECT', 0)
+        if directo:
+            try:
+                fd = os.open(ruta, flags | directo, 0o600)
+                self.directo = True
+                return fd
+            except OSError:
+                # tmpfs y algunos sistemas de archivos no admiten O_DIRECT
+                logger.debug(f"O_DIRECT no disponible en {self.ruta}")
+        self.directo = False
+        return os.open(ruta, flags, 0o600)
+
+    def _descartar_cache(self, fd):
+        if not self.directo and hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+    @staticmethod
+    def _escribir(fd, buffer, posicion):
+        if hasattr(os, 'pwrite'):
+            return os.pwrite(fd, buffer, posicion)
+        os.lseek(fd, posicion, os.SEEK_SET)
+        return os.write(fd, buffer)
+
+    @staticmethod
+    def _leer(fd, buffer, posicion):
+        if hasattr(os, 'preadv'):
+            return os.preadv(fd, [buffer], posicion)
+        os.lseek(fd, posicion, os.SEEK_SET)
+        datos = os.read(fd, len(buffer))
+        buffer[:len(datos)] = datos
+        return len(datos)
+
+    def _comprobar_parada(self):
+        if self._detener.is_set():
+            raise InterruptedError("Benchmark cancelado")
+
+    def ejecutar(self, callback_progreso=None):
+        """Ejecuta las cuatro pruebas y devuelve un diccionario con los resultados.
+
+        callback_progreso(nombre_prueba, fraccion) se llama entre pruebas.
+        """
+        self._detener.clear()
+        fd_temporal, ruta = tempfile.mkstemp(prefix=_PREFIJO_TEMPORAL, suffix=".tmp", dir=self.ruta)
+        os.close(fd_temporal)
+        # mmap da memoria alineada a página, como exige O_DIRECT
+        buffer = mmap.mmap(-1, self.bloque)
+        buffer.write(os.urandom(self.bloque))
+        pequeno = mmap.mmap(-1, TAMANO_ALEATORIO)
+        pequeno.write(os.urandom(TAMANO_ALEATORIO))
+        bloques = self.tamano // self.bloque
+        posiciones = [random.randrange(self.tamano // TAMANO_ALEATORIO) * TAMANO_ALEATORIO
+                      for _ in range(self.operaciones_aleatorias)]
+        resultado = {'ruta': self.ruta, 'tamano': self.tamano, 'bloque': self.bloque,
+                     'operaciones_aleatorias': self.operaciones_aleatorias,
+                     'timestamp': time.time()}
+
+        def avisar(prueba, fraccion):
+            if callback_progreso:
+                callback_progreso(prueba, fraccion)
+
+        try:
+            avisar("escritura_secuencial", 0.0)
+            fd = self._abrir(ruta, os.O_WRONLY | os.O_TRUNC)
+            try:
+                inicio = time.perf_counter()
+                for i in range(bloques):
+                    self._comprobar_parada()
+                    self._escribir(fd, buffer, i * self.bloque)
+                os.fsync(fd)
+                duracion = time.perf_counter() - inicio
+            finally:
+                os.close(fd)
+            resultado['escritura_secuencial'] = self.tamano / duracion
+
+            avisar("lectura_secuencial", 0.25)
+            fd = self._abrir(ruta, os.O_RDONLY)
+            try:
+                self._descartar_cache(fd)
+                inicio = time.perf_counter()
+                for i in range(bloques):
+                    self._comprobar_parada()
+                    self._leer(fd, buffer, i * self.bloque)
+                duracion = time.perf_counter() - inicio
+            finally:
+                os.close(fd)
+            resultado['lectura_secuencial'] = self.tamano / duracion
+
+            avisar("escritura_aleatoria", 0.5)
+            fd = self._abrir(ruta, os.O_WRONLY)
+            try:
+                inicio = time.perf_counter()
+                for posicion in posiciones:
+                    self._comprobar_parada()
+                    self._escribir(fd, pequeno, posicion)
+                os.fsync(fd)
+                duracion = time.perf_counter() - inicio
+            finally:
+                os.close(fd)
+            resultado['escritura_aleatoria_iops'] = len(posiciones) / duracion
+
+            avisar("lectura_aleatoria", 0.75)
+            random.shuffle(posiciones)
+            fd = self._abrir(ruta, os.O_RDONLY)
+            try:
+                self._descartar_cache(fd)
+                inicio = time.perf_counter()
+                for posicion in posiciones:
+                    self._comprobar_parada()
+                    self._leer(fd, pequeno, posicion)
+                duracion = time.perf_counter() - inicio
+            finally:
+                os.close(fd)
+            resultado['lectura_aleatoria_iops'] = len(posiciones) / duracion
+
+            resultado['escritura_aleatoria'] = resultado['escritura_aleatoria_iops'] * TAMANO_ALEATORIO
+            resultado['lectura_aleatoria'] = resultado['lectura_aleatoria_iops'] * TAMANO_ALEATORIO
+            resultado['directo'] = self.directo
+            avisar("completado", 1.0)
+            logger.info(f"Benchmark de {self.ruta}: "
+                        f"escritura {resultado['escritura_secuencial'] / 1048576:.1f} MB/s, "
+                        f"lectura {resultado['lectura_secuencial'] / 1048576:.1f} MB/s, "
+                        f"4K {resultado['escritura_aleatoria_iops']:.0f}/"
+                        f"{resultado['lectura_aleatoria_iops']:.0f} IOPS (escritura/lectura)"
+                        f"{'' if self.directo else ' sin O_DIRECT'}")
+            return resultado
+        finally:
+            buffer.close()
+            pequeno.close()
+            try:
+                os.remove(ruta)
+            except OSError as e:
+                logger.warning(f"No se pudo borrar el archivo de benchmark {ruta}: {str(e)}")
@@ -0,0 +1,398 @@
+import os
+import stat
+import time
+import shutil
+import threading
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from core.copy_engine import CopyEngine, CopiaCancelada
+from core.cluster_size import HistogramaTamanos, elegir_tamano_cluster
+from core.log_index import contexto_registro
+import config
+
+logger = logging.getLogger(__name__)
+
+# Lo que devuelve _FlujoCompartido.siguiente() además de los bloques
+_FIN = object()
+_DESACOPLADO = object()
+
+
+class _FlujoCompartido:
+    """Bloques leídos una vez del origen que consumen todos los destinos.
+
+    Cada destino suscrito lleva su cursor; un bloque se libera cuando lo
+    han escrito todos. Como mucho hay `ventana` bloques retenidos: si la
+    ventana se llena por un destino lento mientras otro ya lo ha escrito
+    todo y espera, el lento se desacopla y sigue leyendo el origen por su
+    cuenta, así no frena a los rápidos.
+    """
+
+    def __init__(self, ventana):
+        self.ventana = max(1, ventana)
+        self._condicion = threading.Condition()
+        self._bloques = deque()
+        self._base = 0  # número del primer bloque retenido
+        self._siguiente = 0  # número del próximo bloque a publicar
+        self._cursores = {}
+        self._cerrado = False
+
+    def suscribir(self, destino):
+        with self._condicion:
+            self._cursores[destino] = self._base
+
+    def retirar(self, destino):
+        with self._condicion:
+            self._cursores.pop(destino, None)
+            self._recortar()
+            self._condicion.notify_all()
+
+    def publicar(self, bloque):
+        """Añade un bloque; devuelve False si ya no queda ningún destino suscrito"""
+        with self._condicion:
+            while self._cursores and self._siguiente - min(self._cursores.values()) >= self.ventana:
+                if self._cerrado:
+                    return False
+                al_dia = [d for d, cursor in self._cursores.items() if cursor == self._siguiente]
+                if al_dia and len(self._cursores) > 1:
+                    lento = min(self._cursores, key=self._cursores.get)
+                    logger.info(f"{lento} va {self._siguiente - self._cursores[lento]} bloques por detrás; "
+                                f"sigue leyendo el origen por su cuenta")
+                    del self._cursores[lento]
+                    self._recortar()
+                    self._condicion.notify_all()
+                    continue
+                self._condicion.wait()
+            if not self._cursores or self._cerrado:
+                return False
+            self._bloques.append(bloque)
+            self._siguiente += 1
+            self._condicion.notify_all()
+            return True
+
+    def siguiente(self, destino):
+        """Próximo bloque del destino, _FIN al terminar o _DESACOPLADO si debe leer solo"""
+        with self._condicion:
+            while True:
+                cursor = self._cursores.get(destino)
+                if cursor is None:
+                    return _DESACOPLADO
+                if cursor < self._siguiente:
+                    bloque = self._bloques[cursor - self._base]
+                    self._cursores[destino] = cursor + 1
+                    # Libera bloques o deja al lector desacoplar a un destino lento
+                    self._recortar()
+                    self._condicion.notify_all()
+                    return bloque
+                if self._cerrado:
+                    return _FIN
+                self._condicion.wait()
+
+    def cerrar(self):
+        with self._condicion:
+            self._cerrado = True
+            self._condicion.notify_all()
+
+    def _recortar(self):
+        minimo = min(self._cursores.values(), default=self._siguiente)
+        while self._base < minimo:
+            self._bloques.popleft()
+            self._base += 1
+
+
+class _EstadoDestino:
+    def __init__(self, destino):
+        self.destino = destino
+        self.error = None
+        self.formateo = 0.0
+        self.inicio = None
+        self.fin = None
+        self.bytes = 0
+        self.archivos = 0
+        self.desacoplado = False
+        self.posicion = (0, 0)  # (índice del archivo, desplazamiento) del próximo bloque
+        self.incompletos = []  # (relativo, error) de archivos que no se pudieron leer del origen
+
+    def como_dict(self):
+        ahora = self.fin or time.monotonic()
+        duracion = ahora - self.inicio if self.inicio else 0.0
+        if self.error:
+            situacion = "error"
+        elif not self.fin:
+            situacion = "en_curso"
+        else:
+            situacion = "incompleto" if self.incompletos else "completado"
+        return {
+            'destino': self.destino,
+            'estado': situacion,
+            'error': self.error,
+            'incompletos': list(self.incompletos),
+            'bytes': self.bytes,
+            'archivos': self.archivos,
+            'segundos_formateo': round(self.formateo, 3),
+            'duracion': round(duracion, 3),
+            'throughput': self.bytes / duracion if duracion > 0 else 0.0,
+            'desacoplado': self.desacoplado,
+        }
+
+
+def formateador_unidades(nuevo_fs, cluster=None, device_watcher=None):
+    """formatear(destino, archivos) que formatea cada unidad destino con FormatConverter.
+
+    Sin cluster se elige con el histograma de los archivos del origen,
+    como en una conversión.
+    """
+    def formatear(destino, archivos):
+        # Import diferido: FormatConverter solo funciona en Windows
+        from core.format_converter import FormatConverter
+        tamano = cluster
+        if tamano is None:
+            try:
+                tamano_volumen = shutil.disk_usage(os.path.join(destino, '')).total
+            except OSError:
+                tamano_volumen = 0
+            elegido = elegir_tamano_cluster(HistogramaTamanos.desde_escaneo(archivos), nuevo_fs,
+                                            tamano_volumen)
+            tamano = elegido['cluster'] if elegido else None
+        errores = []
+        convertidor = FormatConverter(device_watcher)
+        try:
+            if not convertidor.preparar_destino(destino, nuevo_fs, errores.append, tamano):
+                raise OSError(errores[0] if errores else f"No se pudo formatear {destino}")
+        finally:
+            convertidor.cerrar()
+    return formatear
+
+
+class FanOutCloner:
+    """Copia un origen (directorio o unidad) a varios destinos leyéndolo una sola vez.
+
+    Los destinos se formatean en paralelo con formatear(destino, archivos),
+    si se indica; omitir(relativo) deja fuera archivos y directorios del
+    origen. Después un hilo lector reparte cada bloque del origen a
+    todos a través de un _FlujoCompartido y cada destino lo escribe en su
+    propio hilo. clonar() devuelve el resultado y el throughput de cada
+    destino.
+    """
+
+    def __init__(self, origen, destinos, formatear=None, ventana=None, bloque=None, omitir=None):
+        if not destinos:
+            raise ValueError("No hay destinos que clonar")
+        self.origen = origen
+        self.destinos = list(dict.fromkeys(destinos))
+        self.formatear = formatear
+        self.omitir = omitir
+        self.ventana = ventana or config.CLONE_WINDOW_CHUNKS
+        self.bloque = max(64 * 1024, bloque or config.COPY_BUFFER_SIZE)
+        self.directorios = []
+        self.archivos = []
+        self.bytes_totales = 0
+        self.errores_origen = []
+        self._estados = {destino: _EstadoDestino(destino) for destino in self.destinos}
+        self._cancelado = threading.Event()
+        self._flujo = None
+
+    def cancelar(self):
+        self._cancelado.set()
+        if self._flujo is not None:
+            self._flujo.cerrar()
+
+    def snapshot(self):
+        """Progreso de cada destino; se puede llamar desde cualquier hilo"""
+        return {
+            'origen': self.origen,
+            'bytes_totales': self.bytes_totales,
+            'archivos_totales': len(self.archivos),
+            'destinos': [estado.como_dict() for estado in self._estados.values()],
+        }
+
+    def clonar(self, callback_progreso=None):
+        """Formatea y escribe todos los destinos; devuelve la lista de resultados por destino.
+
+        callback_progreso(snapshot) se llama desde este hilo como mucho
+        PROGRESS_MAX_UPDATES_PER_SEC veces por segundo.
+        """
+        self.directorios, self.archivos = CopyEngine().escanear(self.origen)
+        if self.omitir:
+            self.directorios = [d for d in self.directorios if not self.omitir(d)]
+            self.archivos = [(r, st) for r, st in self.archivos if not self.omitir(r)]
+        self.directorios.sort()
+        self.bytes_totales = sum(st.st_size for _, st in self.archivos)
+        logger.info(f"Clonando {self.origen} ({len(self.archivos)} archivos, {self.bytes_totales} bytes) "
+                    f"a {len(self.destinos)} destinos")
+
+        if self.formatear:
+            with ThreadPoolExecutor(max_workers=len(self.destinos),
+                                    thread_name_prefix="formateo") as pool:
+                list(pool.map(self._formatear_destino, self.destinos))
+
+        listos = [d for d in self.destinos if self._estados[d].error is None]
+        self._flujo = _FlujoCompartido(self.ventana)
+        for destino in listos:
+            self._flujo.suscribir(destino)
+        if self._cancelado.is_set():
+            self._flujo.cerrar()
+
+        hilos = [threading.Thread(target=self._escribir_destino, args=(destino,),
+                                  name=f"clon-{destino}", daemon=True) for destino in listos]
+        if listos:
+            hilos.append(threading.Thread(target=self._leer_origen, name="clon-origen", daemon=True))
+        for hilo in hilos:
+            hilo.start()
+
+        intervalo = 1.0 / config.PROGRESS_MAX_UPDATES_PER_SEC
+        for hilo in hilos:
+            while hilo.is_alive():
+                hilo.join(intervalo)
+                if callback_progreso:
+                    callback_progreso(self.snapshot())
+        if callback_progreso:
+            callback_progreso(self.snapshot())
+
+        resultados = [estado.como_dict() for estado in self._estados.values()]
+        for resultado in resultados:
+            if resultado['error']:
+                logger.error(f"Clonado a {resultado['destino']} fallido: {resultado['error']}")
+            elif resultado['incompletos']:
+                logger.warning(f"Clonado a {resultado['destino']} sin {len(resultado['incompletos'])} "
+                               f"archivos que no se pudieron leer del origen")
+            else:
+                logger.info(f"Clonado a {resultado['destino']}: {resultado['bytes']} bytes en "
+                            f"{resultado['duracion']:.1f}s ({resultado['throughput'] / 1048576:.1f} MB/s"
+                            f"{', desacoplado' if resultado['desacoplado'] else ''})")
+        return resultados
+
+    def _formatear_destino(self, destino):
+        estado = self._estados[destino]
+        inicio = time.monotonic()
+        try:
+            with contexto_registro(fase="formateo", unidad=destino):
+                self.formatear(destino, self.archivos)
+        except Exception as e:
+            logger.exception(f"Error formateando {destino}")
+            estado.error = str(e)
+        estado.formateo = time.monotonic() - inicio
+
+    def _bloques(self, desde=(0, 0)):
+        """Genera (índice, desplazamiento, datos, final, error) del origen a partir de la posición dada.
+
+        Cada archivo se lee hasta el tamaño que tenía al escanearlo, así el
+        lector compartido y los destinos desacoplados ven los mismos bloques.
+        Si un archivo no se puede leer, su último bloque lleva el error y
+        viene vacío.
+        """
+        indice, desplazamiento = desde
+        for indice in range(indice, len(self.archivos)):
+            relativo, st = self.archivos[indice]
+            try:
+                with open(os.path.join(self.origen, relativo), 'rb', buffering=0) as f:
+                    f.seek(desplazamiento)
+                    while True:
+                        if self._cancelado.is_set():
+                            raise CopiaCancelada("Clonado cancelado")
+                        datos = f.read(min(self.bloque, st.st_size - desplazamiento))
+                        final = not datos or desplazamiento + len(datos) >= st.st_size
+                        yield indice, desplazamiento, datos, final, None
+                        desplazamiento += len(datos)
+                        if final:
+                            break
+            except CopiaCancelada:
+                raise
+            except OSError as e:
+                # Cada destino descarta lo que llevara escrito y lo anota en su resultado
+                logger.warning("No se pudo leer %s: %s", relativo, e)
+                if not any(r == relativo for r, _ in self.errores_origen):
+                    self.errores_origen.append((relativo, str(e)))
+                yield indice, desplazamiento, b"", True, str(e)
+            desplazamiento = 0
+
+    def _leer_origen(self):
+        try:
+            with contexto_registro(fase="copia"):
+                for bloque in self._bloques():
+                    if not self._flujo.publicar(bloque):
+                        # Todos los destinos fallaron o se desacoplaron
+                        break
+        except CopiaCancelada:
+            pass
+        except Exception:
+            logger.exception(f"Error leyendo {self.origen}")
+        finally:
+            self._flujo.cerrar()
+
+    def _escribir_destino(self, destino):
+        estado = self._estados[destino]
+        estado.inicio = time.monotonic()
+        salida = None
+        try:
+            with contexto_registro(fase="restauracion", unidad=destino):
+                for relativo in self.directorios:
+                    os.makedirs(os.path.join(destino, relativo), exist_ok=True)
+                while True:
+                    if self._cancelado.is_set():
+                        raise CopiaCancelada("Clonado cancelado")
+                    bloque = self._flujo.siguiente(destino)
+                    if bloque is _FIN:
+                        break
+                    if bloque is _DESACOPLADO:
+                        # Se sigue desde donde iba leyendo el origen directamente
+                        estado.desacoplado = True
+                        for bloque in self._bloques(estado.posicion):
+                            salida = self._escribir_bloque(destino, estado, salida, bloque)
+                        break
+                    salida = self._escribir_bloque(destino, estado, salida, bloque)
+                if self._cancelado.is_set():
+                    raise CopiaCancelada("Clonado cancelado")
+                self._fechas_directorios(destino)
+                estado.fin = time.monotonic()
+        except Exception as e:
+            if not isinstance(e, CopiaCancelada):
+                logger.exception(f"Error escribiendo {destino}")
+            estado.error = str(e)
+            estado.fin = time.monotonic()
+            self._flujo.retirar(destino)
+        finally:
+            if salida is not None:
+                salida.close()
+
+    def _escribir_bloque(self, destino, estado, salida, bloque):
+        indice, desplazamiento, datos, final, error = bloque
+        relativo, st = self.archivos[indice]
+        ruta = os.path.join(destino, relativo)
+        if error is not None:
+            # Mejor sin el archivo que con una copia truncada que parezca buena
+            if salida is not None:
+                salida.close()
+                salida = None
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+            estado.incompletos.append((relativo, error))
+            estado.posicion = (indice + 1, 0)
+            return None
+        if desplazamiento == 0 and salida is None:
+            salida = open(ruta, 'wb', buffering=0)
+        vista = memoryview(datos)
+        while vista:
+            vista = vista[salida.write(vista):]
+        estado.bytes += len(datos)
+        estado.posicion = (indice, desplazamiento + len(datos))
+        if final:
+            salida.close()
+            salida = None
+            # Como CopyEngine: fechas y bit de solo lectura
+            os.utime(ruta, ns=(st.st_atime_ns, st.st_mtime_ns))
+            if not st.st_mode & stat.S_IWRITE:
+                os.chmod(ruta, stat.S_IMODE(st.st_mode))
+            estado.archivos += 1
+            estado.posicion = (indice + 1, 0)
+        return salida
+
+    def _fechas_directorios(self, destino):
+        for relativo in reversed(self.directorios):
+            try:
+                st = os.stat(os.path.join(self.origen, relativo))
+                os.utime(os.path.join(destino, relativo), ns=(st.st_atime_ns, st.st_mtime_ns))
+            except OSError:
+                pass
@@ -0,0 +1,140 @@
+import logging
+import config
+
+logger = logging.getLogger(__name__)
+
+KB = 1024
+MB = 1024 * KB
+
+# Tamaños de unidad de asignación que acepta format para cada sistema de archivos
+TAMANOS_VALIDOS = {
+    "NTFS": [512, 1 * KB, 2 * KB, 4 * KB, 8 * KB, 16 * KB, 32 * KB, 64 * KB],
+    "FAT32": [512, 1 * KB, 2 * KB, 4 * KB, 8 * KB, 16 * KB, 32 * KB],
+    "EXFAT": [512, 1 * KB, 2 * KB, 4 * KB, 8 * KB, 16 * KB, 32 * KB, 64 * KB,
+              128 * KB, 256 * KB, 512 * KB, 1 * MB, 2 * MB, 4 * MB, 8 * MB, 16 * MB, 32 * MB],
+    "REFS": [4 * KB, 64 * KB],
+}
+
+# Número máximo de clústeres del volumen
+MAX_CLUSTERES = {
+    "NTFS": 2 ** 32 - 1,
+    "FAT32": 268435445,
+    "EXFAT": 2 ** 32 - 11,
+    "REFS": 2 ** 64,
+}
+
+# En NTFS los archivos muy pequeños caben dentro del registro de la MFT
+_RESIDENTE_NTFS = 512
+
+
+def formato_argumento(tamano):
+    """Valor para /A: tal como lo muestra la ayuda de format (4096, 64K, 1M...)"""
+    if tamano >= MB and tamano % MB == 0:
+        return f"{tamano // MB}M"
+    if tamano >= 16 * KB and tamano % KB == 0:
+        return f"{tamano // KB}K"
+    return str(tamano)
+
+
+class HistogramaTamanos:
+    """Histograma de tamaños de archivo en potencias de dos.
+
+    El cubo k agrupa los archivos de tamaño en (2^(k-1), 2^k]; como los
+    clústeres también son potencias de dos, un cubo cabe entero en un
+    clúster o lo supera entero, y el desperdicio se calcula sin guardar
+    cada tamaño.
+    """
+
+    def __init__(self):
+        self.cubos = {}  # exponente -> [archivos, bytes]
+        self.archivos = 0
+        self.bytes = 0
+
+    @classmethod
+    def desde_escaneo(cls, archivos):
+        """Construye el histograma a partir de [(relativo, stat)] del CopyEngine"""
+        histograma = cls()
+        for _, st in archivos:
+            histograma.agregar(st.st_size)
+        return histograma
+
+    def agregar(self, tamano):
+        exponente = max(0, (tamano - 1).bit_length()) if tamano > 0 else -1
+        cubo = self.cubos.setdefault(exponente, [0, 0])
+        cubo[0] += 1
+        cubo[1] += tamano
+        self.archivos += 1
+        self.bytes += tamano
+
+    def desperdicio(self, cluster, fs):
+        """Bytes perdidos por redondeo al clúster y número de clústeres ocupados"""
+        desperdicio = 0
+        clusteres = 0
+        for exponente, (cantidad, total) in self.cubos.items():
+            if exponente < 0:
+                continue  # archivos vacíos: sin clústeres
+            superior = 2 ** exponente
+            if fs == "NTFS" and superior <= _RESIDENTE_NTFS:
+                continue
+            if superior <= cluster:
+                # Cada archivo ocupa exactamente un clúster
+                desperdicio += cantidad * cluster - total
+                clusteres += cantidad
+            else:
+                # En media se pierde medio clúster por archivo
+                desperdicio += cantidad * cluster // 2
+                clusteres += (total + cantidad * cluster // 2) // cluster
+        return desperdicio, clusteres
+
+    def como_dict(self):
+        return {str(2 ** e if e >= 0 else 0): {'archivos': c, 'bytes': b}
+                for e, (c, b) in sorted(self.cubos.items())}
+
+
+def evaluar(histograma, fs, cluster, throughput_escritura=None):
+    """Proyección de espacio y tiempo de escritura con un tamaño de clúster"""
+    throughput = throughput_escritura or config.DEFAULT_WRITE_THROUGHPUT
+    desperdicio, clusteres = histograma.desperdicio(cluster, fs)
+    segundos = histograma.bytes / throughput + clusteres * config.CLUSTER_ALLOCATION_COST
+    return {
+        'cluster': cluster,
+        'argumento': formato_argumento(cluster),
+        'desperdicio': desperdicio,
+        'espacio': histograma.bytes + desperdicio,
+        'clusteres': clusteres,
+        'segundos_escritura': segundos,
+    }
+
+
+def elegir_tamano_cluster(histograma, fs, tamano_volumen, throughput_escritura=None):
+    """Elige el clúster que minimiza el tiempo de escritura sin desperdiciar demasiado.
+
+    Los candidatos son los tamaños válidos para fs que dejan el volumen por
+    debajo del máximo de clústeres y cuyo desperdicio no supera
+    CLUSTER_MAX_SLACK_RATIO de los datos a restaurar. Devuelve el dict de
+    evaluar() del elegido, o None si no hay datos en los que basarse (se
+    usa el valor por defecto de format).
+    """
+    fs = fs.upper()
+    tamanos = TAMANOS_VALIDOS.get(fs)
+    if not tamanos or not histograma.archivos:
+        return None
+
+    limite_desperdicio = histograma.bytes * config.CLUSTER_MAX_SLACK_RATIO
+    candidatos = []
+    for cluster in tamanos:
+        if tamano_volumen and tamano_volumen / cluster > MAX_CLUSTERES[fs]:
+            continue
+        evaluacion = evaluar(histograma, fs, cluster, throughput_escritura)
+        if tamano_volumen and evaluacion['espacio'] > tamano_volumen:
+            continue
+        candidatos.append(evaluacion)
+    if not candidatos:
+        return None
+
+    aceptables = [c for c in candidatos if c['desperdicio'] <= limite_desperdicio] or \
+        [min(candidatos, key=lambda c: c['desperdicio'])]
+    elegido = min(aceptables, key=lambda c: (c['segundos_escritura'], c['desperdicio']))
+    logger.info(f"Clúster elegido para {fs}: {elegido['argumento']} "
+                f"(desperdicio {elegido['desperdicio']} bytes, {elegido['clusteres']} clústeres)")
+    return elegido
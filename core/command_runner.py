@@ -0,0 +1,231 @@
+import re
+import sys
+import time
+import locale
+import threading
+import subprocess
+import logging
+
+logger = logging.getLogger(__name__)
+
+# "10 percent completed", "10 por ciento completado", "10%"...
+_PATRON_PORCENTAJE = re.compile(
+    r'(\d{1,3}(?:[.,]\d+)?)\s*(?:%|percent|por ciento|pour cent|prozent|per cento)',
+    re.IGNORECASE)
+
+# format y convert reescriben la línea de progreso con \r
+_SEPARADORES = re.compile(r'[\r\n]+')
+
+
+def parsear_porcentaje(linea):
+    """Porcentaje (0-100) que aparece en una línea de salida, o None"""
+    coincidencia = _PATRON_PORCENTAJE.search(linea)
+    if not coincidencia:
+        return None
+    valor = float(coincidencia.group(1).replace(',', '.'))
+    return valor if 0 <= valor <= 100 else None
+
+
+def _codificacion_consola():
+    # Las herramientas de consola de Windows escriben en la página OEM
+    return "oem" if sys.platform == "win32" else locale.getpreferredencoding(False)
+
+
+class ResultadoComando:
+    """Salida y estado final de un comando"""
+
+    def __init__(self, args):
+        self.args = list(args)
+        self.codigo = None
+        self.salida = []
+        self.errores = []
+        self.duracion = 0.0
+        self.timeout = False
+        self.cancelado = False
+
+    @property
+    def exito(self):
+        return self.codigo == 0 and not self.timeout and not self.cancelado
+
+    def texto_error(self):
+        """Mensaje de error legible con lo último que escribió el comando"""
+        if self.timeout:
+            return "Tiempo de espera agotado"
+        lineas = self.errores or self.salida
+        detalle = "\n".join(lineas[-5:]).strip()
+        return detalle or f"Código de error: {self.codigo}"
+
+    def __repr__(self):
+        return (f"ResultadoComando(args={self.args!r}, codigo={self.codigo}, "
+                f"duracion={self.duracion:.2f}s, timeout={self.timeout})")
+
+
+class CommandRunner:
+    """Ejecuta comandos externos leyendo su salida a medida que se produce.
+
+    Lanza el programa directamente (sin .bat ni shell intermedio), envía
+    la entrada indicada por stdin, procesa stdout y stderr línea a línea
+    en hilos propios, convierte las líneas con porcentaje en llamadas a
+    al_progreso(porcentaje) y mata el proceso en cuanto vence el timeout.
+    """
+
+    def __init__(self):
+        self.proceso = None
+        self._cancelado = False
+
+    def ejecutar(self, args, timeout, entrada=None, al_progreso=None, al_linea=None):
+        resultado = ResultadoComando(args)
+        self._cancelado = False
+        inicio = time.monotonic()
+        opciones = {}
+        if sys.platform == "win32":
+            opciones['creationflags'] = subprocess.CREATE_NO_WINDOW
+
+        logger.debug("Ejecutando: %s", args)
+        self.proceso = subprocess.Popen(
+            list(args),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            **opciones
+        )
+        lectores = [
+            threading.Thread(target=self._leer, daemon=True,
+                             args=(self.proceso.stdout, resultado.salida, al_progreso, al_linea)),
+            threading.Thread(target=self._leer, daemon=True,
+                             args=(self.proceso.stderr, resultado.errores, None, al_linea)),
+        ]
+        for lector in lectores:
+            lector.start()
+
+        try:
+            if entrada:
+                self.proceso.stdin.write(entrada.encode(_codificacion_consola()))
+            self.proceso.stdin.close()
+        except OSError:
+            # El proceso pudo terminar sin leer la entrada
+            pass
+
+        try:
+            resultado.codigo = self.proceso.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            logger.error(f"Tiempo agotado ({timeout}s) ejecutando {args[0]}; se termina el proceso")
+            resultado.timeout = True
+            self.proceso.kill()
+            resultado.codigo = self.proceso.wait()
+        finally:
+            for lector in lectores:
+                lector.join(timeout=5)
+            resultado.cancelado = self._cancelado
+            resultado.duracion = time.monotonic() - inicio
+            self.proceso = None
+        return resultado
+
+    def _leer(self, flujo, lineas, al_progreso, al_linea):
+        """Lee un flujo en bloques y separa líneas por \\r o \\n"""
+        codificacion = _codificacion_consola()
+        pendiente = ""
+        while True:
+            bloque = flujo.read1(4096) if hasattr(flujo, 'read1') else flujo.read(4096)
+            if not bloque:
+                break
+            pendiente += bloque.decode(codificacion, errors='replace')
+            partes = _SEPARADORES.split(pendiente)
+            pendiente = partes.pop()
+            for linea in partes:
+                self._procesar_linea(linea, lineas, al_progreso, al_linea)
+        if pendiente:
+            self._procesar_linea(pendiente, lineas, al_progreso, al_linea)
+        flujo.close()
+
+    @staticmethod
+    def _procesar_linea(linea, lineas, al_progreso, al_linea):
+        linea = linea.strip()
+        if not linea:
+            return
+        lineas.append(linea)
+        if al_linea:
+            al_linea(linea)
+        if al_progreso:
+            porcentaje = parsear_porcentaje(linea)
+            if porcentaje is not None:
+                al_progreso(porcentaje)
+
+    def cancelar(self):
+        """Termina el comando en curso, si lo hay"""
+        proceso = self.proceso
+        if proceso and proceso.poll() is None:
+            self._cancelado = True
+            proceso.kill()
+
+
+class ComandoFalso:
+    """Guion de un comando simulado: líneas con su retardo y código de salida.
+
+    lineas es una lista de (segundos_de_espera, texto, es_error).
+    """
+
+    def __init__(self, lineas=(), codigo=0, al_ejecutar=None):
+        self.lineas = [linea if len(linea) == 3 else (*linea, False) for linea in lineas]
+        self.codigo = codigo
+        self.al_ejecutar = al_ejecutar
+
+    @classmethod
+    def con_progreso(cls, duracion, pasos=10, codigo=0, plantilla="{p} percent completed.",
+                     al_ejecutar=None):
+        """Comando que informa de su avance en `pasos` saltos repartidos en `duracion` segundos"""
+        retardo = duracion / pasos if pasos else 0
+        lineas = [(retardo, plantilla.format(p=(i + 1) * 100 // pasos)) for i in range(pasos)]
+        return cls(lineas, codigo, al_ejecutar)
+
+
+class FakeCommandRunner(CommandRunner):
+    """Ejecutor guionizado para probar y cronometrar el flujo completo sin Windows.
+
+    guiones asocia el nombre del programa (p. ej. "format.com") con un
+    ComandoFalso; al_ejecutar del guion permite simular efectos, como
+    vaciar el directorio que hace de unidad al "formatear".
+    """
+
+    def __init__(self, guiones=None):
+        super().__init__()
+        self.guiones = dict(guiones or {})
+        self.ejecutados = []
+        self._detener = threading.Event()
+
+    def ejecutar(self, args, timeout, entrada=None, al_progreso=None, al_linea=None):
+        resultado = ResultadoComando(args)
+        self.ejecutados.append((list(args), entrada))
+        self._detener.clear()
+        self._cancelado = False
+        inicio = time.monotonic()
+        guion = self.guiones.get(args[0])
+        if guion is None:
+            resultado.codigo = 1
+            resultado.errores.append(f"Comando sin guion: {args[0]}")
+            return resultado
+
+        for retardo, texto, es_error in guion.lineas:
+            restante = timeout - (time.monotonic() - inicio)
+            if retardo > restante:
+                self._detener.wait(max(0.0, restante))
+                resultado.timeout = True
+                break
+            if self._detener.wait(retardo):
+                break
+            self._procesar_linea(texto, resultado.errores if es_error else resultado.salida,
+                                 None if es_error else al_progreso, al_linea)
+
+        if not resultado.timeout and not self._cancelado:
+            if guion.al_ejecutar:
+                guion.al_ejecutar(args)
+            resultado.codigo = guion.codigo
+        else:
+            resultado.codigo = -9
+        resultado.cancelado = self._cancelado
+        resultado.duracion = time.monotonic() - inicio
+        return resultado
+
+    def cancelar(self):
+        self._cancelado = True
+        self._detener.set()
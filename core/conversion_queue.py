@@ -0,0 +1,363 @@
+import os
+import time
+import itertools
+import threading
+import logging
+from collections import deque, defaultdict
+from contextlib import contextmanager
+from functools import partial
+from core.copy_engine import CopiaCancelada
+from utils.progress_bus import ProgressBus
+import config
+
+logger = logging.getLogger(__name__)
+
+# Estados de un trabajo de la cola
+EN_COLA = "en_cola"
+EN_CURSO = "en_curso"
+COMPLETADO = "completado"
+ERROR = "error"
+CANCELADO = "cancelado"
+ESTADOS_ACTIVOS = (EN_COLA, EN_CURSO)
+
+
+class StagingScheduler:
+    """Reparte el disco de staging entre las conversiones en curso.
+
+    Cada bloque que se lee o escribe en staging pide un turno; como mucho
+    hay `ranuras` bloques en vuelo entre todas las conversiones y, cuando
+    hay que esperar, los turnos se conceden por rondas entre trabajos. Así
+    una conversión con muchos hilos de copia no deja sin disco a las demás.
+    """
+
+    def __init__(self, ranuras=None):
+        self.ranuras = max(1, ranuras or config.STAGING_IO_SLOTS)
+        self._condicion = threading.Condition()
+        self._ocupadas = 0
+        self._ronda = deque()  # trabajos con peticiones pendientes, en orden de turno
+        self._esperando = defaultdict(int)
+        self._cancelados = set()
+        self._turnos = defaultdict(int)
+        self._espera = defaultdict(float)
+
+    @contextmanager
+    def turno(self, trabajo):
+        """Ocupa una ranura durante el bloque; lanza CopiaCancelada si el trabajo se cancela"""
+        self._entrar(trabajo)
+        try:
+            yield
+        finally:
+            with self._condicion:
+                self._ocupadas -= 1
+                self._condicion.notify_all()
+
+    def _entrar(self, trabajo):
+        inicio = time.monotonic()
+        with self._condicion:
+            if trabajo not in self._esperando:
+                self._ronda.append(trabajo)
+            self._esperando[trabajo] += 1
+            try:
+                while True:
+                    if trabajo in self._cancelados:
+                        raise CopiaCancelada(f"Trabajo {trabajo} cancelado")
+                    if self._ocupadas < self.ranuras and self._ronda[0] == trabajo:
+                        break
+                    self._condicion.wait()
+            except BaseException:
+                self._retirar(trabajo)
+                raise
+            self._ocupadas += 1
+            self._ronda.popleft()
+            self._esperando[trabajo] -= 1
+            if self._esperando[trabajo]:
+                # Le quedan peticiones: vuelve al final de la ronda
+                self._ronda.append(trabajo)
+            else:
+                del self._esperando[trabajo]
+            self._turnos[trabajo] += 1
+            self._espera[trabajo] += time.monotonic() - inicio
+            self._condicion.notify_all()
+
+    def _retirar(self, trabajo):
+        self._esperando[trabajo] -= 1
+        if not self._esperando[trabajo]:
+            del self._esperando[trabajo]
+            self._ronda.remove(trabajo)
+        self._condicion.notify_all()
+
+    def cancelar(self, trabajo):
+        """Despierta las peticiones del trabajo y hace fallar las siguientes"""
+        with self._condicion:
+            self._cancelados.add(trabajo)
+            self._condicion.notify_all()
+
+    def olvidar(self, trabajo):
+        """Descarta el estado del trabajo y devuelve (turnos concedidos, segundos esperando)"""
+        with self._condicion:
+            self._cancelados.discard(trabajo)
+            return self._turnos.pop(trabajo, 0), self._espera.pop(trabajo, 0.0)
+
+    def estadisticas(self):
+        """Turnos concedidos y segundos de espera de cada trabajo activo"""
+        with self._condicion:
+            return {trabajo: {'turnos': self._turnos[trabajo], 'espera': self._espera[trabajo]}
+                    for trabajo in self._turnos}
+
+
+class ConversionJob:
+    """Una conversión pedida a la cola y su estado"""
+
+    def __init__(self, id_trabajo, unidad, nuevo_fs, plan=None, tamano_cluster=None):
+        self.id = id_trabajo
+        self.unidad = unidad
+        self.nuevo_fs = nuevo_fs
+        self.plan = plan
+        self.tamano_cluster = tamano_cluster
+        self.estado = EN_COLA
+        self.mensaje = None  # error, o la unidad convertida
+        self.creado = time.time()
+        self.inicio = None
+        self.fin = None
+        self.turnos_staging = 0
+        self.espera_staging = 0.0
+        self.cancelado = False
+        self.convertidor = None
+        # El último estado de ProgressTracker; la interfaz lo recoge a su ritmo
+        self.progreso = ProgressBus()
+
+    @property
+    def activo(self):
+        return self.estado in ESTADOS_ACTIVOS
+
+    def como_dict(self):
+        return {
+            'id': self.id,
+            'unidad': self.unidad,
+            'nuevo_fs': self.nuevo_fs,
+            'estado': self.estado,
+            'mensaje': self.mensaje,
+            'creado': self.creado,
+            'inicio': self.inicio,
+            'fin': self.fin,
+            'turnos_staging': self.turnos_staging,
+            'espera_staging': round(self.espera_staging, 3),
+            'progreso': self.progreso.ultimo(),
+        }
+
+
+def clave_unidad(unidad):
+    """Identifica la unidad de un trabajo: la letra o el directorio de una unidad simulada"""
+    return os.path.normcase(unidad.rstrip("\\/") or unidad)
+
+
+def _convertidor_real(turno):
+    # Import diferido: FormatConverter solo funciona en Windows
+    from core.format_converter import FormatConverter
+    return FormatConverter(turno=turno)
+
+
+class ConversionQueue:
+    """Cola de conversiones con varias unidades a la vez.
+
+    Como mucho max_concurrentes trabajos están en curso, cada uno en su
+    hilo y con su propio convertidor; los demás esperan en orden de
+    llegada. El disco de staging se reparte con un StagingScheduler.
+
+    fabrica_convertidor(turno) devuelve un objeto con convertir(),
+    cancelar_conversion(), cerrar() y el atributo progreso (el
+    ProgressTracker en curso) como FormatConverter; con un
+    FormatConverter sobre core.fake_drive.VolumenesSimulados la cola
+    funciona sobre directorios. al_cambiar(trabajo) se llama desde cualquier hilo
+    cada vez que un trabajo cambia de estado.
+    """
+
+    def __init__(self, max_concurrentes=None, fabrica_convertidor=None, al_cambiar=None,
+                 ranuras_staging=None):
+        self.max_concurrentes = max(1, max_concurrentes or config.CONVERSION_MAX_CONCURRENT)
+        self.staging = StagingScheduler(ranuras_staging)
+        self.fabrica_convertidor = fabrica_convertidor or _convertidor_real
+        self.al_cambiar = al_cambiar
+        self._lock = threading.Lock()
+        self._cambio = threading.Condition(self._lock)
+        self._ids = itertools.count(1)
+        self._trabajos = {}  # por id, en orden de llegada
+        self._pendientes = deque()
+        self._en_curso = 0
+        self._detenida = False
+
+    def encolar(self, unidad, nuevo_fs, plan=None, tamano_cluster=None):
+        """Añade una conversión y devuelve su trabajo.
+
+        Lanza ValueError si la unidad ya tiene una conversión pendiente o en curso.
+        """
+        with self._lock:
+            if self._detenida:
+                raise RuntimeError("La cola de conversiones está detenida")
+            existente = self._trabajo_de_unidad(unidad)
+            if existente is not None:
+                raise ValueError(f"La unidad {unidad} ya tiene una conversión {existente.estado}")
+            trabajo = ConversionJob(next(self._ids), unidad, nuevo_fs, plan, tamano_cluster)
+            self._trabajos[trabajo.id] = trabajo
+            self._pendientes.append(trabajo)
+            iniciados = self._despachar()
+        logger.info(f"Conversión {trabajo.id} encolada: {unidad} -> {nuevo_fs}")
+        self._avisar(trabajo)
+        for iniciado in iniciados:
+            self._avisar(iniciado)
+        return trabajo
+
+    def _despachar(self):
+        """Arranca trabajos mientras haya hueco; se llama con el lock tomado"""
+        iniciados = []
+        while self._pendientes and self._en_curso < self.max_concurrentes and not self._detenida:
+            trabajo = self._pendientes.popleft()
+            trabajo.estado = EN_CURSO
+            trabajo.inicio = time.time()
+            self._en_curso += 1
+            threading.Thread(target=self._ejecutar, args=(trabajo,),
+                             name=f"conversion-{trabajo.id}", daemon=True).start()
+            iniciados.append(trabajo)
+        return iniciados
+
+    def _ejecutar(self, trabajo):
+        resultado = {}
+
+        def exito(unidad):
+            resultado['exito'] = True
+
+        def error(mensaje):
+            resultado.setdefault('error', mensaje)
+
+        def progreso(estado):
+            trabajo.progreso.publicar(estado, estado.get('transcurrido'))
+
+        convertidor = None
+        try:
+            convertidor = self.fabrica_convertidor(partial(self.staging.turno, trabajo.id))
+            with self._lock:
+                trabajo.convertidor = convertidor
+                cancelado = trabajo.cancelado
+            # Los bytes copiados se muestrean al leer el progreso, no por bloque
+            trabajo.progreso.fuente = lambda: convertidor.progreso
+            if not cancelado:
+                convertidor.convertir(trabajo.unidad, trabajo.nuevo_fs, exito, error, progreso,
+                                      plan=trabajo.plan, tamano_cluster=trabajo.tamano_cluster)
+        except Exception as e:
+            logger.exception(f"Error en la conversión {trabajo.id} de {trabajo.unidad}")
+            resultado.setdefault('error', str(e))
+        finally:
+            if convertidor is not None:
+                try:
+                    convertidor.cerrar()
+                except Exception as e:
+                    logger.warning(f"Error cerrando el convertidor de {trabajo.unidad}: {str(e)}")
+            trabajo.progreso.cerrar()
+            self._terminar(trabajo, resultado)
+
+    def _terminar(self, trabajo, resultado):
+        turnos, espera = self.staging.olvidar(trabajo.id)
+        with self._lock:
+            trabajo.turnos_staging = turnos
+            trabajo.espera_staging = espera
+            trabajo.fin = time.time()
+            trabajo.convertidor = None
+            if trabajo.cancelado:
+                trabajo.estado = CANCELADO
+            elif resultado.get('exito') and 'error' not in resultado:
+                trabajo.estado = COMPLETADO
+                trabajo.mensaje = trabajo.unidad
+            else:
+                trabajo.estado = ERROR
+                trabajo.mensaje = resultado.get('error') or "La conversión terminó sin resultado"
+            self._en_curso -= 1
+            iniciados = self._despachar()
+            self._cambio.notify_all()
+        logger.info(f"Conversión {trabajo.id} de {trabajo.unidad}: {trabajo.estado} "
+                    f"en {trabajo.fin - trabajo.inicio:.1f} s "
+                    f"({turnos} turnos de staging, {espera:.1f} s esperando)")
+        self._avisar(trabajo)
+        for iniciado in iniciados:
+            self._avisar(iniciado)
+
+    def cancelar(self, id_trabajo):
+        """Cancela un trabajo pendiente o en curso; devuelve False si ya había terminado"""
+        with self._lock:
+            trabajo = self._trabajos.get(id_trabajo)
+            if trabajo is None or not trabajo.activo or trabajo.cancelado:
+                return False
+            trabajo.cancelado = True
+            en_curso = trabajo.estado == EN_CURSO
+            if not en_curso:
+                self._pendientes.remove(trabajo)
+                trabajo.estado = CANCELADO
+                trabajo.fin = time.time()
+                self._cambio.notify_all()
+                convertidor = None
+            else:
+                convertidor = trabajo.convertidor
+        logger.info(f"Cancelando la conversión {id_trabajo} de {trabajo.unidad}")
+        if en_curso:
+            # Las copias que esperan turno en staging fallan en el acto
+            self.staging.cancelar(id_trabajo)
+            if convertidor is not None:
+                convertidor.cancelar_conversion()
+        else:
+            self._avisar(trabajo)
+        return True
+
+    def _trabajo_de_unidad(self, unidad):
+        clave = clave_unidad(unidad)
+        for trabajo in self._trabajos.values():
+            if trabajo.activo and clave_unidad(trabajo.unidad) == clave:
+                return trabajo
+        return None
+
+    def trabajo_de_unidad(self, unidad):
+        """Trabajo pendiente o en curso de la unidad, o None"""
+        with self._lock:
+            return self._trabajo_de_unidad(unidad)
+
+    def trabajo(self, id_trabajo):
+        with self._lock:
+            return self._trabajos.get(id_trabajo)
+
+    def trabajos(self):
+        """Todos los trabajos, en orden de llegada"""
+        with self._lock:
+            return list(self._trabajos.values())
+
+    def activos(self):
+        with self._lock:
+            return [trabajo for trabajo in self._trabajos.values() if trabajo.activo]
+
+    def retirar_terminados(self):
+        """Olvida los trabajos terminados y devuelve cuántos había"""
+        with self._lock:
+            terminados = [id_trabajo for id_trabajo, trabajo in self._trabajos.items()
+                          if not trabajo.activo]
+            for id_trabajo in terminados:
+                del self._trabajos[id_trabajo]
+            return len(terminados)
+
+    def esperar(self, timeout=None):
+        """Espera a que no quede nada pendiente ni en curso; devuelve False si vence el timeout"""
+        with self._lock:
+            return self._cambio.wait_for(
+                lambda: not self._pendientes and self._en_curso == 0, timeout)
+
+    def detener(self, timeout=None):
+        """Deja de aceptar trabajos, cancela los activos y espera a que terminen"""
+        with self._lock:
+            self._detenida = True
+            activos = [trabajo.id for trabajo in self._trabajos.values() if trabajo.activo]
+        for id_trabajo in activos:
+            self.cancelar(id_trabajo)
+        return self.esperar(timeout)
+
+    def _avisar(self, trabajo):
+        if self.al_cambiar:
+            try:
+                self.al_cambiar(trabajo)
+            except Exception as e:
+                logger.warning(f"Error notificando el cambio de la conversión {trabajo.id}: {str(e)}")
@@ -0,0 +1,225 @@
+import os
+import stat
+import zlib
+import time
+import threading
+import logging
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, CancelledError, as_completed
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class CopiaCancelada(OSError):
+    """La copia se detuvo a petición del usuario"""
+
+
+def _sin_turno():
+    return nullcontext()
+
+
+class EstadisticasCopia:
+    """Resultado de una copia de árbol de directorios"""
+    def __init__(self):
+        self.archivos = 0
+        self.bytes = 0
+        self.directorios = 0
+        self.omitidos = 0
+        self.errores = []
+        self.duracion = 0.0
+
+    @property
+    def exito(self):
+        return not self.errores
+
+    @property
+    def throughput(self):
+        """Bytes por segundo de la copia completa"""
+        if self.duracion <= 0:
+            return 0.0
+        return self.bytes / self.duracion
+
+    def __repr__(self):
+        return (f"EstadisticasCopia(archivos={self.archivos}, bytes={self.bytes}, "
+                f"errores={len(self.errores)}, duracion={self.duracion:.2f}s)")
+
+
+class CopyEngine:
+    """Motor de copia en proceso basado en un pool de hilos.
+
+    Recorre el origen una sola vez, crea todos los directorios antes de
+    empezar a escribir archivos y reparte los archivos entre varios hilos
+    que reutilizan un buffer grande por hilo. Funciona sobre cualquier
+    par de directorios, no solo sobre unidades USB.
+
+    turno() devuelve un context manager que envuelve cada bloque leído y
+    escrito; la cola de conversiones lo usa para repartir el disco de
+    staging entre varias conversiones a la vez.
+    """
+
+    def __init__(self, workers=None, buffer_size=None, turno=None):
+        self.workers = max(1, workers or config.COPY_WORKERS)
+        self.buffer_size = max(64 * 1024, buffer_size or config.COPY_BUFFER_SIZE)
+        self.turno = turno or _sin_turno
+        self._local = threading.local()
+        self._cancelado = threading.Event()
+
+    def cancelar(self):
+        """Hace fallar con CopiaCancelada los bloques pendientes de todas las copias"""
+        self._cancelado.set()
+
+    @property
+    def cancelado(self):
+        return self._cancelado.is_set()
+
+    def _buffer(self):
+        """Devuelve el buffer reutilizable del hilo actual"""
+        vista = getattr(self._local, 'vista', None)
+        if vista is None:
+            vista = memoryview(bytearray(self.buffer_size))
+            self._local.vista = vista
+        return vista
+
+    def escanear(self, origen):
+        """Recorre el origen y devuelve (directorios, archivos).
+
+        Los directorios son rutas relativas; los archivos son tuplas
+        (ruta_relativa, stat_result). Se usa os.scandir para aprovechar
+        la información de stat que el sistema entrega con el listado.
+        """
+        directorios = []
+        archivos = []
+        pendientes = ['']
+        while pendientes:
+            relativo = pendientes.pop()
+            actual = os.path.join(origen, relativo) if relativo else origen
+            try:
+                with os.scandir(actual) as entradas:
+                    for entrada in entradas:
+                        ruta_rel = os.path.join(relativo, entrada.name) if relativo else entrada.name
+                        try:
+                            if entrada.is_dir(follow_symlinks=False):
+                                directorios.append(ruta_rel)
+                                pendientes.append(ruta_rel)
+                            elif entrada.is_file(follow_symlinks=False):
+                                archivos.append((ruta_rel, entrada.stat(follow_symlinks=False)))
+                        except OSError as e:
+                            logger.warning("No se pudo leer %s: %s", entrada.path, e)
+            except OSError as e:
+                # Directorios de sistema protegidos (p.ej. System Volume Information)
+                logger.warning("No se pudo listar %s: %s", actual, e)
+        return directorios, archivos
+
+    def copiar_arbol(self, origen, destino, callback_progreso=None, omitir=None, al_completar=None,
+                     escaneo=None):
+        """Copia el contenido de origen dentro de destino.
+
+        callback_progreso(bytes, archivos) se invoca desde los hilos de copia
+        con incrementos: bytes por cada bloque escrito y archivos=1 al
+        terminar cada archivo.
+        omitir(relativo, st) permite saltar archivos ya copiados.
+        al_completar(relativo, st, crc) recibe el CRC32 de cada archivo
+        copiado; si devuelve False el archivo se cuenta como error.
+        escaneo permite pasar el resultado de escanear() si ya se hizo.
+        """
+        inicio = time.monotonic()
+        stats = EstadisticasCopia()
+
+        directorios, archivos = escaneo or self.escanear(origen)
+        logger.debug("Escaneo de %s: %d directorios, %d archivos", origen, len(directorios), len(archivos))
+
+        # Crear la estructura completa antes de empezar a escribir datos
+        os.makedirs(destino, exist_ok=True)
+        for relativo in sorted(directorios):
+            try:
+                os.makedirs(os.path.join(destino, relativo), exist_ok=True)
+                stats.directorios += 1
+            except OSError as e:
+                stats.errores.append((relativo, str(e)))
+
+        lock = threading.Lock()
+
+        if omitir:
+            pendientes = [(rel, st) for rel, st in archivos if not omitir(rel, st)]
+            stats.omitidos = len(archivos) - len(pendientes)
+            if stats.omitidos:
+                logger.info("Omitiendo %d archivos ya procesados", stats.omitidos)
+            archivos = pendientes
+
+        def copiar(relativo, st):
+            copiados, crc = self._copiar_archivo(
+                os.path.join(origen, relativo),
+                os.path.join(destino, relativo),
+                st,
+                callback_progreso,
+                al_completar is not None
+            )
+            if al_completar and al_completar(relativo, st, crc) is False:
+                raise OSError(f"Verificación CRC fallida en {relativo}")
+            with lock:
+                stats.archivos += 1
+                stats.bytes += copiados
+            if callback_progreso:
+                callback_progreso(0, 1)
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="copia") as pool:
+            futuros = {pool.submit(copiar, rel, st): rel for rel, st in archivos}
+            for futuro in as_completed(futuros):
+                try:
+                    futuro.result()
+                except (CopiaCancelada, CancelledError):
+                    # No se registra un error por cada archivo pendiente
+                    for pendiente in futuros:
+                        pendiente.cancel()
+                except OSError as e:
+                    relativo = futuros[futuro]
+                    logger.warning("Error copiando %s: %s", relativo, e)
+                    stats.errores.append((relativo, str(e)))
+        if self._cancelado.is_set():
+            raise CopiaCancelada(f"Copia {origen} -> {destino} cancelada")
+
+        # Fechas de directorios al final, de más profundo a menos (como /DCOPY:T)
+        for relativo in sorted(directorios, reverse=True):
+            try:
+                st = os.stat(os.path.join(origen, relativo))
+                os.utime(os.path.join(destino, relativo), ns=(st.st_atime_ns, st.st_mtime_ns))
+            except OSError:
+                pass
+
+        stats.duracion = time.monotonic() - inicio
+        logger.info("Copia %s -> %s terminada: %s", origen, destino, stats)
+        return stats
+
+    def _copiar_archivo(self, ruta_origen, ruta_destino, st, callback_progreso=None, checksum=False):
+        """Copia un archivo con el buffer del hilo y conserva fechas y atributos.
+
+        Devuelve (bytes_copiados, crc32); el CRC solo se calcula si se pide.
+        """
+        vista = self._buffer()
+        copiados = 0
+        crc = 0
+        with open(ruta_origen, 'rb', buffering=0) as fuente, \
+                open(ruta_destino, 'wb', buffering=0) as salida:
+            while True:
+                if self._cancelado.is_set():
+                    raise CopiaCancelada(f"Copia cancelada: {ruta_origen}")
+                with self.turno():
+                    leidos = fuente.readinto(vista)
+                    if not leidos:
+                        break
+                    pendiente = vista[:leidos]
+                    if checksum:
+                        crc = zlib.crc32(pendiente, crc)
+                    while pendiente:
+                        escritos = salida.write(pendiente)
+                        pendiente = pendiente[escritos:]
+                copiados += leidos
+                if callback_progreso:
+                    callback_progreso(leidos, 0)
+
+        # Equivalente a /COPY:DAT: fechas y bit de solo lectura
+        os.utime(ruta_destino, ns=(st.st_atime_ns, st.st_mtime_ns))
+        if not st.st_mode & stat.S_IWRITE:
+            os.chmod(ruta_destino, stat.S_IMODE(st.st_mode))
+        return copiados, crc if checksum else None
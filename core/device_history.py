@@ -0,0 +1,311 @@
+import os
+import sys
+import time
+import sqlite3
+import threading
+import statistics
+import logging
+import config
+
+logger = logging.getLogger(__name__)
+
+# Operaciones medidas: throughputs en bytes/s salvo el formateo (segundos)
+OP_COPIA = "copia"
+OP_RESTAURACION = "restauracion"
+OP_FORMATEO = "formateo"
+OP_LECTURA_SECUENCIAL = "lectura_secuencial"
+OP_ESCRITURA_SECUENCIAL = "escritura_secuencial"
+OP_LECTURA_4K = "lectura_4k"  # IOPS
+OP_ESCRITURA_4K = "escritura_4k"  # IOPS
+
+FUENTE_CONVERSION = "conversion"
+FUENTE_BENCHMARK = "benchmark"
+
+# Operaciones en las que una caída de rendimiento indica una memoria degradada
+_OPERACIONES_DEGRADACION = (OP_RESTAURACION, OP_ESCRITURA_SECUENCIAL)
+
+_VERSION_ESQUEMA = 1
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS dispositivos (
+    id INTEGER PRIMARY KEY,
+    clave TEXT NOT NULL UNIQUE,
+    modelo TEXT,
+    capacidad INTEGER,
+    primera_vez REAL NOT NULL,
+    ultima_vez REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS seriales (
+    serial TEXT PRIMARY KEY,
+    dispositivo INTEGER NOT NULL REFERENCES dispositivos(id),
+    visto REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_seriales_dispositivo ON seriales(dispositivo);
+CREATE TABLE IF NOT EXISTS mediciones (
+    id INTEGER PRIMARY KEY,
+    dispositivo INTEGER NOT NULL REFERENCES dispositivos(id),
+    operacion TEXT NOT NULL,
+    fuente TEXT NOT NULL,
+    valor REAL NOT NULL,
+    bytes INTEGER,
+    duracion REAL,
+    momento REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_mediciones ON mediciones(dispositivo, operacion, momento);
+CREATE TABLE IF NOT EXISTS conversiones (
+    id INTEGER PRIMARY KEY,
+    dispositivo INTEGER NOT NULL REFERENCES dispositivos(id),
+    fs_origen TEXT,
+    fs_destino TEXT,
+    estrategia TEXT,
+    duracion REAL,
+    exito INTEGER NOT NULL,
+    momento REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_conversiones ON conversiones(dispositivo, momento);
+"""
+
+
+def formato_serial(serial):
+    """Serial de volumen como lo muestra vol (XXXXXXXX); acepta el entero de win32api"""
+    if serial is None:
+        return None
+    if isinstance(serial, int):
+        return f"{serial & 0xFFFFFFFF:08X}"
+    return str(serial).replace('-', '').upper()
+
+
+def serial_de_unidad(ruta):
+    """Serial del volumen de una unidad de Windows, o None"""
+    if sys.platform != "win32":
+        return None
+    try:
+        import win32api
+        return formato_serial(win32api.GetVolumeInformation(os.path.join(ruta, ''))[1])
+    except Exception as e:
+        logger.debug(f"No se pudo leer el serial de {ruta}: {str(e)}")
+        return None
+
+
+def disco_fisico(ruta):
+    """PNPDeviceID, modelo y capacidad del disco que contiene la unidad, o None.
+
+    El PNPDeviceID no cambia al formatear, a diferencia del serial del
+    volumen. Solo disponible en Windows con WMI.
+    """
+    if sys.platform != "win32" or len(ruta.rstrip('\\/')) != 2 or ruta[1] != ':':
+        return None
+    letra = ruta[:2].upper()
+    try:
+        import pythoncom
+        import wmi
+        # Se puede llamar desde cualquier hilo (sondeo, planificador, conversión...)
+        pythoncom.CoInitialize()
+        conexion = wmi.WMI()
+        for disco in conexion.Win32_LogicalDisk(DeviceID=letra):
+            for particion in disco.associators("Win32_LogicalDiskToPartition"):
+                for unidad in particion.associators("Win32_DiskDriveToDiskPartition"):
+                    if unidad.PNPDeviceID:
+                        return {
+                            'clave': unidad.PNPDeviceID,
+                            'modelo': unidad.Model,
+                            'capacidad': int(unidad.Size) if unidad.Size else None,
+                        }
+    except Exception as e:
+        logger.debug(f"No se pudo identificar el disco de {letra}: {str(e)}")
+    return None
+
+
+class DeviceHistory:
+    """Historial persistente de rendimiento por dispositivo en SQLite.
+
+    Cada dispositivo se identifica por su disco físico cuando se conoce y
+    por los seriales de volumen que ha tenido: al formatear, el serial
+    nuevo se vincula al mismo dispositivo, de modo que las búsquedas por
+    serial siguen encontrando su historial. Guarda los throughputs de
+    copia y restauración, la duración de los formateos, los resultados de
+    benchmark y cada conversión.
+    """
+
+    def __init__(self, ruta=None, muestras=None):
+        self.ruta = ruta or config.DEVICE_HISTORY_DB
+        self.muestras = muestras or config.DEVICE_HISTORY_SAMPLES
+        self._lock = threading.Lock()
+        directorio = os.path.dirname(self.ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self._conexion = sqlite3.connect(self.ruta, timeout=5, check_same_thread=False)
+        self._conexion.row_factory = sqlite3.Row
+        with self._lock, self._conexion:
+            self._conexion.execute("PRAGMA journal_mode=WAL")
+            self._conexion.executescript(_ESQUEMA)
+            self._conexion.execute(f"PRAGMA user_version = {_VERSION_ESQUEMA}")
+
+    def cerrar(self):
+        with self._lock:
+            self._conexion.close()
+
+    def _ejecutar(self, sql, parametros=()):
+        with self._lock, self._conexion:
+            return self._conexion.execute(sql, parametros).fetchall()
+
+    # Dispositivos
+
+    def buscar(self, serial=None, clave=None):
+        """Id del dispositivo por disco físico o serial de volumen, o None"""
+        if clave:
+            filas = self._ejecutar("SELECT id FROM dispositivos WHERE clave = ?", (clave,))
+            if filas:
+                return filas[0]['id']
+        if serial:
+            filas = self._ejecutar("SELECT dispositivo FROM seriales WHERE serial = ?",
+                                   (formato_serial(serial),))
+            if filas:
+                return filas[0]['dispositivo']
+        return None
+
+    def registrar_dispositivo(self, serial=None, clave=None, modelo=None, capacidad=None):
+        """Crea o actualiza el dispositivo y vincula el serial; devuelve su id"""
+        serial = formato_serial(serial)
+        if not serial and not clave:
+            raise ValueError("Se necesita un serial de volumen o un identificador de disco")
+        ahora = time.time()
+        dispositivo = self.buscar(serial, clave)
+        with self._lock, self._conexion:
+            if dispositivo is None:
+                cursor = self._conexion.execute(
+                    "INSERT INTO dispositivos (clave, modelo, capacidad, primera_vez, ultima_vez) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (clave or f"serial:{serial}", modelo, capacidad, ahora, ahora))
+                dispositivo = cursor.lastrowid
+            else:
+                self._conexion.execute(
+                    "UPDATE dispositivos SET modelo = COALESCE(?, modelo), "
+                    "capacidad = COALESCE(?, capacidad), ultima_vez = ? WHERE id = ?",
+                    (modelo, capacidad, ahora, dispositivo))
+            if serial:
+                self._conexion.execute(
+                    "INSERT OR REPLACE INTO seriales (serial, dispositivo, visto) VALUES (?, ?, ?)",
+                    (serial, dispositivo, ahora))
+        return dispositivo
+
+    def vincular_serial(self, dispositivo, serial):
+        """Asocia al dispositivo el serial que recibe el volumen tras formatear"""
+        serial = formato_serial(serial)
+        if serial:
+            self._ejecutar("INSERT OR REPLACE INTO seriales (serial, dispositivo, visto) "
+                           "VALUES (?, ?, ?)", (serial, dispositivo, time.time()))
+
+    def dispositivo_de_unidad(self, ruta, serial=None):
+        """Registra la unidad (serial, disco y modelo) y devuelve el id de su dispositivo.
+
+        serial es el del volumen si ya se conoce; si no, se lee de Windows.
+        Sin serial ni WMI (un directorio en Linux) se usa la ruta absoluta.
+        """
+        serial = formato_serial(serial) or serial_de_unidad(ruta)
+        disco = disco_fisico(ruta) or {}
+        clave = disco.get('clave') or (None if serial else os.path.abspath(ruta))
+        return self.registrar_dispositivo(serial, clave, disco.get('modelo'), disco.get('capacidad'))
+
+    # Mediciones
+
+    def registrar_medicion(self, dispositivo, operacion, valor, fuente=FUENTE_CONVERSION,
+                           bytes_=None, duracion=None, momento=None):
+        self._ejecutar(
+            "INSERT INTO mediciones (dispositivo, operacion, fuente, valor, bytes, duracion, momento) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (dispositivo, operacion, fuente, valor, bytes_, duracion,
+             time.time() if momento is None else momento))
+
+    def registrar_benchmark(self, dispositivo, resultado):
+        """Guarda un resultado de DriveBenchmark.ejecutar()"""
+        momento = resultado.get('timestamp')
+        for operacion, campo in ((OP_LECTURA_SECUENCIAL, 'lectura_secuencial'),
+                                 (OP_ESCRITURA_SECUENCIAL, 'escritura_secuencial'),
+                                 (OP_LECTURA_4K, 'lectura_aleatoria_iops'),
+                                 (OP_ESCRITURA_4K, 'escritura_aleatoria_iops')):
+            if resultado.get(campo):
+                self.registrar_medicion(dispositivo, operacion, resultado[campo], FUENTE_BENCHMARK,
+                                        resultado.get('tamano'), None, momento)
+
+    def registrar_conversion(self, dispositivo, metricas):
+        """Guarda una conversión (ConversionMetrics.como_dict()) y las mediciones de sus tramos"""
+        momento = metricas.get('inicio')
+        if momento is None:
+            momento = time.time()
+        self._ejecutar(
+            "INSERT INTO conversiones (dispositivo, fs_origen, fs_destino, estrategia, duracion, "
+            "exito, momento) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (dispositivo, metricas.get('fs_origen'), metricas.get('fs_destino'),
+             metricas.get('estrategia'), metricas.get('duracion'), int(bool(metricas.get('exito'))),
+             momento))
+        for tramo in metricas.get('spans', []):
+            duracion = tramo.get('duracion')
+            if not tramo.get('exito') or not duracion:
+                continue
+            if tramo['nombre'] in (OP_COPIA, OP_RESTAURACION) and tramo.get('bytes'):
+                self.registrar_medicion(dispositivo, tramo['nombre'], tramo['bytes'] / duracion,
+                                        bytes_=tramo['bytes'], duracion=duracion,
+                                        momento=tramo.get('inicio'))
+            elif tramo['nombre'] == OP_FORMATEO:
+                self.registrar_medicion(dispositivo, OP_FORMATEO, duracion, duracion=duracion,
+                                        momento=tramo.get('inicio'))
+
+    def valores(self, dispositivo, operacion, limite=None):
+        """Valores medidos de una operación, del más reciente al más antiguo"""
+        sql = "SELECT valor FROM mediciones WHERE dispositivo = ? AND operacion = ? ORDER BY momento DESC"
+        parametros = (dispositivo, operacion)
+        if limite:
+            sql += " LIMIT ?"
+            parametros += (limite,)
+        return [fila['valor'] for fila in self._ejecutar(sql, parametros)]
+
+    def mediana(self, dispositivo, operacion):
+        """Mediana de las últimas mediciones, o None si no hay"""
+        valores = self.valores(dispositivo, operacion, self.muestras)
+        return statistics.median(valores) if valores else None
+
+    def throughputs(self, dispositivo):
+        """(lectura, escritura) en bytes/s para estimar una conversión, o None si no se conocen.
+
+        Se prefieren las conversiones reales a los benchmarks.
+        """
+        lectura = self.mediana(dispositivo, OP_COPIA) or self.mediana(dispositivo, OP_LECTURA_SECUENCIAL)
+        escritura = (self.mediana(dispositivo, OP_RESTAURACION)
+                     or self.mediana(dispositivo, OP_ESCRITURA_SECUENCIAL))
+        return lectura, escritura
+
+    def degradado(self, dispositivo):
+        """True si la escritura reciente cae por debajo de DEVICE_DEGRADED_RATIO de su mejor marca"""
+        for operacion in _OPERACIONES_DEGRADACION:
+            valores = self.valores(dispositivo, operacion)
+            recientes = valores[:self.muestras // 2 + 1]
+            anteriores = valores[len(recientes):]
+            if not anteriores:
+                continue
+            if statistics.median(recientes) < max(anteriores) * config.DEVICE_DEGRADED_RATIO:
+                return True
+        return False
+
+    def resumen(self):
+        """Dispositivos con sus seriales, throughputs y estado, para revisarlos"""
+        filas = self._ejecutar(
+            "SELECT d.id, d.clave, d.modelo, d.capacidad, d.primera_vez, d.ultima_vez, "
+            "(SELECT group_concat(serial) FROM seriales s WHERE s.dispositivo = d.id) AS seriales, "
+            "(SELECT count(*) FROM conversiones c WHERE c.dispositivo = d.id) AS conversiones, "
+            "(SELECT count(*) FROM conversiones c WHERE c.dispositivo = d.id AND NOT c.exito) AS fallidas "
+            "FROM dispositivos d ORDER BY d.ultima_vez DESC")
+        resumen = []
+        for fila in filas:
+            lectura, escritura = self.throughputs(fila['id'])
+            resumen.append(dict(fila, seriales=(fila['seriales'] or "").split(',') if fila['seriales'] else [],
+                                lectura=lectura, escritura=escritura,
+                                degradado=self.degradado(fila['id'])))
+        return resumen
+
+    def conversiones(self, dispositivo, limite=20):
+        """Últimas conversiones del dispositivo, de la más reciente a la más antigua"""
+        filas = self._ejecutar(
+            "SELECT fs_origen, fs_destino, estrategia, duracion, exito, momento FROM conversiones "
+            "WHERE dispositivo = ? ORDER BY momento DESC LIMIT ?", (dispositivo, limite))
+        return [dict(fila) for fila in filas]
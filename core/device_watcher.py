@@ -0,0 +1,289 @@
+import os
+import sys
+import time
+import queue
+import select
+import threading
+import logging
+import config
+
+logger = logging.getLogger(__name__)
+
+EVENTO_AGREGADO = "agregado"
+EVENTO_ELIMINADO = "eliminado"
+EVENTO_CAMBIADO = "cambiado"
+
+# Cada cuánto comprueban los backends si deben detenerse
+_ESPERA_DETENCION = 0.5  # segundos
+
+
+def crear_evento(tipo, unidad, origen):
+    """Evento de dispositivo que reciben los suscriptores del watcher"""
+    return {'tipo': tipo, 'unidad': unidad, 'origen': origen, 'timestamp': time.time()}
+
+
+class WatcherBackend:
+    """Interfaz de los backends de notificación de volúmenes.
+
+    ejecutar() bloquea el hilo del watcher hasta que `detener` se activa y
+    llama a emitir(tipo, unidad) por cada cambio detectado.
+    """
+    nombre = "base"
+
+    @classmethod
+    def disponible(cls):
+        return False
+
+    def ejecutar(self, emitir, detener):
+        raise NotImplementedError
+
+
+class WindowsVolumeBackend(WatcherBackend):
+    """Notificaciones de llegada/retirada de volúmenes vía Win32_VolumeChangeEvent"""
+    nombre = "windows"
+
+    # EventType de Win32_VolumeChangeEvent
+    _TIPOS = {1: EVENTO_CAMBIADO, 2: EVENTO_AGREGADO, 3: EVENTO_ELIMINADO}
+
+    @classmethod
+    def disponible(cls):
+        if sys.platform != "win32":
+            return False
+        try:
+            import wmi  # noqa: F401
+            import pythoncom  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def ejecutar(self, emitir, detener):
+        import wmi
+        import pythoncom
+
+        # WMI necesita COM inicializado en cada hilo que lo use
+        pythoncom.CoInitialize()
+        try:
+            conexion = wmi.WMI()
+            observador = conexion.watch_for(raw_wql="SELECT * FROM Win32_VolumeChangeEvent")
+            while not detener.is_set():
+                try:
+                    evento = observador(timeout_ms=int(_ESPERA_DETENCION * 1000))
+                except wmi.x_wmi_timed_out:
+                    continue
+                tipo = self._TIPOS.get(int(evento.EventType))
+                if tipo:
+                    emitir(tipo, evento.DriveName)
+        finally:
+            pythoncom.CoUninitialize()
+
+
+class UdevBackend(WatcherBackend):
+    """Eventos de udev para particiones de dispositivos de bloque (requiere pyudev)"""
+    nombre = "udev"
+
+    _TIPOS = {'add': EVENTO_AGREGADO, 'remove': EVENTO_ELIMINADO, 'change': EVENTO_CAMBIADO}
+
+    @classmethod
+    def disponible(cls):
+        if not sys.platform.startswith("linux"):
+            return False
+        try:
+            import pyudev  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def ejecutar(self, emitir, detener):
+        import pyudev
+
+        contexto = pyudev.Context()
+        monitor = pyudev.Monitor.from_netlink(contexto)
+        monitor.filter_by(subsystem='block', device_type='partition')
+        monitor.start()
+        while not detener.is_set():
+            dispositivo = monitor.poll(timeout=_ESPERA_DETENCION)
+            if dispositivo is None:
+                continue
+            tipo = self._TIPOS.get(dispositivo.action)
+            if tipo:
+                emitir(tipo, dispositivo.device_node)
+
+
+class MountTableBackend(WatcherBackend):
+    """Cambios en la tabla de montajes de Linux sin dependencias externas.
+
+    El kernel marca /proc/self/mounts con POLLPRI cada vez que se monta o
+    desmonta algo; al despertar se compara la lista de montajes de
+    dispositivos extraíbles con la anterior.
+    """
+    nombre = "mounts"
+    RUTA_MONTAJES = "/proc/self/mounts"
+
+    @classmethod
+    def disponible(cls):
+        return sys.platform.startswith("linux") and os.path.exists(cls.RUTA_MONTAJES)
+
+    @staticmethod
+    def _es_extraible(dispositivo):
+        nombre = os.path.basename(dispositivo)
+        ruta = os.path.realpath(f"/sys/class/block/{nombre}")
+        if "/usb" in ruta:
+            return True
+        # Para particiones el atributo está en el dispositivo padre
+        for candidato in (ruta, os.path.dirname(ruta)):
+            try:
+                with open(os.path.join(candidato, "removable")) as f:
+                    return f.read().strip() == "1"
+            except OSError:
+                continue
+        return False
+
+    def _montajes(self, contenido):
+        montajes = {}
+        for linea in contenido.splitlines():
+            partes = linea.split()
+            if len(partes) < 3 or not partes[0].startswith("/dev/"):
+                continue
+            # Los espacios en rutas vienen escapados como \040
+            punto = partes[1].replace("\\040", " ")
+            if self._es_extraible(partes[0]):
+                montajes[punto] = (partes[0], partes[2])
+        return montajes
+
+    def ejecutar(self, emitir, detener):
+        with open(self.RUTA_MONTAJES) as archivo:
+            sondeo = select.poll()
+            sondeo.register(archivo, select.POLLPRI | select.POLLERR)
+            anteriores = self._montajes(archivo.read())
+            while not detener.is_set():
+                if not sondeo.poll(int(_ESPERA_DETENCION * 1000)):
+                    continue
+                # Releer desde el mismo descriptor limpia la notificación
+                archivo.seek(0)
+                actuales = self._montajes(archivo.read())
+                for punto in actuales.keys() - anteriores.keys():
+                    emitir(EVENTO_AGREGADO, punto)
+                for punto in anteriores.keys() - actuales.keys():
+                    emitir(EVENTO_ELIMINADO, punto)
+                for punto in actuales.keys() & anteriores.keys():
+                    if actuales[punto] != anteriores[punto]:
+                        emitir(EVENTO_CAMBIADO, punto)
+                anteriores = actuales
+
+
+class FakeBackend(WatcherBackend):
+    """Backend guionizado para pruebas.
+
+    guion es una lista de (segundos_desde_inicio, tipo, unidad); además se
+    pueden inyectar eventos en cualquier momento con inyectar().
+    """
+    nombre = "fake"
+
+    def __init__(self, guion=None):
+        self.guion = sorted(guion or [], key=lambda paso: paso[0])
+        self._cola = queue.Queue()
+
+    @classmethod
+    def disponible(cls):
+        return True
+
+    def inyectar(self, tipo, unidad):
+        self._cola.put((tipo, unidad))
+
+    def ejecutar(self, emitir, detener):
+        inicio = time.monotonic()
+        pendientes = list(self.guion)
+        while not detener.is_set():
+            espera = _ESPERA_DETENCION
+            if pendientes:
+                espera = min(espera, max(0.0, inicio + pendientes[0][0] - time.monotonic()))
+            try:
+                tipo, unidad = self._cola.get(timeout=espera)
+                emitir(tipo, unidad)
+            except queue.Empty:
+                pass
+            while pendientes and time.monotonic() - inicio >= pendientes[0][0]:
+                _, tipo, unidad = pendientes.pop(0)
+                emitir(tipo, unidad)
+
+
+BACKENDS = {
+    WindowsVolumeBackend.nombre: WindowsVolumeBackend,
+    UdevBackend.nombre: UdevBackend,
+    MountTableBackend.nombre: MountTableBackend,
+    FakeBackend.nombre: FakeBackend,
+}
+
+
+def elegir_backend(nombre=None):
+    """Devuelve una instancia del backend configurado o del primero disponible"""
+    nombre = nombre or config.DEVICE_WATCHER_BACKEND
+    if nombre != "auto":
+        clase = BACKENDS.get(nombre)
+        if clase and clase.disponible():
+            return clase()
+        logger.warning(f"Backend de dispositivos no disponible: {nombre}")
+        return None
+    for clase in (WindowsVolumeBackend, UdevBackend, MountTableBackend):
+        if clase.disponible():
+            return clase()
+    return None
+
+
+class DeviceWatcher:
+    """Vigila la llegada y retirada de volúmenes en un hilo propio.
+
+    Los suscriptores reciben diccionarios de crear_evento() desde el hilo
+    del watcher; la interfaz debe reenviarlos a su hilo (p. ej. con una
+    señal de Qt).
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or elegir_backend()
+        self._suscriptores = []
+        self._detener = threading.Event()
+        self._hilo = None
+        self.activo = False
+
+    def suscribir(self, callback):
+        self._suscriptores.append(callback)
+
+    def desuscribir(self, callback):
+        if callback in self._suscriptores:
+            self._suscriptores.remove(callback)
+
+    def start(self):
+        """Arranca el hilo del watcher; devuelve False si no hay backend"""
+        if self.backend is None:
+            logger.info("Sin backend de notificación de dispositivos; se usará sondeo")
+            return False
+        self._detener.clear()
+        self.activo = True
+        self._hilo = threading.Thread(target=self._ejecutar, name="device-watcher", daemon=True)
+        self._hilo.start()
+        logger.info(f"Vigilando dispositivos con el backend {self.backend.nombre}")
+        return True
+
+    def stop(self, timeout=2.0):
+        self._detener.set()
+        if self._hilo:
+            self._hilo.join(timeout)
+            self._hilo = None
+        self.activo = False
+
+    def _ejecutar(self):
+        try:
+            self.backend.ejecutar(self._emitir, self._detener)
+        except Exception as e:
+            logger.error(f"El backend de dispositivos {self.backend.nombre} falló: {str(e)}")
+        finally:
+            self.activo = False
+
+    def _emitir(self, tipo, unidad):
+        evento = crear_evento(tipo, unidad, self.backend.nombre)
+        logger.debug(f"Evento de dispositivo: {tipo} {unidad}")
+        for callback in list(self._suscriptores):
+            try:
+                callback(evento)
+            except Exception as e:
+                logger.warning(f"Error en suscriptor de dispositivos: {str(e)}")
@@ -0,0 +1,128 @@
+import os
+import json
+import shutil
+import itertools
+import threading
+import logging
+from collections import namedtuple
+from core.command_runner import FakeCommandRunner, ComandoFalso
+
+logger = logging.getLogger(__name__)
+
+UsoVolumen = namedtuple('UsoVolumen', 'total used free')
+
+
+class VolumenesSimulados:
+    """Volúmenes de FormatConverter sobre directorios (ver core.volumes).
+
+    Con el FormatConverter real cada unidad es un directorio con su sistema
+    de archivos y serial, y el format.com de ejecutor() la vacía y le da un
+    serial nuevo, como el de verdad. La tabla de volúmenes vive en memoria
+    o, con registro, en ese archivo JSON (fuera de las unidades, para que
+    el backup no la copie), así varias ejecuciones ven el mismo estado.
+    """
+
+    def __init__(self, staging, capacidad=1 << 30, registro=None):
+        self.staging = staging
+        self.capacidad = capacidad
+        self.registro = registro
+        self._lock = threading.Lock()
+        self._volumenes = self._cargar()
+        self._seriales = itertools.count(
+            max((v['serial'] for v in self._volumenes.values()), default=0x0fff) + 1)
+        self.desmontajes = []
+
+    def _cargar(self):
+        if not self.registro:
+            return {}
+        try:
+            with open(self.registro, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Registro de volúmenes simulados ilegible ({self.registro}): {str(e)}")
+            return {}
+
+    def _guardar(self):
+        """Escribe la tabla en el registro; se llama con el lock tomado"""
+        if not self.registro:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.registro)), exist_ok=True)
+        temporal = f"{self.registro}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(self._volumenes, f, indent=2)
+        os.replace(temporal, self.registro)
+
+    def crear(self, directorio, sistema_archivos="FAT32"):
+        directorio = os.path.abspath(directorio)
+        os.makedirs(directorio, exist_ok=True)
+        with self._lock:
+            self._volumenes[directorio] = {'fs': sistema_archivos, 'serial': next(self._seriales)}
+            self._guardar()
+        return directorio
+
+    def registrar(self, directorio, sistema_archivos="FAT32"):
+        """Adopta un directorio existente como volumen si aún no lo es; devuelve su ruta"""
+        ruta = os.path.abspath(directorio)
+        if ruta not in self._volumenes and os.path.isdir(ruta):
+            self.crear(ruta, sistema_archivos)
+        return ruta
+
+    def _volumen(self, unidad):
+        volumen = self._volumenes.get(os.path.abspath(unidad))
+        if volumen is None:
+            raise OSError(f"{unidad} no es un volumen simulado")
+        return volumen
+
+    def normalizar(self, unidad):
+        ruta = os.path.abspath(unidad) if unidad else None
+        return ruta if ruta in self._volumenes else None
+
+    def sistema_archivos(self, unidad):
+        return self._volumen(unidad)['fs']
+
+    def serial(self, unidad):
+        return self._volumen(unidad)['serial']
+
+    def uso(self, unidad):
+        usado = sum(os.path.getsize(os.path.join(raiz, nombre))
+                    for raiz, _, nombres in os.walk(unidad) for nombre in nombres)
+        return UsoVolumen(self.capacidad, usado, self.capacidad - usado)
+
+    def directorio_staging(self):
+        return self.staging
+
+    def desmontar(self, unidad):
+        self._volumen(unidad)
+        self.desmontajes.append(unidad)
+
+    def actualizar(self, unidad):
+        pass
+
+    def formatear(self, unidad, sistema_archivos):
+        volumen = self._volumen(unidad)
+        for entrada in os.scandir(unidad):
+            if entrada.is_dir(follow_symlinks=False):
+                shutil.rmtree(entrada.path)
+            else:
+                os.remove(entrada.path)
+        with self._lock:
+            volumen.update(fs=sistema_archivos, serial=next(self._seriales))
+            self._guardar()
+
+    def ejecutor(self, segundos=0.0):
+        """FakeCommandRunner con format.com y convert.exe que actúan sobre estos volúmenes"""
+        def formatear(args):
+            fs = next(arg for arg in args if arg.upper().startswith('/FS:'))[4:]
+            self.formatear(args[1], fs)
+
+        def convertir(args):
+            volumen = self._volumen(args[1])
+            with self._lock:
+                volumen['fs'] = "NTFS"
+                self._guardar()
+        return FakeCommandRunner({
+            'format.com': ComandoFalso.con_progreso(segundos, al_ejecutar=formatear),
+            'convert.exe': ComandoFalso.con_progreso(segundos, al_ejecutar=convertir),
+        })
@@ -1,33 +1,95 @@
-import subprocess
-import win32file
-import win32con
-import win32api
-import time
 import psutil
-import ctypes
 import sys
 import os
 import logging
 import shutil
 import tempfile
-from utils.threading import run_in_thread
+import tarfile
+import fnmatch
+import threading
+import sqlite3
+from core.copy_engine import CopyEngine, CopiaCancelada
+from core.backup_archive import BackupArchive, elegir_compresion
+from core.journal import (ConversionJournal, FASE_COPIA, FASE_FORMATEO,
+                          FASE_RESTAURACION, FASE_COMPLETADO)
+from core.progress import ProgressTracker, FASE_ESPERA, FASE_CONVERSION
+from core.handle_index import HandleIndex
+from core.readiness import ReadinessWaiter, volumen_montado
+from core.metrics import ConversionMetrics
+from core.log_index import contexto_registro
+from core.command_runner import CommandRunner
+from core.volumes import (VolumenesWindows, nombre_archivo,  # noqa: F401
+                          obtener_tipo_fs, obtener_serial_volumen)
+from core.device_history import DeviceHistory, OP_FORMATEO
+from core.cluster_size import HistogramaTamanos, elegir_tamano_cluster, formato_argumento
+from core.planner import (ConversionPlanner, Plan, formatos_equivalentes, ESTRATEGIA_SIN_CAMBIOS,
+                          ESTRATEGIA_IN_SITU, ESTRATEGIA_SOLO_FORMATO, ESTRATEGIA_COPIA)
+import config
 
 logger = logging.getLogger(__name__)
 
 # Constantes
 MAX_RETRIES = 3
-RETRY_DELAY = 2
-MOUNT_WAIT_TIME = 5
+MSG_CANCELADA = "Conversión cancelada por el usuario"
 
 class FormatConverter:
-    def __init__(self):
-        self.current_process = None
+    def __init__(self, device_watcher=None, runner=None, turno=None, volumenes=None):
+        self.runner = runner or CommandRunner()
+        # Letra, sistema de archivos, serial y desmontaje (ver core.volumes)
+        self.volumenes = volumenes or VolumenesWindows()
         self.is_converting = False
         self.current_worker = None
         self.backup_dir = None
+        # turno reparte el disco de staging con otras conversiones (ver ConversionQueue)
+        self.turno = turno
+        self.copy_engine = CopyEngine(turno=turno)
+        self.journal = None
+        self.progreso = None
+        self.callback_progreso = None
+        self.handle_index = HandleIndex()
+        # Las esperas de montaje/desmontaje despiertan con eventos de volumen
+        self.device_watcher = device_watcher
+        self.esperas = ReadinessWaiter()
+        self.esperas.observar(device_watcher)
+        self.metricas = None
+        # Se comprueba entre fases: tras cancelar no se desmonta ni se formatea
+        self._cancelado = threading.Event()
+        self.historial = self._abrir_historial()
+        self._dispositivo = None  # (letra, id en el historial)
 
-    @run_in_thread
-    def iniciar_conversion(self, letra_unidad, nuevo_fs, callback_exito, callback_error):
+    def cerrar(self):
+        """Deja de observar el watcher y cierra el historial"""
+        self.esperas.dejar_de_observar(self.device_watcher)
+        if self.historial is not None:
+            self.historial.cerrar()
+            self.historial = None
+
+    def iniciar_conversion(self, letra_unidad, nuevo_fs, callback_exito, callback_error,
+                           callback_progreso=None):
+        """Ejecuta convertir() en un QThread aparte"""
+        # Import diferido: la línea de comandos usa el convertidor sin cargar Qt
+        from utils.threading import run_in_thread
+        return run_in_thread(self.convertir)(letra_unidad, nuevo_fs, callback_exito, callback_error,
+                                             callback_progreso)
+
+    def convertir(self, letra_unidad, nuevo_fs, callback_exito, callback_error, callback_progreso=None,
+                  plan=None, tamano_cluster=None):
+        """Convierte la unidad al nuevo sistema de archivos en el hilo actual.
+
+        callback_progreso recibe diccionarios de ProgressTracker.snapshot()
+        con fase, bytes, archivos, throughput y ETA en cada cambio de fase o
+        de avance; el progreso de la copia se muestrea leyendo self.progreso
+        (ver ProgressBus.fuente). plan es el resultado de
+        planificar() mostrado al usuario; sin él se planifica aquí mismo.
+        tamano_cluster fija el /A: de format en lugar del elegido por el plan.
+        """
+        # Todos los registros de la conversión quedan etiquetados con la unidad
+        with contexto_registro(unidad=self.normalizar_letra_unidad(letra_unidad)):
+            self._convertir(letra_unidad, nuevo_fs, callback_exito, callback_error,
+                            callback_progreso, plan, tamano_cluster)
+
+    def _convertir(self, letra_unidad, nuevo_fs, callback_exito, callback_error, callback_progreso,
+                   plan, tamano_cluster):
         logger.debug(f"Iniciando conversión para {letra_unidad} a {nuevo_fs}")
         if self.is_converting:
             msg_error = "Ya hay una conversión en progreso"
@@ -36,6 +98,15 @@ class FormatConverter:
             return
             
         self.is_converting = True
+        # Después de la comprobación: una segunda llamada rechazada no debe
+        # desviar el progreso de la conversión en curso
+        self.callback_progreso = callback_progreso
+        self._cancelado.clear()
+        if self.copy_engine.cancelado:
+            self.copy_engine = CopyEngine(turno=self.turno)
+        self.esperas.reiniciar()
+        self.metricas = ConversionMetrics(letra_unidad, nuevo_fs.upper())
+        callback_exito, callback_error = self._callbacks_con_metricas(callback_exito, callback_error)
         try:
             # Normalizar letra de unidad
             letra_unidad = self.normalizar_letra_unidad(letra_unidad)
@@ -46,223 +117,624 @@ class FormatConverter:
                 return
                 
             logger.debug(f"Verificando estado de la unidad: {letra_unidad}")
-            if not self.unidad_lista(letra_unidad):
+            with self.metricas.span("verificacion") as span:
+                lista = self.unidad_lista(letra_unidad)
+                span.resultado(lista)
+            self._comprobar_cancelacion()
+            if not lista:
                 msg_error = f"Unidad {letra_unidad} no está lista o está en uso"
                 logger.error(msg_error)
                 callback_error(msg_error)
                 return
-                
-            # Detectar sistema de archivos actual
-            fs_actual = obtener_tipo_fs(letra_unidad)
-            logger.info(f"Sistema de archivos actual: {fs_actual}")
 
-            if fs_actual is None:
-                msg_error = f"No se pudo detectar el sistema de archivos de {letra_unidad}"
-                logger.error(msg_error)
-                callback_error(msg_error)
+            # Se registra antes de formatear, mientras el volumen conserva su serial
+            self._dispositivo = None
+            self._id_dispositivo(letra_unidad)
+
+            # Reanudar una conversión interrumpida antes de mirar el formato actual:
+            # tras el formateo la unidad ya tiene el sistema de archivos nuevo
+            journal = self.buscar_conversion_pendiente(letra_unidad)
+            if journal:
+                fs_pendiente = journal.estado.get('fs_destino')
+                if fs_pendiente != nuevo_fs.upper():
+                    logger.warning(f"Se reanuda la conversión pendiente a {fs_pendiente} "
+                                   f"en lugar de {nuevo_fs}")
+                self.metricas.estrategia = ESTRATEGIA_COPIA
+                self._convertir_con_copia(letra_unidad, fs_pendiente, callback_exito,
+                                          callback_error, journal)
                 return
 
-            # Normalizar nombres
-            fs_actual = fs_actual.upper()
+            if plan is not None and plan.estrategia == ESTRATEGIA_SOLO_FORMATO \
+                    and self._tiene_datos(letra_unidad):
+                # Se copiaron datos entre la planificación y la confirmación
+                logger.warning(f"{letra_unidad} ya no está vacía; se vuelve a planificar")
+                plan = None
+            if plan is None:
+                try:
+                    plan = self.planificar(letra_unidad, nuevo_fs, tamano_cluster)
+                except ValueError as e:
+                    logger.error(str(e))
+                    callback_error(str(e))
+                    return
+            elif tamano_cluster:
+                plan.cluster = cluster_manual(tamano_cluster)
+            self.metricas.fs_origen = plan.datos.get('fs_actual')
+            self.metricas.estrategia = plan.estrategia
             nuevo_fs = nuevo_fs.upper()
+            logger.info(f"Ejecutando plan {plan.estrategia} (estimado {plan.segundos:.0f}s)")
 
             # Si ya está en el formato deseado
-            if self.es_formato_equivalente(fs_actual, nuevo_fs):
+            if plan.estrategia == ESTRATEGIA_SIN_CAMBIOS:
                 logger.info("La unidad ya está en el formato deseado.")
                 callback_exito(letra_unidad)
                 return
 
             # Casos que permiten conversión sin pérdida de datos
-            if (fs_actual in ["FAT", "FAT32"] and nuevo_fs == "NTFS"):
+            if plan.estrategia == ESTRATEGIA_IN_SITU:
                 # Desmontar antes de convertir
-                if not self.desmontar_unidad(letra_unidad):
+                with self.metricas.span("desmontaje") as span:
+                    desmontada = self.desmontar_unidad(letra_unidad)
+                    span.resultado(desmontada)
+                self._comprobar_cancelacion()
+                if not desmontada:
                     msg_error = f"Error al desmontar {letra_unidad} para conversión"
                     logger.error(msg_error)
                     callback_error(msg_error)
                     return
                     
-                cmd = f'convert {letra_unidad} /FS:NTFS /X'
+                self.progreso = ProgressTracker([FASE_CONVERSION, FASE_ESPERA],
+                                                callback=self.callback_progreso)
+                self.progreso.iniciar_fase(FASE_CONVERSION)
+                cmd = ['convert.exe', letra_unidad, '/FS:NTFS', '/X']
                 timeout = 300
-                logger.info(f"Ejecutando comando NTFS: {cmd}")
-                self._ejecutar_comando(cmd, timeout, letra_unidad, callback_exito, callback_error)
+                logger.info(f"Ejecutando comando NTFS: {' '.join(cmd)}")
+                self._comprobar_cancelacion()
+                with self.metricas.span("conversion"):
+                    self._ejecutar_comando(cmd, timeout, letra_unidad, callback_exito, callback_error)
+            # Unidad sin datos: no hay nada que respaldar
+            elif plan.estrategia == ESTRATEGIA_SOLO_FORMATO:
+                self._solo_formatear(letra_unidad, nuevo_fs, callback_exito, callback_error,
+                                     plan.cluster['cluster'] if plan.cluster else None)
             # Conversiones que requieren copia de seguridad
             else:
-                logger.info(f"Iniciando conversión segura para {fs_actual} -> {nuevo_fs}")
-                self._convertir_con_copia(letra_unidad, nuevo_fs, callback_exito, callback_error)
-                
+                logger.info(f"Iniciando conversión segura para {plan.datos.get('fs_actual')} -> {nuevo_fs}")
+                self._convertir_con_copia(letra_unidad, nuevo_fs, callback_exito, callback_error,
+                                          plan=plan)
+
+        except CopiaCancelada:
+            logger.info(f"Conversión de {letra_unidad} cancelada")
+            callback_error(MSG_CANCELADA)
         except Exception as e:
             logger.exception(f"Error inesperado: {str(e)}")
             callback_error(f"Error inesperado: {str(e)}")
         finally:
-            self.current_process = None
             self.is_converting = False
+            logger.info(f"Tiempo total en esperas: {self.esperas.total_esperado:.2f}s "
+                        f"({self.esperas.esperas} esperas)")
+            self._exportar_metricas()
             logger.debug("Estado de conversión reiniciado")
 
+    def _callbacks_con_metricas(self, callback_exito, callback_error):
+        """Envuelve los callbacks para registrar el resultado de la conversión"""
+        def exito(letra_unidad):
+            self.metricas.finalizar(True)
+            callback_exito(letra_unidad)
+
+        def error(mensaje):
+            self.metricas.finalizar(False)
+            callback_error(mensaje)
+        return exito, error
+
+    def _exportar_metricas(self):
+        if self.metricas is None:
+            return
+        if self.metricas.duracion is None:
+            self.metricas.finalizar(False)
+        self.metricas.espera_total = self.esperas.total_esperado
+        ruta = self.metricas.exportar()
+        if ruta:
+            logger.info(f"Métricas de la conversión: {ruta}")
+        self._registrar_historial()
+
+    def _contadores_progreso(self):
+        """Bytes y archivos de la fase actual para anotar el tramo"""
+        if not self.progreso:
+            return {}
+        estado = self.progreso.snapshot()
+        return {'bytes': estado['bytes_hechos'], 'archivos': estado['archivos_hechos']}
+
     def normalizar_letra_unidad(self, letra_unidad):
         """Normaliza la letra de unidad a formato 'X:'"""
-        if not letra_unidad:
-            return None
-            
-        letra_unidad = letra_unidad.strip().upper()
-        if len(letra_unidad) == 1:
-            return f"{letra_unidad}:"
-        elif len(letra_unidad) == 2 and letra_unidad[1] == ':':
-            return letra_unidad
-        return None
+        return self.volumenes.normalizar(letra_unidad)
 
     def es_formato_equivalente(self, actual, nuevo):
         """Determina si los formatos son equivalentes"""
-        if actual == nuevo:
-            return True
-        if actual in ["FAT", "FAT32"] and nuevo in ["FAT", "FAT32"]:
-            return True
-        return False
+        return formatos_equivalentes(actual, nuevo)
+
+    def _stagings(self):
+        """Directorios candidatos para el backup con su espacio libre"""
+        temp_base = self.volumenes.directorio_staging()
+        candidatos = []
+        for directorio in [temp_base] + list(config.STAGING_DIRS):
+            # El directorio puede no existir todavía: medir en su ancestro más cercano
+            existente = directorio
+            while not os.path.exists(existente) and os.path.dirname(existente) != existente:
+                existente = os.path.dirname(existente)
+            try:
+                candidatos.append((directorio, psutil.disk_usage(existente).free))
+            except OSError as e:
+                logger.warning(f"Staging {directorio} no disponible: {str(e)}")
+        return candidatos
+
+    def planificar(self, letra_unidad, nuevo_fs, tamano_cluster=None):
+        """Elige la estrategia más rápida y segura sin modificar la unidad.
+
+        Lanza ValueError si ninguna estrategia es viable.
+        """
+        letra_unidad = self.normalizar_letra_unidad(letra_unidad)
+        if not letra_unidad:
+            raise ValueError("Formato de unidad inválido")
+        with contexto_registro(fase="planificacion", unidad=letra_unidad):
+            return self._planificar(letra_unidad, nuevo_fs, tamano_cluster)
+
+    def _planificar(self, letra_unidad, nuevo_fs, tamano_cluster):
+        journal = self.buscar_conversion_pendiente(letra_unidad)
+        if journal:
+            plan = Plan(ESTRATEGIA_COPIA, [], staging=os.path.dirname(journal.estado['backup_dir']),
+                        modo=journal.estado.get('modo'),
+                        motivo=f"reanudar conversión pendiente en fase {journal.fase}")
+            plan.datos = {'fs_destino': journal.estado.get('fs_destino'), 'reanudacion': True}
+            if journal.estado.get('cluster'):
+                plan.cluster = cluster_manual(journal.estado['cluster'])
+            return plan
+
+        fs_actual = self.volumenes.sistema_archivos(letra_unidad)
+        logger.info(f"Sistema de archivos actual: {fs_actual}")
+        if fs_actual is None:
+            raise ValueError(f"No se pudo detectar el sistema de archivos de {letra_unidad}")
+
+        tiene_datos = self._tiene_datos(letra_unidad)
+        bytes_totales = archivos = 0
+        histograma = None
+        if tiene_datos:
+            _, lista = self.copy_engine.escanear(os.path.join(letra_unidad, ''))
+            histograma = HistogramaTamanos.desde_escaneo(lista)
+            bytes_totales = histograma.bytes
+            archivos = histograma.archivos
+
+        lectura, escritura, formateo = self._estimaciones_dispositivo(letra_unidad)
+        planner = ConversionPlanner(lectura, escritura, segundos_formateo=formateo)
+        plan = planner.planificar(fs_actual, nuevo_fs, bytes_totales, archivos,
+                                  tiene_datos, self._stagings(), histograma,
+                                  self._tamano_volumen(letra_unidad))
+        if tamano_cluster:
+            plan.cluster = cluster_manual(tamano_cluster)
+        return plan
+
+    @staticmethod
+    def _abrir_historial():
+        try:
+            return DeviceHistory()
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"Historial de dispositivos no disponible: {str(e)}")
+            return None
+
+    def _id_dispositivo(self, letra_unidad):
+        """Id de la unidad en el historial (se registra si es nueva), o None"""
+        if self.historial is None:
+            return None
+        if self._dispositivo and self._dispositivo[0] == letra_unidad:
+            return self._dispositivo[1]
+        try:
+            dispositivo = self.historial.dispositivo_de_unidad(letra_unidad,
+                                                               self.volumenes.serial(letra_unidad))
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"No se pudo registrar {letra_unidad} en el historial: {str(e)}")
+            return None
+        self._dispositivo = (letra_unidad, dispositivo)
+        return dispositivo
+
+    def _estimaciones_dispositivo(self, letra_unidad):
+        """(lectura, escritura, segundos de formateo) medidos antes en el dispositivo.
+
+        Cada valor es None si no hay historial.
+        """
+        dispositivo = self._id_dispositivo(letra_unidad)
+        if dispositivo is None:
+            return None, None, None
+        try:
+            lectura, escritura = self.historial.throughputs(dispositivo)
+            formateo = self.historial.mediana(dispositivo, OP_FORMATEO)
+        except sqlite3.Error as e:
+            logger.warning(f"Error consultando el historial de {letra_unidad}: {str(e)}")
+            return None, None, None
+        if lectura or escritura or formateo:
+            logger.info(f"Usando el historial de {letra_unidad} para la estimación")
+        return lectura, escritura, formateo
+
+    def _registrar_historial(self):
+        """Guarda la conversión terminada y vincula el serial nuevo del volumen"""
+        if not self._dispositivo:
+            return
+        letra_unidad, dispositivo = self._dispositivo
+        try:
+            self.historial.registrar_conversion(dispositivo, self.metricas.como_dict())
+            # Tras formatear el volumen tiene otro serial
+            self.historial.vincular_serial(dispositivo, self.volumenes.serial(letra_unidad))
+            if self.historial.degradado(dispositivo):
+                logger.warning(f"La escritura en {letra_unidad} es mucho más lenta que en "
+                               f"conversiones anteriores; la memoria puede estar degradada")
+        except sqlite3.Error as e:
+            logger.warning(f"No se pudo guardar la conversión en el historial: {str(e)}")
+
+    def _tamano_volumen(self, letra_unidad):
+        try:
+            return self.volumenes.uso(letra_unidad).total
+        except OSError:
+            return 0
+
+    def _solo_formatear(self, letra_unidad, nuevo_fs, callback_exito, callback_error, cluster=None):
+        """Formatea una unidad sin datos, sin copia de seguridad"""
+        self.progreso = ProgressTracker([FASE_FORMATEO, FASE_ESPERA],
+                                        callback=self.callback_progreso)
+        self.progreso.iniciar_fase(FASE_FORMATEO)
+        with self.metricas.span("desmontaje") as span:
+            desmontada = self.desmontar_unidad(letra_unidad)
+            span.resultado(desmontada)
+        self._comprobar_cancelacion()
+        if not desmontada:
+            msg_error = f"No se pudo desmontar {letra_unidad} para formateo"
+            logger.error(msg_error)
+            callback_error(msg_error)
+            return
+
+        with self.metricas.span(FASE_FORMATEO) as span:
+            formateada = self.formatear_unidad(letra_unidad, nuevo_fs, callback_error, cluster)
+            span.resultado(formateada)
+        self._comprobar_cancelacion()
+        if not formateada:
+            return
+
+        self.progreso.iniciar_fase(FASE_ESPERA)
+        with self.metricas.span("espera_montaje") as span:
+            lista = self.esperar_unidad_lista(letra_unidad)
+            span.resultado(lista)
+        self._comprobar_cancelacion()
+        if not lista:
+            msg_error = f"Unidad {letra_unidad} no disponible después de formateo"
+            logger.error(msg_error)
+            callback_error(msg_error)
+            return
+        self.progreso.completar()
+        logger.info(f"Unidad vacía {letra_unidad} formateada a {nuevo_fs}")
+        callback_exito(letra_unidad)
 
     def _ejecutar_comando(self, comando, timeout, letra_unidad, callback_exito, callback_error):
         """Ejecuta un comando de conversión con manejo de errores"""
-        ruta_bat = None
         try:
-            # Crear archivo batch en directorio temporal
-            with tempfile.NamedTemporaryFile(suffix='.bat', delete=False) as bat_file:
-                ruta_bat = bat_file.name
-                bat_file.write(f"@echo off\n{comando}\nexit\n".encode('utf-8'))
-            logger.debug(f"Archivo batch creado: {ruta_bat}")
-            
-            # Ejecutar comando
-            self.current_process = subprocess.Popen(
-                ['cmd.exe', '/C', ruta_bat],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                stdin=subprocess.PIPE,
-                text=True,
-                shell=False,
-                creationflags=subprocess.CREATE_NO_WINDOW
-            )
-            
-            stdout, stderr = self.current_process.communicate(timeout=timeout)
-            codigo_retorno = self.current_process.returncode
-            
-            logger.info(f"Salida del comando:\n{stdout}")
-            if stderr:
-                logger.error(f"Errores del comando:\n{stderr}")
-            
-            if codigo_retorno == 0:
-                logger.info(f"Conversión exitosa para {letra_unidad}")
+            resultado = self.runner.ejecutar(comando, timeout,
+                                             al_progreso=self._callback_porcentaje(),
+                                             al_linea=lambda linea: logger.debug("%s: %s", comando[0], linea))
+            # Cada línea ya se registró en DEBUG a medida que llegaba
+            logger.info("%s terminó con código %s (%d líneas de salida)",
+                        comando[0], resultado.codigo, len(resultado.salida))
+            if resultado.errores:
+                logger.error("Errores del comando:\n%s", "\n".join(resultado.errores))
+
+            if resultado.exito:
+                logger.info(f"Conversión exitosa para {letra_unidad} en {resultado.duracion:.1f}s")
                 self.actualizar_unidad(letra_unidad)
-                time.sleep(MOUNT_WAIT_TIME)
+                if self.progreso:
+                    self.progreso.iniciar_fase(FASE_ESPERA)
+                self.esperas.esperar(lambda: volumen_montado(letra_unidad),
+                                     config.MOUNT_READY_TIMEOUT, f"montaje de {letra_unidad}")
+                if self.progreso:
+                    self.progreso.completar()
                 callback_exito(letra_unidad)
+            elif resultado.timeout:
+                callback_error("Tiempo de espera agotado en la conversión")
             else:
-                msg_error = stderr.strip() or stdout.strip() or f"Código de error: {codigo_retorno}"
+                msg_error = resultado.texto_error()
                 logger.error(f"Error en conversión: {msg_error}")
-                callback_error(f"Error {codigo_retorno}: {msg_error}")
-                
-        except subprocess.TimeoutExpired:
-            logger.error("Tiempo de espera agotado")
-            if self.current_process:
-                self.current_process.kill()
-            callback_error("Tiempo de espera agotado en la conversión")
+                callback_error(f"Error {resultado.codigo}: {msg_error}")
+
         except Exception as e:
             logger.exception(f"Error ejecutando comando: {str(e)}")
             callback_error(f"Error ejecutando comando: {str(e)}")
-        finally:
-            # Limpieza segura
-            if ruta_bat and os.path.exists(ruta_bat):
-                try:
-                    os.remove(ruta_bat)
-                except Exception as e:
-                    logger.warning(f"No se pudo eliminar archivo temporal: {str(e)}")
 
-    def _convertir_con_copia(self, letra_unidad, nuevo_fs, callback_exito, callback_error):
-        """Conversión segura usando copia temporal de datos"""
+    def _callback_porcentaje(self):
+        """Traduce el porcentaje que imprimen format/convert al progreso de la fase"""
+        if not self.progreso:
+            return None
+        return lambda porcentaje: self.progreso.avance(porcentaje / 100.0)
+
+    def buscar_conversion_pendiente(self, letra_unidad):
+        """Busca un diario sin terminar de la memoria conectada en la unidad.
+
+        Los diarios van por letra y serial del volumen. Los de otra memoria
+        que ya se formateó se conservan (para reanudar cuando vuelva o
+        descartarlos con descartar_conversion) sin bloquear la unidad; los
+        que no pasaron de la copia se descartan, porque la memoria original
+        aún tiene sus datos.
+        """
+        temp_base = self.volumenes.directorio_staging()
+        serial = self.volumenes.serial(letra_unidad)
+        for journal in ConversionJournal.pendientes(temp_base, letra_unidad):
+            if self._diario_corresponde(journal, letra_unidad, serial):
+                journal.cargar_archivos()
+                return journal
+        return None
+
+    def _diario_corresponde(self, journal, letra_unidad, serial):
+        """Indica si el diario es de la memoria conectada y se puede reanudar"""
+        backup_dir = journal.estado.get('backup_dir')
+        backup_existe = bool(backup_dir) and os.path.isdir(backup_dir)
+        # Comprobar que es la misma memoria: el serial cambia al formatear
+        original = journal.estado.get('serial_original')
+        if journal.fase == FASE_COPIA:
+            if serial == original and backup_existe:
+                return True
+            logger.info(f"Se descarta la copia interrumpida de {letra_unidad} "
+                        f"({'otra memoria' if serial != original else 'sin backup'})")
+            self.descartar_conversion(journal)
+            return False
+
+        if not backup_existe:
+            logger.warning(f"Falta el backup {backup_dir} de una conversión interrumpida de "
+                           f"{letra_unidad} en fase {journal.fase}; se ignora su diario")
+            return False
+        if journal.fase == FASE_FORMATEO:
+            # Si el formateo llegó a ejecutarse la unidad estará vacía
+            corresponde = serial == original or not self._tiene_datos(letra_unidad)
+        else:
+            nuevo = journal.estado.get('serial_nuevo')
+            corresponde = nuevo is None or serial == nuevo
+        if not corresponde:
+            logger.warning(f"La conversión interrumpida de {letra_unidad} en fase {journal.fase} "
+                           f"es de otra memoria; backup conservado en {backup_dir}")
+        return corresponde
+
+    def conversiones_pendientes(self):
+        """Diarios sin terminar de todas las unidades, para reanudarlos o descartarlos"""
+        temp_base = self.volumenes.directorio_staging()
+        return ConversionJournal.pendientes(temp_base)
+
+    def descartar_conversion(self, journal):
+        """Borra el diario y el backup de una conversión interrumpida que no se va a reanudar"""
+        backup_dir = journal.estado.get('backup_dir')
+        if backup_dir and os.path.exists(backup_dir):
+            shutil.rmtree(backup_dir, ignore_errors=True)
+        journal.eliminar()
+        logger.warning(f"Conversión interrumpida de {journal.estado.get('unidad')} descartada "
+                       f"(fase {journal.fase}, backup {backup_dir})")
+
+    def _tiene_datos(self, letra_unidad):
+        """True si la unidad contiene algo más que artefactos del sistema.
+
+        Solo mira la raíz y se detiene en la primera entrada que no esté en
+        config.SYSTEM_ARTIFACTS; cualquier carpeta del usuario, aunque esté
+        vacía, cuenta como datos. Ante un error se asume que hay datos.
+        """
+        patrones = [patron.lower() for patron in config.SYSTEM_ARTIFACTS]
+        try:
+            with os.scandir(os.path.join(letra_unidad, '')) as entradas:
+                for entrada in entradas:
+                    nombre = entrada.name.lower()
+                    if not any(fnmatch.fnmatchcase(nombre, patron) for patron in patrones):
+                        logger.debug(f"{letra_unidad} tiene datos de usuario: {entrada.name}")
+                        return True
+            return False
+        except OSError:
+            return True
+
+    def _convertir_con_copia(self, letra_unidad, nuevo_fs, callback_exito, callback_error, journal=None,
+                             plan=None):
+        """Conversión segura usando copia temporal de datos.
+
+        El plan indica el directorio de staging y el modo del backup. Con
+        un diario pendiente la conversión se reanuda en la fase en la que
+        quedó, saltando los archivos ya copiados o restaurados.
+        """
         logger.info(f"Iniciando conversión segura para {letra_unidad} a {nuevo_fs}")
         
         try:
-            # Paso 1: Verificar espacio disponible
-            espacio_usado = self.calcular_espacio_usado(letra_unidad)
-            if espacio_usado is None:
-                msg_error = f"No se pudo calcular espacio usado en {letra_unidad}"
-                logger.error(msg_error)
-                callback_error(msg_error)
-                return
+            temp_base = self.volumenes.directorio_staging()
+            if journal is None:
+                staging = plan.staging if plan and plan.staging else temp_base
+                modo = plan.modo if plan and plan.modo else config.BACKUP_MODE
+                with self.metricas.span("espacio") as span:
+                    journal = self._preparar_backup(letra_unidad, nuevo_fs, temp_base, staging,
+                                                    modo, callback_error)
+                    span.resultado(journal is not None)
+                if journal is None:
+                    return
+                if plan and plan.cluster:
+                    journal.estado.update(cluster=plan.cluster['cluster'],
+                                          cluster_manual=bool(plan.cluster.get('manual')))
+                    journal.guardar()
+            else:
+                self.backup_dir = journal.estado['backup_dir']
+                logger.info(f"Reanudando conversión de {letra_unidad} en fase {journal.fase}")
+            self.journal = journal
 
-            unidad_sistema = os.environ.get('SystemDrive', 'C:')
-            # CORRECCIÓN: Asegurar que la unidad termine con \
-            if not unidad_sistema.endswith('\\'):
-                unidad_sistema += '\\'
-                
-            espacio_libre = psutil.disk_usage(unidad_sistema).free
-            
-            if espacio_libre < espacio_usado * 1.2:
-                msg_error = (f"Espacio insuficiente en {unidad_sistema}. "
-                            f"Necesario: {self.format_bytes(espacio_usado * 1.2)} "
-                            f"Disponible: {self.format_bytes(espacio_libre)}")
-                logger.error(msg_error)
-                callback_error(msg_error)
-                return
-                
-            # Paso 2: Crear directorio temporal
-            # CORRECCIÓN: Crear directorio base si no existe
-            temp_base = os.path.join(unidad_sistema, "Temp")
-            if not os.path.exists(temp_base):
-                try:
-                    os.makedirs(temp_base)
-                    logger.info(f"Directorio temporal creado: {temp_base}")
-                except Exception as e:
-                    logger.error(f"No se pudo crear directorio temporal: {str(e)}")
-                    callback_error(f"Error creando directorio temporal: {str(e)}")
+            modo_archivo = journal.estado.get('modo') == "archivo"
+            if modo_archivo and journal.fase == FASE_COPIA:
+                archivo = BackupArchive(self.backup_dir, journal.estado['compresion'], self.turno)
+            elif modo_archivo:
+                # Tras la copia el archivo tiene que estar: sin él, formatear perdería los datos
+                archivo = BackupArchive.buscar(self.backup_dir, self.turno)
+                if archivo is None:
+                    msg_error = f"No se encontró el backup de {letra_unidad} en {self.backup_dir}"
+                    logger.error(msg_error)
+                    callback_error(msg_error)
                     return
-                    
-            self.backup_dir = tempfile.mkdtemp(
-                prefix=f"USB_BACKUP_{letra_unidad.replace(':', '')}_", 
-                dir=temp_base
+
+            lectura, escritura, _ = self._estimaciones_dispositivo(letra_unidad)
+            self.progreso = ProgressTracker(
+                [FASE_COPIA, FASE_FORMATEO, FASE_ESPERA, FASE_RESTAURACION],
+                journal.estado.get('bytes_totales', 0),
+                journal.estado.get('archivos_totales', 0),
+                callback=self.callback_progreso,
+                throughput_lectura=lectura,
+                throughput_escritura=escritura
             )
-            logger.info(f"Directorio backup creado: {self.backup_dir}")
-            
+
             # Paso 3: Copiar datos
-            if not self.copiar_datos(letra_unidad, self.backup_dir, callback_error):
-                return
-                
-            # Paso 4: Desmontar unidad antes de formatear
-            logger.info(f"Desmontando unidad antes de formatear: {letra_unidad}")
-            if not self.desmontar_unidad(letra_unidad):
-                msg_error = f"No se pudo desmontar {letra_unidad} para formateo"
-                logger.error(msg_error)
-                callback_error(msg_error)
-                return
-                
-            # Paso 5: Formatear unidad
-            if not self.formatear_unidad(letra_unidad, nuevo_fs, callback_error):
-                return
-                
-            # Esperar que la unidad esté disponible
-            if not self.esperar_unidad_lista(letra_unidad):
-                msg_error = f"Unidad {letra_unidad} no disponible después de formateo"
-                logger.error(msg_error)
-                callback_error(msg_error)
-                return
-                
+            if journal.fase == FASE_COPIA:
+                self.progreso.iniciar_fase(FASE_COPIA)
+                with self.metricas.span(FASE_COPIA) as span:
+                    if modo_archivo:
+                        ok = self.respaldar_en_archivo(letra_unidad, archivo, callback_error)
+                    else:
+                        ok = self.copiar_datos(letra_unidad, self.backup_dir, callback_error)
+                    span.resultado(ok, **self._contadores_progreso())
+                if not ok:
+                    return
+                journal.marcar_fase(FASE_FORMATEO)
+
+            if journal.fase == FASE_FORMATEO:
+                self._comprobar_cancelacion()
+                self.progreso.iniciar_fase(FASE_FORMATEO)
+                # Paso 4: Desmontar unidad antes de formatear
+                logger.info(f"Desmontando unidad antes de formatear: {letra_unidad}")
+                with self.metricas.span("desmontaje") as span:
+                    desmontada = self.desmontar_unidad(letra_unidad)
+                    span.resultado(desmontada)
+                self._comprobar_cancelacion()
+                if not desmontada:
+                    msg_error = f"No se pudo desmontar {letra_unidad} para formateo"
+                    logger.error(msg_error)
+                    callback_error(msg_error)
+                    return
+
+                # Paso 5: Formatear unidad
+                with self.metricas.span(FASE_FORMATEO) as span:
+                    formateada = self.formatear_unidad(letra_unidad, nuevo_fs, callback_error,
+                                                       journal.estado.get('cluster'))
+                    span.resultado(formateada)
+                self._comprobar_cancelacion()
+                if not formateada:
+                    return
+
+                # Esperar que la unidad esté disponible
+                self.progreso.iniciar_fase(FASE_ESPERA)
+                with self.metricas.span("espera_montaje") as span:
+                    lista = self.esperar_unidad_lista(letra_unidad)
+                    span.resultado(lista)
+                self._comprobar_cancelacion()
+                if not lista:
+                    msg_error = f"Unidad {letra_unidad} no disponible después de formateo"
+                    logger.error(msg_error)
+                    callback_error(msg_error)
+                    return
+                journal.marcar_fase(FASE_RESTAURACION, serial_nuevo=self.volumenes.serial(letra_unidad))
+
             # Paso 6: Restaurar datos
-            if not self.restaurar_datos(self.backup_dir, letra_unidad, callback_error):
+            self._comprobar_cancelacion()
+            self.progreso.iniciar_fase(FASE_RESTAURACION)
+            self.progreso.saltar(sum(r[0] for r in journal.restaurados.values()),
+                                 len(journal.restaurados))
+            with self.metricas.span(FASE_RESTAURACION) as span:
+                if modo_archivo:
+                    ok = self.restaurar_desde_archivo(archivo, letra_unidad, callback_error)
+                else:
+                    ok = self.restaurar_datos(self.backup_dir, letra_unidad, callback_error)
+                span.resultado(ok, **self._contadores_progreso())
+            if not ok:
                 return
-                
+
             # Paso 7: Limpieza
-            self.limpiar_backup()
+            journal.marcar_fase(FASE_COMPLETADO)
+            with self.metricas.span("limpieza"):
+                self.limpiar_backup()
+            self.progreso.completar()
             
             logger.info("Conversión segura completada exitosamente")
             callback_exito(letra_unidad)
-            
+
+        except CopiaCancelada:
+            # Los hilos de copia ya terminaron: solo aquí es seguro tocar el backup
+            if self.journal and self.journal.fase == FASE_COPIA:
+                self.limpiar_backup()
+            elif self.journal:
+                # Tras formatear, el backup es la única copia de los datos
+                self.journal.volcar()
+                logger.warning(f"Backup conservado para reanudar: {self.backup_dir}")
+            raise
         except Exception as e:
+            # El backup y el diario se conservan para poder reanudar
             logger.exception(f"Error en conversión segura: {str(e)}")
             callback_error(f"Error en conversión segura: {str(e)}")
-            try:
-                self.limpiar_backup()
-            except Exception:
-                logger.warning("Error al limpiar durante excepción")
+            if self.journal:
+                self.journal.volcar()
+                logger.info(f"Backup conservado para reanudar: {self.backup_dir}")
+
+    def _preparar_backup(self, letra_unidad, nuevo_fs, temp_base, staging, modo, callback_error):
+        """Verifica espacio, crea el directorio de backup y el diario de la conversión.
+
+        El diario siempre va en temp_base para encontrarlo al reanudar; el
+        backup se crea en el directorio de staging elegido por el plan.
+        """
+        # Paso 1: Verificar espacio disponible
+        espacio_usado = self.calcular_espacio_usado(letra_unidad)
+        if espacio_usado is None:
+            msg_error = f"No se pudo calcular espacio usado en {letra_unidad}"
+            logger.error(msg_error)
+            callback_error(msg_error)
+            return None
+
+        # Paso 2: Crear directorio temporal
+        # CORRECCIÓN: Crear directorio base si no existe
+        for directorio in (temp_base, staging):
+            if not os.path.exists(directorio):
+                try:
+                    os.makedirs(directorio)
+                    logger.info(f"Directorio temporal creado: {directorio}")
+                except Exception as e:
+                    logger.error(f"No se pudo crear directorio temporal: {str(e)}")
+                    callback_error(f"Error creando directorio temporal: {str(e)}")
+                    return None
+
+        espacio_libre = psutil.disk_usage(staging).free
+
+        # En modo archivo el espacio necesario depende de la compresión elegida
+        modo_archivo = modo == "archivo"
+        factor = 1.2
+        compresion = None
+        if modo_archivo:
+            origen = os.path.join(letra_unidad, '')
+            _, archivos = self.copy_engine.escanear(origen)
+            decision = elegir_compresion(origen, archivos, staging, espacio_libre)
+            factor *= decision['ratio']
+            compresion = decision['modo']
+
+        if espacio_libre < espacio_usado * factor:
+            msg_error = (f"Espacio insuficiente en {staging}. "
+                        f"Necesario: {self.format_bytes(espacio_usado * factor)} "
+                        f"Disponible: {self.format_bytes(espacio_libre)}")
+            logger.error(msg_error)
+            callback_error(msg_error)
+            return None
+
+        self.backup_dir = tempfile.mkdtemp(
+            prefix=f"USB_BACKUP_{nombre_archivo(letra_unidad)}_",
+            dir=staging
+        )
+        logger.info(f"Directorio backup creado: {self.backup_dir}")
+
+        return ConversionJournal.crear(
+            temp_base, letra_unidad,
+            fs_destino=nuevo_fs,
+            modo="archivo" if modo_archivo else "directorio",
+            compresion=compresion,
+            backup_dir=self.backup_dir,
+            serial_original=self.volumenes.serial(letra_unidad)
+        )
 
     def calcular_espacio_usado(self, letra_unidad):
         """Calcula el espacio usado en la unidad"""
         try:
-            return psutil.disk_usage(letra_unidad).used
+            return self.volumenes.uso(letra_unidad).used
         except Exception as e:
             logger.error(f"Error calculando espacio: {str(e)}")
             return None
@@ -276,115 +748,259 @@ class FormatConverter:
         return f"{bytes:.2f} GB"
 
     def copiar_datos(self, origen, destino, callback_error):
-        """Copia datos usando robocopy con reintentos"""
+        """Copia datos de la unidad al directorio de backup con reintentos"""
         # Usar ruta raíz de la unidad (agregar \ al final)
         origen = os.path.join(origen, '')
-        comando = f'robocopy "{origen}" "{destino}" /E /COPY:DAT /DCOPY:T /R:3 /W:5 /NP /NFL /NDL /NJH /NJS'
-        logger.info(f"Copiando datos: {comando}")
-        
-        for intento in range(MAX_RETRIES):
-            try:
-                proceso = subprocess.run(
-                    comando,
-                    shell=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    timeout=3600  # 1 hora máximo
-                )
-                
-                # Robocopy retorna 0-7 como éxito, 8+ como error
-                if proceso.returncode <= 7:
-                    logger.info(f"Copia exitosa (intento {intento+1}), código: {proceso.returncode}")
-                    return True
-                    
-                logger.warning(f"Intento {intento+1} fallido: {proceso.stderr or proceso.stdout}")
-                time.sleep(RETRY_DELAY)
-                
-            except subprocess.TimeoutExpired:
-                logger.error(f"Tiempo agotado copiando datos (intento {intento+1})")
-                
-        msg_error = f"Error al copiar datos después de {MAX_RETRIES} intentos"
-        logger.error(msg_error)
-        callback_error(msg_error)
-        return False
+        return self._copiar_con_reintentos(origen, destino, FASE_COPIA, callback_error)
+
+    def _escanear_origen(self, origen):
+        """Escanea el origen y fija los totales del progreso y del diario"""
+        directorios, archivos = self.copy_engine.escanear(origen)
+        total = sum(st.st_size for _, st in archivos)
+        if self.progreso:
+            self.progreso.establecer_totales(total, len(archivos))
+        if self.journal and self.journal.estado.get('bytes_totales') != total:
+            self.journal.estado.update(bytes_totales=total, archivos_totales=len(archivos))
+            self._elegir_cluster(archivos)
+            self.journal.guardar()
+        return directorios, archivos
+
+    def _elegir_cluster(self, archivos):
+        """Recalcula el clúster con el histograma de lo que realmente se respalda"""
+        if self.journal.estado.get('cluster_manual'):
+            return
+        histograma = HistogramaTamanos.desde_escaneo(archivos)
+        fs = self.journal.estado.get('fs_destino') or ""
+        tamano_volumen = self._tamano_volumen(self.journal.estado['unidad'])
+        elegido = elegir_tamano_cluster(histograma, fs, tamano_volumen)
+        self.journal.estado['cluster'] = elegido['cluster'] if elegido else None
+        self.journal.estado['histograma'] = histograma.como_dict()
 
-    def formatear_unidad(self, letra_unidad, fs, callback_error):
-        """Formatea la unidad usando el comando de Windows"""
+    def _callback_bytes(self):
+        return self.progreso.add if self.progreso else None
+
+    def preparar_destino(self, letra_unidad, fs, callback_error, cluster=None):
+        """Deja una unidad recién formateada y montada, sin respaldar sus datos.
+
+        La usa el clonado, que luego escribe el contenido del origen.
+        """
+        letra_unidad = self.normalizar_letra_unidad(letra_unidad)
+        if not letra_unidad or not self.unidad_lista(letra_unidad):
+            callback_error(f"Unidad {letra_unidad} no está lista o está en uso")
+            return False
+        if not self.desmontar_unidad(letra_unidad):
+            callback_error(f"No se pudo desmontar {letra_unidad} para formateo")
+            return False
+        if not self.formatear_unidad(letra_unidad, fs, callback_error, cluster):
+            return False
+        if not self.esperar_unidad_lista(letra_unidad):
+            callback_error(f"Unidad {letra_unidad} no disponible después de formateo")
+            return False
+        return True
+
+    def formatear_unidad(self, letra_unidad, fs, callback_error, cluster=None):
+        """Formatea la unidad usando el comando de Windows.
+
+        cluster es el tamaño de la unidad de asignación en bytes (/A:); con
+        None se deja el valor por defecto de format.
+        """
         # Quitar los dos puntos para el nombre del volumen
-        nombre_volumen = f"USB-{letra_unidad.strip(':')}"
-        
-        # Construir comando correctamente
-        comando = f'format {letra_unidad} /FS:{fs} /Q /V:{nombre_volumen}'
-        logger.info(f"Formateando unidad: {comando}")
+        nombre_volumen = f"USB-{nombre_archivo(letra_unidad)}"
         
+        # format.com se lanza directamente; la confirmación va por stdin
+        comando = ['format.com', letra_unidad, f'/FS:{fs}', '/Q', f'/V:{nombre_volumen}']
+        if cluster:
+            comando.append(f'/A:{formato_argumento(cluster)}')
+        logger.info(f"Formateando unidad: {' '.join(comando)}")
+        if self._cancelado.is_set():
+            return False
+
         try:
-            # Crear comando con respuesta automática Y
-            full_cmd = f'echo Y| {comando}'
-            
-            proceso = subprocess.run(
-                full_cmd,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                timeout=600  # 10 minutos máximo
-            )
+            resultado = self.runner.ejecutar(comando, timeout=600,  # 10 minutos máximo
+                                             entrada="Y\n",
+                                             al_progreso=self._callback_porcentaje(),
+                                             al_linea=lambda linea: logger.debug("format: %s", linea))
             
-            if proceso.returncode == 0:
-                logger.info("Formateo exitoso")
+            if resultado.exito:
+                logger.info(f"Formateo exitoso en {resultado.duracion:.1f}s")
                 return True
-                
-            msg_error = f"Error en formateo (código {proceso.returncode}): {proceso.stderr or proceso.stdout}"
+
+            if resultado.timeout:
+                msg_error = "Tiempo agotado en formateo"
+            else:
+                msg_error = f"Error en formateo (código {resultado.codigo}): {resultado.texto_error()}"
             logger.error(msg_error)
             callback_error(msg_error)
             return False
             
-        except subprocess.TimeoutExpired:
-            msg_error = "Tiempo agotado en formateo"
-            logger.error(msg_error)
-            callback_error(msg_error)
-            return False
         except Exception as e:
             logger.exception(f"Error inesperado al formatear: {str(e)}")
             callback_error(f"Error inesperado al formatear: {str(e)}")
             return False
 
     def restaurar_datos(self, origen, destino, callback_error):
-        """Restaura datos usando robocopy con reintentos"""
+        """Restaura datos del backup a la unidad con reintentos"""
         # Usar ruta raíz para destino (agregar \ al final)
         destino = os.path.join(destino, '')
-        comando = f'robocopy "{origen}" "{destino}" /E /COPY:DAT /DCOPY:T /R:3 /W:5 /NP /NFL /NDL /NJH /NJS'
-        logger.info(f"Restaurando datos: {comando}")
-        
+        return self._copiar_con_reintentos(origen, destino, FASE_RESTAURACION, callback_error)
+
+    def _callbacks_diario(self, fase):
+        """Construye las funciones omitir/al_completar que usan el diario en cada fase"""
+        journal = self.journal
+        if journal is None:
+            return None, None
+
+        if fase == FASE_COPIA:
+            def al_completar(relativo, st, crc):
+                journal.registrar(fase, relativo, st, crc)
+            return journal.ya_copiado, al_completar
+
+        def al_completar(relativo, st, crc):
+            esperado = journal.crc_copia(relativo)
+            if esperado is not None and crc is not None and esperado != crc:
+                logger.error(f"CRC distinto al restaurar {relativo}")
+                return False
+            journal.registrar(fase, relativo, st, crc)
+            return True
+        return (lambda relativo, st=None: journal.ya_restaurado(relativo)), al_completar
+
+    def respaldar_en_archivo(self, letra_unidad, archivo, callback_error):
+        """Vuelca la unidad a un único archivo de backup con reintentos.
+
+        El archivo tar no admite continuar a medias, así que cada intento
+        (o una reanudación en fase de copia) lo reescribe completo.
+        """
+        origen = os.path.join(letra_unidad, '')
+        _, al_completar = self._callbacks_diario(FASE_COPIA)
         for intento in range(MAX_RETRIES):
+            logger.info(f"Archivando datos: {origen} -> {archivo.ruta} (modo {archivo.modo})")
             try:
-                proceso = subprocess.run(
-                    comando,
-                    shell=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    timeout=3600  # 1 hora máximo
-                )
-                
-                if proceso.returncode <= 7:
-                    logger.info(f"Restauración exitosa (intento {intento+1}), código: {proceso.returncode}")
+                directorios, archivos = self._escanear_origen(origen)
+                stats = archivo.crear(origen, archivos, directorios,
+                                      callback_progreso=self._callback_bytes(),
+                                      al_completar=al_completar)
+                if stats.exito:
                     return True
-                    
-                logger.warning(f"Intento {intento+1} fallido: {proceso.stderr or proceso.stdout}")
-                time.sleep(RETRY_DELAY)
-                
-            except subprocess.TimeoutExpired:
-                logger.error(f"Tiempo agotado restaurando datos (intento {intento+1})")
-                
+                logger.warning(f"Intento {intento+1} fallido: {len(stats.errores)} errores")
+            except (OSError, tarfile.TarError) as e:
+                logger.warning(f"Intento {intento+1} fallido: {str(e)}")
+            self._comprobar_cancelacion()
+            self.esperas.pausa(intento)
+
+        msg_error = f"Error al archivar datos después de {MAX_RETRIES} intentos"
+        logger.error(msg_error)
+        callback_error(msg_error)
+        return False
+
+    def restaurar_desde_archivo(self, archivo, letra_unidad, callback_error):
+        """Restaura la unidad desde el archivo de backup con reintentos"""
+        destino = os.path.join(letra_unidad, '')
+        omitir, al_completar = self._callbacks_diario(FASE_RESTAURACION)
+        for intento in range(MAX_RETRIES):
+            logger.info(f"Restaurando datos: {archivo.ruta} -> {destino}")
+            try:
+                stats = archivo.extraer(destino, callback_progreso=self._callback_bytes(),
+                                        omitir=omitir, al_completar=al_completar)
+                self._registrar_errores(FASE_RESTAURACION, stats)
+                if stats.exito:
+                    return True
+                logger.warning(f"Intento {intento+1} fallido: {len(stats.errores)} errores")
+            except (OSError, tarfile.TarError) as e:
+                logger.warning(f"Intento {intento+1} fallido: {str(e)}")
+            self._comprobar_cancelacion()
+            self.esperas.pausa(intento)
+
         msg_error = f"Error al restaurar datos después de {MAX_RETRIES} intentos"
         logger.error(msg_error)
         callback_error(msg_error)
         return False
 
+    def _registrar_errores(self, fase, stats):
+        if self.journal:
+            for relativo, mensaje in stats.errores:
+                self.journal.registrar(fase, relativo, error=mensaje)
+            self.journal.volcar()
+
+    def _copiar_con_reintentos(self, origen, destino, fase, callback_error):
+        """Copia un árbol con el motor configurado reintentando hasta MAX_RETRIES veces.
+
+        Con el motor en proceso cada reintento solo repite los archivos que
+        el diario no tiene como terminados.
+        """
+        operacion = "Copia" if fase == FASE_COPIA else "Restauración"
+        for intento in range(MAX_RETRIES):
+            if config.COPY_BACKEND == "robocopy":
+                exito = self._copiar_robocopy(origen, destino, operacion, intento)
+            else:
+                exito = self._copiar_motor(origen, destino, fase, operacion, intento)
+            if exito:
+                return True
+            # Con el motor cancelado cada reintento fallaría en el acto
+            self._comprobar_cancelacion()
+            self.esperas.pausa(intento)
+
+        msg_error = f"Error en {operacion.lower()} de datos después de {MAX_RETRIES} intentos"
+        logger.error(msg_error)
+        callback_error(msg_error)
+        return False
+
+    def _copiar_motor(self, origen, destino, fase, operacion, intento):
+        """Copia usando el motor en proceso (CopyEngine)"""
+        logger.info("%s de datos: %s -> %s (%d hilos, buffer %s)", operacion, origen, destino,
+                    self.copy_engine.workers, self.format_bytes(self.copy_engine.buffer_size))
+        omitir, al_completar = self._callbacks_diario(fase)
+        try:
+            escaneo = self._escanear_origen(origen) if fase == FASE_COPIA else None
+            if fase == FASE_COPIA and self.journal and intento == 0:
+                self.progreso.saltar(sum(c[0] for c in self.journal.copiados.values()),
+                                     len(self.journal.copiados))
+            stats = self.copy_engine.copiar_arbol(origen, destino,
+                                                  callback_progreso=self._callback_bytes(),
+                                                  omitir=omitir, al_completar=al_completar,
+                                                  escaneo=escaneo)
+        except OSError as e:
+            logger.warning("Intento %d fallido: %s", intento + 1, e)
+            return False
+
+        self._registrar_errores(fase, stats)
+        if stats.exito:
+            logger.info("%s exitosa (intento %d): %d archivos (%d ya procesados), %s a %s/s",
+                        operacion, intento + 1, stats.archivos, stats.omitidos,
+                        self.format_bytes(stats.bytes), self.format_bytes(stats.throughput))
+            return True
+
+        logger.warning("Intento %d fallido: %d errores, primero: %s: %s", intento + 1,
+                       len(stats.errores), stats.errores[0][0], stats.errores[0][1])
+        return False
+
+    def _copiar_robocopy(self, origen, destino, operacion, intento):
+        """Copia usando robocopy"""
+        comando = ['robocopy', origen, destino, '/E', '/COPY:DAT', '/DCOPY:T',
+                   '/R:3', '/W:5', '/NP', '/NFL', '/NDL', '/NJH', '/NJS']
+        logger.info(f"{operacion} de datos: {' '.join(comando)}")
+        try:
+            resultado = self.runner.ejecutar(comando, timeout=3600,  # 1 hora máximo
+                                             al_linea=lambda linea: logger.debug("robocopy: %s", linea))
+        except OSError as e:
+            logger.error(f"No se pudo ejecutar robocopy: {str(e)}")
+            return False
+
+        if resultado.timeout:
+            logger.error(f"Tiempo agotado en {operacion.lower()} de datos (intento {intento+1})")
+            return False
+        # Robocopy retorna 0-7 como éxito, 8+ como error
+        if resultado.codigo <= 7 and not resultado.cancelado:
+            logger.info(f"{operacion} exitosa (intento {intento+1}), código: {resultado.codigo}")
+            return True
+
+        logger.warning(f"Intento {intento+1} fallido: {resultado.texto_error()}")
+        return False
+
     def limpiar_backup(self):
-        """Elimina el directorio de backup si existe"""
+        """Elimina el directorio de backup y su diario si existen"""
+        if self.journal:
+            self.journal.eliminar()
+            self.journal = None
         if self.backup_dir and os.path.exists(self.backup_dir):
             try:
                 shutil.rmtree(self.backup_dir, ignore_errors=True)
@@ -394,18 +1010,12 @@ class FormatConverter:
             finally:
                 self.backup_dir = None
 
-    def esperar_unidad_lista(self, letra_unidad, max_intentos=10):
+    def esperar_unidad_lista(self, letra_unidad, timeout=None):
         """Espera a que la unidad esté disponible después de formatear"""
-        for i in range(max_intentos):
-            if os.path.exists(letra_unidad):
-                try:
-                    # Verificar si podemos listar el contenido
-                    os.listdir(letra_unidad)
-                    return True
-                except OSError:
-                    logger.debug(f"Unidad {letra_unidad} aún no lista (intento {i+1})")
-            time.sleep(1)
-        return False
+        return self.esperas.esperar(
+            lambda: self._cancelado.is_set() or volumen_montado(letra_unidad),
+            timeout or config.MOUNT_READY_TIMEOUT,
+            f"montaje de {letra_unidad}")
 
     def unidad_lista(self, letra_unidad):
         """Verifica si la unidad está lista para ser formateada"""
@@ -418,8 +1028,8 @@ class FormatConverter:
             for _ in range(MAX_RETRIES):
                 if not self.hay_procesos_usando_unidad(letra_unidad):
                     return True
+                # terminar_procesos_unidad ya espera a que los procesos salgan
                 self.terminar_procesos_unidad(letra_unidad)
-                time.sleep(RETRY_DELAY)
                 
             return False
         except Exception as e:
@@ -428,118 +1038,91 @@ class FormatConverter:
         
     def hay_procesos_usando_unidad(self, letra_unidad):
         """Comprueba si hay procesos usando la unidad"""
-        letra_unidad = letra_unidad.upper()
-        if not letra_unidad.endswith(':'):
-            letra_unidad += ':'
-        
-        for proc in psutil.process_iter():
-            try:
-                archivos = proc.open_files()
-                for archivo in archivos:
-                    if archivo.path.upper().startswith(letra_unidad):
-                        logger.warning(f"Proceso usando unidad: {proc.pid} {proc.name()}")
-                        return True
-            except (psutil.AccessDenied, psutil.NoSuchProcess):
-                continue
-        return False
+        procesos = self.handle_index.procesos_en_unidad(letra_unidad)
+        for pid, nombre in procesos.items():
+            logger.warning(f"Proceso usando unidad: {pid} {nombre}")
+        return bool(procesos)
 
     def terminar_procesos_unidad(self, letra_unidad):
         """Termina procesos que usan la unidad"""
-        letra_unidad = letra_unidad.upper()
-        if not letra_unidad.endswith(':'):
-            letra_unidad += ':'
-        
-        procesos_terminados = False
-        
-        for proc in psutil.process_iter():
+        procesos = []
+        for pid in self.handle_index.procesos_en_unidad(letra_unidad):
             try:
-                archivos = proc.open_files()
-                for archivo in archivos:
-                    if archivo.path.upper().startswith(letra_unidad):
-                        logger.warning(f"Terminando proceso {proc.pid} usando {letra_unidad}")
-                        try:
-                            proc.terminate()
-                            proc.wait(timeout=2)
-                            procesos_terminados = True
-                        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.TimeoutExpired):
-                            continue
-                        break
-            except (psutil.AccessDenied, psutil.NoSuchProcess):
+                proc = psutil.Process(pid)
+                logger.warning(f"Terminando proceso {pid} usando {letra_unidad}")
+                proc.terminate()
+                procesos.append(proc)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
                 continue
-        
-        return procesos_terminados
+        if not procesos:
+            return False
+
+        # Esperar a todos a la vez en lugar de proceso a proceso
+        terminados, vivos = psutil.wait_procs(procesos, timeout=2)
+        for proc in vivos:
+            logger.warning(f"El proceso {proc.pid} no terminó a tiempo")
+        # Los handles han cambiado: la próxima consulta vuelve a escanear
+        self.handle_index.invalidate()
+        return bool(terminados)
 
     def desmontar_unidad(self, letra_unidad):
         """Desmonta la unidad forzosamente"""
         try:
-            letra_normalizada = letra_unidad.replace(":", "").strip().upper()
-            if not letra_normalizada:
-                logger.error(f"Letra de unidad inválida: {letra_unidad}")
-                return False
-                
-            ruta_dispositivo = f"\\\\.\\{letra_normalizada}:"
-            logger.debug(f"Desmontando unidad: {ruta_dispositivo}")
-            
+            logger.debug(f"Desmontando unidad: {letra_unidad}")
             self.terminar_procesos_unidad(letra_unidad)
-            time.sleep(RETRY_DELAY)
-            
-            handle = win32file.CreateFile(
-                ruta_dispositivo,
-                win32con.GENERIC_READ | win32con.GENERIC_WRITE,
-                win32con.FILE_SHARE_READ | win32con.FILE_SHARE_WRITE | win32con.FILE_SHARE_DELETE,
-                None,
-                win32con.OPEN_EXISTING,
-                0,
-                None
-            )
-            
-            win32file.DeviceIoControl(
-                handle,
-                0x90020,  # FSCTL_DISMOUNT_VOLUME
-                None,
-                None
-            )
-            
-            win32file.CloseHandle(handle)
-            logger.info(f"Unidad {letra_unidad} desmontada exitosamente")
-            return True
+
+            # Reintentar en cuanto se liberen los últimos handles en lugar de
+            # esperar un tiempo fijo
+            errores = []
+            def intentar():
+                if self._cancelado.is_set():
+                    # Se deja de esperar; quien llama comprueba la cancelación
+                    return True
+                try:
+                    self.volumenes.desmontar(letra_unidad)
+                    return True
+                except Exception as e:
+                    errores.append(e)
+                    return False
+
+            desmontada = self.esperas.esperar(intentar, config.DISMOUNT_TIMEOUT,
+                                              f"desmontaje de {letra_unidad}")
+            if self._cancelado.is_set():
+                return False
+            if desmontada:
+                logger.info(f"Unidad {letra_unidad} desmontada exitosamente")
+                return True
+            ultimo = errores[-1] if errores else "tiempo agotado"
+            logger.error(f"Error desmontando unidad {letra_unidad}: {str(ultimo)}")
+            return False
         except Exception as e:
             logger.error(f"Error desmontando unidad {letra_unidad}: {str(e)}")
             return False
 
     def actualizar_unidad(self, letra_unidad):
         """Actualiza la unidad en el sistema"""
-        try:
-            logger.debug(f"Actualizando unidad: {letra_unidad}")
-            ctypes.windll.win32api.SetVolumeMountPointW(
-                f"{letra_unidad}\\", 
-                f"{letra_unidad}\\"
-            )
-            logger.info(f"Unidad {letra_unidad} actualizada en el sistema")
-        except Exception as e:
-            logger.warning(f"Error al actualizar unidad: {str(e)}")
+        self.volumenes.actualizar(letra_unidad)
+
+    def _comprobar_cancelacion(self):
+        """Lanza CopiaCancelada si se pidió cancelar; se llama entre fases"""
+        if self._cancelado.is_set():
+            raise CopiaCancelada(MSG_CANCELADA)
 
     def cancelar_conversion(self):
-        """Cancela la conversión en progreso"""
+        """Cancela la conversión en progreso.
+
+        Interrumpe la copia, el comando y las esperas en curso; el hilo de
+        la conversión lo comprueba entre fases y no formatea después.
+        """
+        self._cancelado.set()
+        self.esperas.notificar()
         if self.current_worker:
             self.current_worker.detener()
-        if self.current_process:
-            self.current_process.terminate()
-        self.limpiar_backup()
-        self.is_converting = False
+        self.copy_engine.cancelar()
+        self.runner.cancelar()
+        # El backup lo limpia (o lo conserva) el hilo de la conversión al detenerse
         logger.info("Conversión cancelada por el usuario")
 
-# Función para obtener tipo de sistema de archivos
-def obtener_tipo_fs(letra_unidad):
-    try:
-        # Asegurar formato correcto X:
-        if len(letra_unidad) == 1:
-            letra_unidad += ':'
-        elif len(letra_unidad) == 2 and letra_unidad[1] != ':':
-            letra_unidad = letra_unidad[0] + ':'
-            
-        info_volumen = win32api.GetVolumeInformation(letra_unidad)
-        return info_volumen[4]  # Tipo de sistema de archivos
-    except Exception as e:
-        logger.error(f"Error obteniendo sistema de archivos: {str(e)}")
-        return None
\ No newline at end of file
+def cluster_manual(tamano):
+    """Proyección mínima de un clúster fijado por el usuario"""
+    return {'cluster': tamano, 'argumento': formato_argumento(tamano), 'manual': True}
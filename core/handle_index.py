@@ -0,0 +1,281 @@
+import os
+import sys
+import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import psutil
+import config
+
+logger = logging.getLogger(__name__)
+
+# Cada cuánto revisa el colector si algún proceso superó su plazo
+_INTERVALO_REVISION = 0.05  # segundos
+
+
+def normalizar_unidad(ruta):
+    """Clave de unidad de una ruta: 'E:' en Windows, el punto de montaje en POSIX"""
+    unidad = os.path.splitdrive(ruta)[0]
+    if unidad:
+        return unidad.upper()
+    return ruta.rstrip(os.sep) or os.sep
+
+
+class EscanerPsutil:
+    """Archivos abiertos vía psutil.Process.open_files(), portable.
+
+    Consulta los procesos en varios hilos y abandona los que no responden
+    dentro de timeout_proceso segundos. Si todos los hilos quedan
+    atascados en consultas abandonadas, los procesos aún en cola pasan a un
+    pool nuevo; el escaneo completo nunca dura más de timeout_total.
+    """
+    nombre = "psutil"
+
+    def __init__(self, workers=None, timeout_proceso=None, timeout_total=None):
+        self.workers = max(1, workers or config.HANDLE_SCAN_WORKERS)
+        self.timeout_proceso = timeout_proceso or config.HANDLE_SCAN_PROCESS_TIMEOUT
+        self.timeout_total = timeout_total or config.HANDLE_SCAN_TIMEOUT
+        self.omitidos = 0
+
+    @classmethod
+    def disponible(cls):
+        return True
+
+    @staticmethod
+    def _archivos_de(proc, inicios):
+        inicios[proc.pid] = time.monotonic()
+        try:
+            return [archivo.path for archivo in proc.open_files()]
+        except (psutil.AccessDenied, psutil.NoSuchProcess, psutil.ZombieProcess):
+            return []
+
+    def _nuevo_pool(self):
+        return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="handles")
+
+    def escanear(self):
+        """Devuelve {pid: (nombre, [rutas])}"""
+        inicios = {}
+        nombres = {}
+        resultado = {}
+        limite = time.monotonic() + self.timeout_total
+
+        pool = self._nuevo_pool()
+        pools = [pool]
+        # Consultas abandonadas que siguen ocupando un hilo del pool actual
+        atascados = set()
+        try:
+            pendientes = {}
+            for proc in psutil.process_iter(['name']):
+                futuro = pool.submit(self._archivos_de, proc, inicios)
+                pendientes[futuro] = proc
+                nombres[proc.pid] = proc.info.get('name') or str(proc.pid)
+
+            while pendientes:
+                hechos, _ = wait(pendientes, timeout=_INTERVALO_REVISION,
+                                 return_when=FIRST_COMPLETED)
+                for futuro in hechos:
+                    proc = pendientes.pop(futuro)
+                    try:
+                        rutas = futuro.result()
+                    except Exception as e:
+                        logger.debug("Error leyendo archivos de %s: %s", proc.pid, e)
+                        continue
+                    if rutas:
+                        resultado[proc.pid] = (nombres[proc.pid], rutas)
+
+                # Abandonar los procesos que llevan demasiado tiempo respondiendo
+                ahora = time.monotonic()
+                for futuro, proc in list(pendientes.items()):
+                    empezado = inicios.get(proc.pid)
+                    if empezado is not None and ahora - empezado > self.timeout_proceso:
+                        logger.warning("Proceso %s (%s) no respondió en %ss; se omite",
+                                       proc.pid, nombres[proc.pid], self.timeout_proceso)
+                        del pendientes[futuro]
+                        atascados.add(futuro)
+                        self.omitidos += 1
+
+                if pendientes and ahora > limite:
+                    logger.warning("Escaneo de archivos abiertos sin terminar en %ss; "
+                                   "se omiten %d procesos", self.timeout_total, len(pendientes))
+                    self.omitidos += len(pendientes)
+                    break
+
+                # Con todos los hilos atascados lo que sigue en cola nunca empezaría
+                atascados = {futuro for futuro in atascados if not futuro.done()}
+                if pendientes and len(atascados) >= self.workers:
+                    en_cola = [(futuro, proc) for futuro, proc in pendientes.items() if futuro.cancel()]
+                    if en_cola:
+                        logger.warning("Todos los hilos de escaneo están bloqueados; "
+                                       "%d procesos pasan a un pool nuevo", len(en_cola))
+                        pool = self._nuevo_pool()
+                        pools.append(pool)
+                        atascados = set()
+                        for futuro, proc in en_cola:
+                            del pendientes[futuro]
+                            pendientes[pool.submit(self._archivos_de, proc, inicios)] = proc
+        finally:
+            # No esperar a los hilos colgados; terminarán por su cuenta
+            for pool in pools:
+                pool.shutdown(wait=False, cancel_futures=True)
+        return resultado
+
+
+class EscanerProc:
+    """Archivos abiertos leyendo /proc/<pid>/fd directamente (solo Linux).
+
+    Un readlink por descriptor sin crear objetos de psutil; también cuenta
+    el directorio de trabajo, que igualmente impide desmontar. Los procesos
+    de otros usuarios sin permisos se saltan igual que con psutil.
+    """
+    nombre = "proc"
+    RAIZ = "/proc"
+
+    def __init__(self, raiz=None):
+        self.raiz = raiz or self.RAIZ
+        self.omitidos = 0
+
+    @classmethod
+    def disponible(cls):
+        return sys.platform.startswith("linux") and os.path.isdir(os.path.join(cls.RAIZ, "self", "fd"))
+
+    @staticmethod
+    def _destino(ruta):
+        try:
+            destino = os.readlink(ruta)
+        except OSError:
+            return None
+        # Sockets, pipes y anon_inode no son rutas del sistema de archivos
+        if not destino.startswith('/'):
+            return None
+        if destino.endswith(' (deleted)'):
+            destino = destino[:-len(' (deleted)')]
+        return destino
+
+    def _nombre(self, directorio, pid):
+        try:
+            with open(os.path.join(directorio, "comm")) as f:
+                return f.read().strip()
+        except OSError:
+            return str(pid)
+
+    def escanear(self):
+        """Devuelve {pid: (nombre, [rutas])}"""
+        resultado = {}
+        with os.scandir(self.raiz) as entradas:
+            for entrada in entradas:
+                if not entrada.name.isdigit():
+                    continue
+                pid = int(entrada.name)
+                rutas = []
+                try:
+                    with os.scandir(os.path.join(entrada.path, "fd")) as descriptores:
+                        for descriptor in descriptores:
+                            destino = self._destino(descriptor.path)
+                            if destino:
+                                rutas.append(destino)
+                except (PermissionError, FileNotFoundError, ProcessLookupError):
+                    # Sin permisos o el proceso terminó durante el recorrido
+                    self.omitidos += 1
+                    continue
+                except OSError:
+                    continue
+                cwd = self._destino(os.path.join(entrada.path, "cwd"))
+                if cwd:
+                    rutas.append(cwd)
+                if rutas:
+                    resultado[pid] = (self._nombre(entrada.path, pid), rutas)
+        return resultado
+
+
+ESCANERES = {
+    EscanerPsutil.nombre: EscanerPsutil,
+    EscanerProc.nombre: EscanerProc,
+}
+
+
+def elegir_escaner(nombre=None):
+    """Devuelve una instancia del escáner configurado o del más rápido disponible"""
+    nombre = nombre or config.HANDLE_SCAN_BACKEND
+    if nombre != "auto":
+        clase = ESCANERES.get(nombre)
+        if clase and clase.disponible():
+            return clase()
+        logger.warning(f"Escáner de archivos abiertos no disponible: {nombre}; se usa psutil")
+        return EscanerPsutil()
+    for clase in (EscanerProc, EscanerPsutil):
+        if clase.disponible():
+            return clase()
+    return EscanerPsutil()
+
+
+class HandleIndex:
+    """Índice de archivos abiertos por unidad construido en una sola pasada.
+
+    El escáner recorre todos los procesos una vez y el índice guarda un
+    mapa unidad -> {pid: nombre}. Se reutiliza durante ttl segundos, de
+    modo que la secuencia comprobar / terminar / desmontar hace un único
+    recorrido; invalidate() lo descarta tras terminar procesos.
+    """
+
+    def __init__(self, escaner=None, ttl=None):
+        self.escaner = escaner or elegir_escaner()
+        self.ttl = config.HANDLE_INDEX_TTL if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._indice = None
+        self._instante = 0.0
+        self.escaneos = 0
+
+    def _puntos_montaje(self):
+        """Puntos de montaje ordenados del más largo al más corto (solo POSIX)"""
+        if os.name == 'nt':
+            return []
+        try:
+            puntos = [p.mountpoint for p in psutil.disk_partitions(all=True)]
+        except Exception:
+            return []
+        return sorted(puntos, key=len, reverse=True)
+
+    def _unidad_de(self, ruta, puntos):
+        if os.name == 'nt':
+            return normalizar_unidad(ruta)
+        for punto in puntos:
+            if ruta == punto or ruta.startswith(punto.rstrip(os.sep) + os.sep):
+                return normalizar_unidad(punto)
+        return None
+
+    def escanear(self):
+        """Recorre todos los procesos y reconstruye el índice"""
+        inicio = time.monotonic()
+        puntos = self._puntos_montaje()
+        procesos = self.escaner.escanear()
+        indice = {}
+        for pid, (nombre, rutas) in procesos.items():
+            for ruta in rutas:
+                unidad = self._unidad_de(ruta, puntos)
+                if unidad:
+                    indice.setdefault(unidad, {})[pid] = nombre
+
+        with self._lock:
+            self._indice = indice
+            self._instante = time.monotonic()
+            self.escaneos += 1
+        logger.debug("Índice de archivos abiertos (%s): %d procesos, %d unidades en %.2fs",
+                     self.escaner.nombre, len(procesos), len(indice), time.monotonic() - inicio)
+        return indice
+
+    def indice(self, refrescar=False):
+        """Mapa unidad -> {pid: nombre}, reutilizado mientras no caduque"""
+        with self._lock:
+            vigente = (self._indice is not None
+                       and time.monotonic() - self._instante < self.ttl)
+            if vigente and not refrescar:
+                return self._indice
+        return self.escanear()
+
+    def procesos_en_unidad(self, unidad, refrescar=False):
+        """{pid: nombre} de los procesos con archivos abiertos en la unidad"""
+        return dict(self.indice(refrescar).get(normalizar_unidad(unidad), {}))
+
+    def invalidate(self):
+        with self._lock:
+            self._indice = None
@@ -0,0 +1,198 @@
+import os
+import glob
+import json
+import time
+import threading
+import logging
+from core.volumes import nombre_archivo
+
+logger = logging.getLogger(__name__)
+
+# Fases de una conversión con copia, en orden
+FASE_COPIA = "copia"
+FASE_FORMATEO = "formateo"
+FASE_RESTAURACION = "restauracion"
+FASE_COMPLETADO = "completado"
+
+# Entradas acumuladas antes de volcar el registro de archivos a disco
+_LOTE_ESCRITURA = 256
+_INTERVALO_ESCRITURA = 1.0  # segundos
+
+
+def _clave(relativo):
+    """Las rutas se guardan siempre con '/' para que copia y archivo tar coincidan"""
+    return relativo.replace(os.sep, '/')
+
+
+def _ruta_estado(directorio, letra_unidad, serial):
+    """Un diario por letra y serial: otra memoria en la misma letra no lo pisa"""
+    clave = f"{serial & 0xFFFFFFFF:08X}" if serial is not None else "SIN_SERIAL"
+    return os.path.join(directorio, f"USB_JOURNAL_{nombre_archivo(letra_unidad)}_{clave}.json")
+
+
+class ConversionJournal:
+    """Diario persistente de una conversión con copia de seguridad.
+
+    Se guarda en dos archivos junto al directorio de backup, con la letra
+    y el serial original del volumen en el nombre:
+    - USB_JOURNAL_X_SERIAL.json: estado general (fase, backup, seriales),
+      reescrito de forma atómica en cada cambio de fase.
+    - USB_JOURNAL_X_SERIAL.jsonl: registro de solo anexado con cada archivo
+      copiado o restaurado (tamaño, fecha y CRC32), para poder saltarlo al
+      reanudar.
+    """
+
+    def __init__(self, ruta, estado):
+        self.ruta = ruta
+        self.ruta_archivos = os.path.splitext(self.ruta)[0] + ".jsonl"
+        self.estado = estado
+        self.copiados = {}
+        self.restaurados = {}
+        self.fallidos = {}
+        self._lock = threading.Lock()
+        self._pendientes = []
+        self._ultima_escritura = time.monotonic()
+
+    @classmethod
+    def crear(cls, directorio, letra_unidad, **datos):
+        """Crea un diario nuevo descartando cualquier registro previo del volumen.
+
+        La clave del diario es datos['serial_original'] si se indica.
+        """
+        estado = {
+            'version': 2,
+            'unidad': letra_unidad,
+            'fase': FASE_COPIA,
+            'inicio': time.time(),
+        }
+        estado.update(datos)
+        journal = cls(_ruta_estado(directorio, letra_unidad, datos.get('serial_original')), estado)
+        try:
+            os.remove(journal.ruta_archivos)
+        except OSError:
+            pass
+        journal.guardar()
+        return journal
+
+    @classmethod
+    def pendientes(cls, directorio, letra_unidad=None):
+        """Diarios sin terminar de una unidad (o de todas), del más reciente al más antiguo.
+
+        Solo se lee el estado general; cargar_archivos() lee el registro de
+        archivos del diario que se vaya a reanudar.
+        """
+        if letra_unidad:
+            patron = f"USB_JOURNAL_{nombre_archivo(letra_unidad)}_*.json"
+        else:
+            patron = "USB_JOURNAL_*.json"
+        diarios = []
+        for ruta in glob.glob(os.path.join(glob.escape(directorio), patron)):
+            try:
+                with open(ruta, 'r', encoding='utf-8') as f:
+                    estado = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Diario de conversión ilegible {ruta}: {str(e)}")
+                continue
+            if estado.get('fase') != FASE_COMPLETADO:
+                diarios.append(cls(ruta, estado))
+        diarios.sort(key=lambda journal: journal.estado.get('inicio', 0), reverse=True)
+        return diarios
+
+    @property
+    def fase(self):
+        return self.estado.get('fase')
+
+    def cargar_archivos(self):
+        """Lee el registro de archivos copiados y restaurados"""
+        try:
+            with open(self.ruta_archivos, 'r', encoding='utf-8') as f:
+                for linea in f:
+                    try:
+                        entrada = json.loads(linea)
+                    except ValueError:
+                        # Última línea truncada por una caída
+                        continue
+                    destino = self.copiados if entrada['f'] == FASE_COPIA else self.restaurados
+                    if entrada.get('e'):
+                        self.fallidos[entrada['r']] = entrada['e']
+                    else:
+                        destino[entrada['r']] = (entrada['s'], entrada['m'], entrada.get('c'))
+                        self.fallidos.pop(entrada['r'], None)
+        except FileNotFoundError:
+            pass
+        logger.info(f"Diario cargado: fase {self.fase}, {len(self.copiados)} copiados, "
+                    f"{len(self.restaurados)} restaurados, {len(self.fallidos)} fallidos")
+
+    def guardar(self):
+        """Reescribe el estado general de forma atómica"""
+        self.estado['actualizado'] = time.time()
+        temporal = self.ruta + ".tmp"
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(self.estado, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, self.ruta)
+
+    def marcar_fase(self, fase, **datos):
+        """Avanza a una nueva fase y la persiste"""
+        self.volcar()
+        self.estado['fase'] = fase
+        self.estado.update(datos)
+        self.guardar()
+        logger.info(f"Diario {self.estado['unidad']}: fase {fase}")
+
+    def registrar(self, fase, relativo, st=None, crc=None, error=None):
+        """Anota un archivo terminado (o fallido) en la fase indicada"""
+        relativo = _clave(relativo)
+        tamano = st.st_size if st else 0
+        fecha = st.st_mtime_ns if st else 0
+        entrada = {'f': fase, 'r': relativo, 's': tamano, 'm': fecha}
+        if crc is not None:
+            entrada['c'] = crc
+        if error:
+            entrada['e'] = error
+        with self._lock:
+            if error:
+                self.fallidos[relativo] = error
+            else:
+                destino = self.copiados if fase == FASE_COPIA else self.restaurados
+                destino[relativo] = (tamano, fecha, crc)
+                self.fallidos.pop(relativo, None)
+            self._pendientes.append(json.dumps(entrada))
+            if (len(self._pendientes) >= _LOTE_ESCRITURA
+                    or time.monotonic() - self._ultima_escritura > _INTERVALO_ESCRITURA):
+                self._volcar_sin_lock()
+
+    def volcar(self):
+        """Escribe en disco las entradas pendientes del registro de archivos"""
+        with self._lock:
+            self._volcar_sin_lock()
+
+    def _volcar_sin_lock(self):
+        if self._pendientes:
+            with open(self.ruta_archivos, 'a', encoding='utf-8') as f:
+                f.write("\n".join(self._pendientes) + "\n")
+            self._pendientes = []
+        self._ultima_escritura = time.monotonic()
+
+    def ya_copiado(self, relativo, st):
+        """Indica si el archivo ya está en el backup con el mismo tamaño y fecha"""
+        previo = self.copiados.get(_clave(relativo))
+        return previo is not None and previo[0] == st.st_size and previo[1] == st.st_mtime_ns
+
+    def ya_restaurado(self, relativo):
+        return _clave(relativo) in self.restaurados
+
+    def crc_copia(self, relativo):
+        previo = self.copiados.get(_clave(relativo))
+        return previo[2] if previo else None
+
+    def eliminar(self):
+        """Borra el diario una vez terminada o descartada la conversión"""
+        with self._lock:
+            self._pendientes = []
+        for ruta in (self.ruta, self.ruta_archivos):
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
@@ -0,0 +1,269 @@
+import os
+import json
+import struct
+import logging
+import traceback
+import contextvars
+from array import array
+from contextlib import contextmanager
+
+# Fase y unidad del código que está registrando, heredadas por los registros
+_fase = contextvars.ContextVar("fase_registro", default=None)
+_unidad = contextvars.ContextVar("unidad_registro", default=None)
+
+# Fases conocidas con su código en el índice (0 = sin fase, 255 = otra)
+FASES_REGISTRO = ("verificacion", "planificacion", "espacio", "copia", "desmontaje", "formateo",
+                  "espera_montaje", "restauracion", "limpieza", "conversion", "benchmark")
+_SIN_FASE = 0
+_OTRA_FASE = 255
+_CODIGOS_FASE = {fase: codigo for codigo, fase in enumerate(FASES_REGISTRO, start=1)}
+
+# Entrada del índice: posición y longitud de la línea, instante, nivel, fase y unidad
+# (hash de 8 bytes de la unidad normalizada: las rutas comparten los primeros caracteres)
+_BYTES_UNIDAD = 8
+_ENTRADA = struct.Struct(f"<QIdBB{_BYTES_UNIDAD}s")
+# Forma parte del nombre del índice para no leer uno escrito con otro formato de entrada
+_VERSION_INDICE = 2
+_ENTRADAS_POR_LECTURA = 65536
+
+
+@contextmanager
+def contexto_registro(fase=None, unidad=None):
+    """Etiqueta con fase y/o unidad todos los registros emitidos dentro del bloque"""
+    tokens = []
+    if fase is not None:
+        tokens.append((_fase, _fase.set(fase)))
+    if unidad is not None:
+        tokens.append((_unidad, _unidad.set(unidad)))
+    try:
+        yield
+    finally:
+        for variable, token in reversed(tokens):
+            variable.reset(token)
+
+
+class FiltroContexto(logging.Filter):
+    """Copia la fase y la unidad del contexto al registro en el hilo que registra.
+
+    Se respetan las indicadas con extra={'fase': ..., 'unidad': ...}.
+    """
+
+    def filter(self, record):
+        if getattr(record, 'fase', None) is None:
+            record.fase = _fase.get()
+        if getattr(record, 'unidad', None) is None:
+            record.unidad = _unidad.get()
+        return True
+
+
+def registro_a_dict(record):
+    datos = {
+        't': record.created,
+        'nivel': record.levelname,
+        'logger': record.name,
+        'fase': getattr(record, 'fase', None),
+        'unidad': getattr(record, 'unidad', None),
+        'hilo': record.threadName,
+        'mensaje': record.getMessage(),
+    }
+    if record.exc_info:
+        datos['excepcion'] = "".join(traceback.format_exception(*record.exc_info)).rstrip()
+    return datos
+
+
+def _codigo_unidad(unidad):
+    """Clave de la unidad en el índice: 'e:\\' y 'E:' comparten clave"""
+    unidad = (unidad or "").strip()
+    if not unidad:
+        return bytes(_BYTES_UNIDAD)
+    # Import diferido: el registro se configura antes del primer pintado y
+    # hasta que hay una unidad ningún registro necesita el hash
+    import hashlib
+
+    normalizada = (unidad.rstrip('\\/') or unidad).upper()
+    return hashlib.blake2b(normalizada.encode('utf-8'), digest_size=_BYTES_UNIDAD).digest()
+
+
+def ruta_indice(ruta):
+    return f"{ruta}.idx{_VERSION_INDICE}"
+
+
+class JsonlIndexedHandler(logging.Handler):
+    """Escribe un registro JSON por línea y su entrada de tamaño fijo en un índice.
+
+    El índice (<archivo>.idx2) permite contar, filtrar por nivel, fase y
+    unidad, y saltar a cualquier registro sin leer el JSONL. Rota por
+    tamaño como RotatingFileHandler, moviendo cada archivo junto con su
+    índice.
+    """
+
+    def __init__(self, ruta, max_bytes=0, copias=0):
+        super().__init__()
+        self.ruta = ruta
+        self.max_bytes = max_bytes
+        self.copias = copias
+        self._datos = None
+        self._indice = None
+
+    def _abrir(self):
+        self._datos = open(self.ruta, 'ab')
+        self._indice = open(ruta_indice(self.ruta), 'ab')
+        # Descartar una entrada a medio escribir si el proceso murió escribiéndola
+        sobrante = self._indice.tell() % _ENTRADA.size
+        if sobrante:
+            self._indice.truncate(self._indice.tell() - sobrante)
+            self._indice.seek(0, os.SEEK_END)
+
+    def _cerrar_archivos(self):
+        for archivo in (self._datos, self._indice):
+            if archivo:
+                archivo.close()
+        self._datos = self._indice = None
+
+    def _rotar(self):
+        self._cerrar_archivos()
+        # archivo.N pasa a archivo.N+1 (con su índice); la copia más antigua se pierde
+        nombres = [self.ruta] + [f"{self.ruta}.{i}" for i in range(1, self.copias + 1)]
+        for archivo in (nombres[-1], ruta_indice(nombres[-1])):
+            if os.path.exists(archivo):
+                os.remove(archivo)
+        for origen, destino in reversed(list(zip(nombres, nombres[1:]))):
+            for a, b in ((origen, destino), (ruta_indice(origen), ruta_indice(destino))):
+                if os.path.exists(a):
+                    os.replace(a, b)
+        self._abrir()
+
+    def emit(self, record):
+        try:
+            linea = (json.dumps(registro_a_dict(record), ensure_ascii=False, default=str)
+                     + "\n").encode('utf-8')
+            self.acquire()
+            try:
+                if self._datos is None:
+                    self._abrir()
+                posicion = self._datos.tell()
+                if self.max_bytes and posicion and posicion + len(linea) > self.max_bytes:
+                    self._rotar()
+                    posicion = self._datos.tell()
+                self._datos.write(linea)
+                self._datos.flush()
+                fase = getattr(record, 'fase', None)
+                codigo_fase = _CODIGOS_FASE.get(fase, _OTRA_FASE) if fase else _SIN_FASE
+                # El índice se escribe después: una entrada siempre apunta a datos completos
+                self._indice.write(_ENTRADA.pack(posicion, len(linea), record.created,
+                                                 min(record.levelno, 255), codigo_fase,
+                                                 _codigo_unidad(getattr(record, 'unidad', None))))
+                self._indice.flush()
+            finally:
+                self.release()
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self.acquire()
+        try:
+            self._cerrar_archivos()
+        finally:
+            self.release()
+        super().close()
+
+
+def generaciones(ruta):
+    """Archivos JSONL existentes, del actual al más antiguo"""
+    archivos = [ruta] if os.path.exists(ruta) else []
+    i = 1
+    while os.path.exists(f"{ruta}.{i}"):
+        archivos.append(f"{ruta}.{i}")
+        i += 1
+    return archivos
+
+
+class LogIndex:
+    """Acceso paginado a un JSONL a través de su índice.
+
+    Solo se guardan en memoria la posición y la longitud de los registros
+    que cumplen el filtro; cada página se lee del disco cuando se pide.
+    actualizar() incorpora los registros añadidos desde la última vez.
+    """
+
+    def __init__(self, ruta, nivel_minimo=logging.NOTSET, fase=None, unidad=None):
+        self.ruta = ruta
+        self._entradas_leidas = 0
+        self._tamano_indice = 0
+        self.filtrar(nivel_minimo, fase, unidad)
+
+    def filtrar(self, nivel_minimo=logging.NOTSET, fase=None, unidad=None):
+        """Cambia el filtro y vuelve a recorrer el índice"""
+        self.nivel_minimo = nivel_minimo
+        self.fase = fase
+        self.unidad = unidad
+        if fase is None:
+            self._codigo_fase = None
+        else:
+            self._codigo_fase = _CODIGOS_FASE.get(fase, _OTRA_FASE)
+        self._codigo_unidad = _codigo_unidad(unidad) if unidad else None
+        self._posiciones = array('Q')
+        self._longitudes = array('I')
+        self._entradas_leidas = 0
+        self._tamano_indice = 0
+        self.actualizar()
+
+    def __len__(self):
+        return len(self._posiciones)
+
+    def actualizar(self):
+        """Lee las entradas nuevas del índice; devuelve cuántos registros nuevos cumplen el filtro"""
+        try:
+            tamano = os.path.getsize(ruta_indice(self.ruta))
+        except OSError:
+            tamano = 0
+        if tamano < self._tamano_indice:
+            # El archivo rotó: se empieza de cero con el nuevo
+            self._posiciones = array('Q')
+            self._longitudes = array('I')
+            self._entradas_leidas = 0
+        antes = len(self._posiciones)
+        completas = tamano // _ENTRADA.size
+        if completas > self._entradas_leidas:
+            with open(ruta_indice(self.ruta), 'rb') as f:
+                f.seek(self._entradas_leidas * _ENTRADA.size)
+                pendientes = completas - self._entradas_leidas
+                while pendientes:
+                    cantidad = min(pendientes, _ENTRADAS_POR_LECTURA)
+                    bloque = f.read(cantidad * _ENTRADA.size)
+                    self._agregar(bloque)
+                    pendientes -= cantidad
+            self._entradas_leidas = completas
+        self._tamano_indice = tamano
+        return len(self._posiciones) - antes
+
+    def _agregar(self, bloque):
+        nivel_minimo = self.nivel_minimo
+        codigo_fase = self._codigo_fase
+        codigo_unidad = self._codigo_unidad
+        posiciones = self._posiciones
+        longitudes = self._longitudes
+        for posicion, longitud, _, nivel, fase, unidad in _ENTRADA.iter_unpack(bloque):
+            if nivel < nivel_minimo:
+                continue
+            if codigo_fase is not None and fase != codigo_fase:
+                continue
+            if codigo_unidad is not None and unidad != codigo_unidad:
+                continue
+            posiciones.append(posicion)
+            longitudes.append(longitud)
+
+    def leer(self, inicio, cantidad):
+        """Registros [inicio, inicio + cantidad) del resultado filtrado como diccionarios"""
+        fin = min(len(self._posiciones), inicio + cantidad)
+        registros = []
+        if inicio >= fin:
+            return registros
+        with open(self.ruta, 'rb') as f:
+            for i in range(inicio, fin):
+                f.seek(self._posiciones[i])
+                try:
+                    registros.append(json.loads(f.read(self._longitudes[i])))
+                except ValueError:
+                    registros.append({'nivel': "ERROR", 'mensaje': "<registro ilegible>"})
+        return registros
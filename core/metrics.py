@@ -0,0 +1,273 @@
+import os
+import re
+import json
+import time
+import threading
+import logging
+from contextlib import contextmanager
+import config
+from core.log_index import contexto_registro
+from core.volumes import nombre_archivo
+
+logger = logging.getLogger(__name__)
+
+_PREFIJO = "changeformatusb"
+
+# Muestra del formato de texto: nombre{etiquetas} valor
+_MUESTRA = re.compile(r'^(\w+)\{(.*)\} \S+$')
+_ETIQUETA_DRIVE = re.compile(r'^drive="((?:[^"\\]|\\.)*)"')
+
+# Duraciones acumuladas de operaciones del proceso (p. ej. enumeración)
+_observaciones = {}
+_lock_observaciones = threading.Lock()
+
+# Última conversión de cada unidad de este proceso: el archivo de Prometheus
+# se reescribe bajo el mismo lock para que una exportación antigua no pise a
+# una más reciente, y conserva las unidades que escribieron otros procesos
+_series = {}
+_lock_series = threading.Lock()
+
+
+def observar(nombre, duracion):
+    """Acumula una duración en el resumen del proceso"""
+    with _lock_observaciones:
+        cuenta, suma, maximo = _observaciones.get(nombre, (0, 0.0, 0.0))
+        _observaciones[nombre] = (cuenta + 1, suma + duracion, max(maximo, duracion))
+
+
+@contextmanager
+def medir(nombre):
+    """Mide un bloque y lo acumula con observar()"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        observar(nombre, time.perf_counter() - inicio)
+
+
+def observaciones():
+    """{nombre: (cuenta, suma, máximo)} de las operaciones medidas"""
+    with _lock_observaciones:
+        return dict(_observaciones)
+
+
+class Span:
+    """Tramo medido de una conversión con sus atributos (bytes, archivos...)"""
+
+    def __init__(self, nombre, **atributos):
+        self.nombre = nombre
+        self.atributos = dict(atributos)
+        self.inicio = time.time()
+        self._inicio_monotonico = time.perf_counter()
+        self.duracion = None
+        self.exito = True
+
+    def anotar(self, **atributos):
+        self.atributos.update(atributos)
+
+    def resultado(self, exito, **atributos):
+        """Marca el tramo como fallido o correcto y añade atributos"""
+        self.exito = bool(exito)
+        self.anotar(**atributos)
+
+    def cerrar(self):
+        self.duracion = time.perf_counter() - self._inicio_monotonico
+
+    def como_dict(self):
+        return {
+            'nombre': self.nombre,
+            'inicio': self.inicio,
+            'duracion': self.duracion,
+            'exito': self.exito,
+            **self.atributos,
+        }
+
+
+class ConversionMetrics:
+    """Tramos temporizados de una conversión y su exportación.
+
+    Cada fase se envuelve en span(); al terminar, exportar() escribe un
+    registro JSON por conversión y reescribe el archivo de texto de
+    Prometheus (con la última conversión de cada unidad) que puede leer el
+    textfile collector de node_exporter. Las unidades que ya estaban en el
+    archivo y este proceso no ha convertido se mantienen, así no se
+    pierden al reiniciar ni cuando la línea de comandos y la interfaz
+    exportan a la vez.
+    """
+
+    def __init__(self, unidad, fs_destino=None):
+        self.unidad = unidad
+        self.fs_destino = fs_destino
+        self.fs_origen = None
+        self.estrategia = None
+        self.inicio = time.time()
+        self._inicio_monotonico = time.perf_counter()
+        self.duracion = None
+        self.exito = None
+        self.espera_total = 0.0
+        self.spans = []
+
+    @contextmanager
+    def span(self, nombre, **atributos):
+        tramo = Span(nombre, **atributos)
+        try:
+            with contexto_registro(fase=nombre):
+                yield tramo
+        except BaseException:
+            tramo.exito = False
+            raise
+        finally:
+            tramo.cerrar()
+            self.spans.append(tramo)
+            logger.debug(f"Tramo {nombre}: {tramo.duracion:.3f}s {tramo.atributos}")
+
+    def finalizar(self, exito):
+        self.exito = bool(exito)
+        self.duracion = time.perf_counter() - self._inicio_monotonico
+
+    def como_dict(self):
+        return {
+            'unidad': self.unidad,
+            'fs_origen': self.fs_origen,
+            'fs_destino': self.fs_destino,
+            'estrategia': self.estrategia,
+            'inicio': self.inicio,
+            'duracion': self.duracion,
+            'exito': self.exito,
+            'espera_total': self.espera_total,
+            'spans': [tramo.como_dict() for tramo in self.spans],
+        }
+
+    def exportar(self, directorio=None, ruta_prometheus=None):
+        """Escribe el registro JSON y el archivo de Prometheus; devuelve la ruta del JSON"""
+        directorio = directorio or config.METRICS_DIR
+        ruta_prometheus = ruta_prometheus or config.METRICS_PROMETHEUS_FILE
+        try:
+            os.makedirs(directorio, exist_ok=True)
+            marca = time.strftime("%Y%m%d_%H%M%S", time.localtime(self.inicio))
+            ruta_json = os.path.join(directorio, f"conversion_{marca}_{nombre_archivo(self.unidad)}.json")
+            _escribir_atomico(ruta_json, json.dumps(self.como_dict(), indent=2, ensure_ascii=False))
+            with _lock_series:
+                _series[self.unidad or ""] = self
+                if ruta_prometheus:
+                    previas = _muestras_previas(ruta_prometheus, set(_series))
+                    _escribir_atomico(ruta_prometheus, texto_prometheus(list(_series.values()), previas))
+            return ruta_json
+        except OSError as e:
+            logger.warning(f"No se pudieron exportar las métricas: {str(e)}")
+            return None
+
+
+def _escribir_atomico(ruta, contenido):
+    """El collector no debe leer nunca un archivo a medio escribir"""
+    # Import diferido: este módulo se carga antes del primer pintado de la interfaz
+    import tempfile
+
+    directorio = os.path.dirname(ruta)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directorio or None,
+                                     prefix=f"{os.path.basename(ruta)}.", suffix=".tmp",
+                                     delete=False) as f:
+        temporal = f.name
+        try:
+            f.write(contenido)
+        except BaseException:
+            f.close()
+            os.remove(temporal)
+            raise
+    try:
+        os.replace(temporal, ruta)
+    except OSError:
+        os.remove(temporal)
+        raise
+
+
+def _muestras_previas(ruta, unidades):
+    """{métrica: [líneas]} del archivo de Prometheus de las unidades que no están en `unidades`"""
+    try:
+        with open(ruta, encoding='utf-8') as f:
+            lineas = f.read().splitlines()
+    except FileNotFoundError:
+        return {}
+    except OSError as e:
+        logger.warning(f"No se pudo leer {ruta}: {str(e)}")
+        return {}
+    muestras = {}
+    for linea in lineas:
+        coincidencia = _MUESTRA.match(linea)
+        if not coincidencia:
+            continue
+        # Las muestras sin unidad (operaciones del proceso) se regeneran siempre
+        drive = _ETIQUETA_DRIVE.search(coincidencia.group(2))
+        if drive is None:
+            continue
+        unidad = re.sub(r'\\(.)', lambda m: '\n' if m.group(1) == 'n' else m.group(1), drive.group(1))
+        if unidad not in unidades:
+            muestras.setdefault(coincidencia.group(1), []).append(linea)
+    return muestras
+
+
+def _etiquetas(**etiquetas):
+    partes = []
+    for clave, valor in etiquetas.items():
+        valor = str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        partes.append(f'{clave}="{valor}"')
+    return "{" + ",".join(partes) + "}"
+
+
+def texto_prometheus(conversiones, previas=None):
+    """Formato de exposición de texto de Prometheus con la última conversión de cada unidad.
+
+    previas ({métrica: [líneas]}) son muestras ya escritas de otras
+    unidades que se mantienen junto a las nuevas.
+    """
+    lineas = []
+    previas = previas or {}
+    if isinstance(conversiones, ConversionMetrics):
+        conversiones = [conversiones]
+    conversiones = sorted(conversiones, key=lambda m: m.unidad or "")
+
+    def metrica(nombre, tipo, ayuda, muestras):
+        lineas.append(f"# HELP {_PREFIJO}_{nombre} {ayuda}")
+        lineas.append(f"# TYPE {_PREFIJO}_{nombre} {tipo}")
+        nuevas = [f"{_PREFIJO}_{nombre}{_etiquetas(**etiquetas)} {valor}" for etiquetas, valor in muestras]
+        lineas.extend(sorted(nuevas + previas.get(f"{_PREFIJO}_{nombre}", [])))
+
+    def base(m):
+        return {'drive': m.unidad or "", 'fs': m.fs_destino or ""}
+
+    metrica("conversion_duration_seconds", "gauge", "Duración de la última conversión",
+            [(base(m), f"{m.duracion or 0:.6f}") for m in conversiones])
+    metrica("conversion_success", "gauge", "1 si la última conversión terminó bien",
+            [(base(m), 1 if m.exito else 0) for m in conversiones])
+    metrica("conversion_wait_seconds", "gauge", "Tiempo esperando montajes y reintentos",
+            [(base(m), f"{m.espera_total:.6f}") for m in conversiones])
+    metrica("conversion_timestamp_seconds", "gauge", "Inicio de la última conversión",
+            [(base(m), f"{m.inicio:.3f}") for m in conversiones])
+
+    # Una fase puede repetirse (reintentos): se suman sus tramos
+    fases = []
+    for m in conversiones:
+        por_fase = {}
+        for tramo in m.spans:
+            duracion, bytes_, archivos = por_fase.get(tramo.nombre, (0.0, 0, 0))
+            por_fase[tramo.nombre] = (duracion + (tramo.duracion or 0),
+                                      bytes_ + tramo.atributos.get('bytes', 0),
+                                      archivos + tramo.atributos.get('archivos', 0))
+        fases.extend((dict(drive=m.unidad or "", phase=fase), valores) for fase, valores in por_fase.items())
+    metrica("phase_duration_seconds", "gauge", "Duración de cada fase de la última conversión",
+            [(etiquetas, f"{valores[0]:.6f}") for etiquetas, valores in fases])
+    metrica("phase_bytes", "gauge", "Bytes movidos en cada fase de la última conversión",
+            [(etiquetas, valores[1]) for etiquetas, valores in fases if valores[1]])
+    metrica("phase_files", "gauge", "Archivos procesados en cada fase de la última conversión",
+            [(etiquetas, valores[2]) for etiquetas, valores in fases if valores[2]])
+
+    resumen = observaciones()
+    if resumen:
+        lineas.append(f"# HELP {_PREFIJO}_operation_seconds Duración de operaciones del proceso")
+        lineas.append(f"# TYPE {_PREFIJO}_operation_seconds summary")
+        for nombre, (cuenta, suma, _) in sorted(resumen.items()):
+            lineas.append(f"{_PREFIJO}_operation_seconds_sum{_etiquetas(operation=nombre)} {suma:.6f}")
+            lineas.append(f"{_PREFIJO}_operation_seconds_count{_etiquetas(operation=nombre)} {cuenta}")
+    return "\n".join(lineas) + "\n"
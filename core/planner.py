@@ -0,0 +1,187 @@
+import logging
+import config
+from core.journal import FASE_COPIA, FASE_FORMATEO, FASE_RESTAURACION
+from core.progress import FASE_ESPERA, FASE_CONVERSION
+from core.cluster_size import elegir_tamano_cluster
+
+logger = logging.getLogger(__name__)
+
+# Estrategias de conversión
+ESTRATEGIA_SIN_CAMBIOS = "sin_cambios"
+ESTRATEGIA_IN_SITU = "convertir_in_situ"
+ESTRATEGIA_SOLO_FORMATO = "solo_formato"
+ESTRATEGIA_COPIA = "copia"
+
+MODO_DIRECTORIO = "directorio"
+MODO_ARCHIVO = "archivo"
+
+# Margen de espacio libre exigido en el staging sobre los datos a respaldar
+FACTOR_ESPACIO = 1.2
+
+# Conversiones que convert.exe hace sin perder datos
+_CONVERSIONES_IN_SITU = {("FAT", "NTFS"), ("FAT32", "NTFS")}
+
+
+def formatos_equivalentes(actual, nuevo):
+    """Compara sistemas de archivos teniendo en cuenta que FAT32 se informa como FAT"""
+    if actual == nuevo:
+        return True
+    return {actual, nuevo} == {"FAT", "FAT32"}
+
+
+class Plan:
+    """Estrategia elegida con su estimación por pasos"""
+
+    def __init__(self, estrategia, pasos, staging=None, modo=None, motivo=""):
+        self.estrategia = estrategia
+        self.pasos = list(pasos)  # [(fase, segundos)]
+        self.staging = staging
+        self.modo = modo
+        self.motivo = motivo
+        self.alternativas = []
+        self.datos = {}
+        # Proyección del clúster elegido (cluster_size.evaluar) o None para el por defecto
+        self.cluster = None
+
+    @property
+    def segundos(self):
+        return sum(segundos for _, segundos in self.pasos)
+
+    def descripcion(self):
+        if self.estrategia == ESTRATEGIA_SIN_CAMBIOS:
+            return "La unidad ya tiene el formato pedido"
+        if self.estrategia == ESTRATEGIA_IN_SITU:
+            return "Conversión en el sitio sin mover datos"
+        if self.estrategia == ESTRATEGIA_SOLO_FORMATO:
+            return "Formateo directo (la unidad no tiene datos)"
+        modo = "en un archivo tar" if self.modo == MODO_ARCHIVO else "en un directorio"
+        return f"Copia de seguridad {modo} en {self.staging}, formateo y restauración"
+
+    def descripcion_cluster(self):
+        """Clúster elegido con su desperdicio proyectado, o None si no se formatea"""
+        if self.estrategia not in (ESTRATEGIA_SOLO_FORMATO, ESTRATEGIA_COPIA):
+            return None
+        if not self.cluster:
+            return "por defecto"
+        texto = self.cluster['argumento']
+        if self.cluster.get('manual'):
+            return f"{texto} (manual)"
+        desperdicio = self.cluster['desperdicio'] / (1024 * 1024)
+        return f"{texto} ({desperdicio:.1f} MB de desperdicio estimado)"
+
+    def como_dict(self):
+        return {
+            'estrategia': self.estrategia,
+            'segundos': self.segundos,
+            'pasos': self.pasos,
+            'staging': self.staging,
+            'modo': self.modo,
+            'motivo': self.motivo,
+            'descripcion': self.descripcion(),
+            'datos': self.datos,
+            'cluster': self.cluster,
+            'alternativas': [
+                {'estrategia': alt.estrategia, 'segundos': alt.segundos,
+                 'staging': alt.staging, 'modo': alt.modo}
+                for alt in self.alternativas
+            ],
+        }
+
+    def __repr__(self):
+        return f"Plan({self.estrategia}, {self.segundos:.0f}s, staging={self.staging}, modo={self.modo})"
+
+
+class ConversionPlanner:
+    """Estima el coste de cada estrategia viable y elige la más rápida.
+
+    Solo se proponen caminos seguros: convertir en el sitio únicamente
+    cuando convert.exe lo admite y formatear sin copia solo si la unidad no
+    tiene datos. Los throughputs y la duración del formateo son los medidos
+    para el dispositivo si se conocen; si no, los valores por defecto de config.
+    """
+
+    def __init__(self, throughput_lectura=None, throughput_escritura=None,
+                 throughput_staging=None, coste_por_archivo=None, segundos_formateo=None):
+        self.throughput_lectura = throughput_lectura or config.DEFAULT_READ_THROUGHPUT
+        self.throughput_escritura = throughput_escritura or config.DEFAULT_WRITE_THROUGHPUT
+        self.throughput_staging = throughput_staging or config.DEFAULT_STAGING_THROUGHPUT
+        self.coste_por_archivo = (config.PER_FILE_OVERHEAD_SECONDS
+                                  if coste_por_archivo is None else coste_por_archivo)
+        self.segundos_formateo = segundos_formateo or config.FORMAT_ESTIMATE_SECONDS
+
+    def _pasos_formateo(self):
+        return [(FASE_FORMATEO, self.segundos_formateo),
+                (FASE_ESPERA, config.MOUNT_ESTIMATE_SECONDS)]
+
+    def _plan_copia(self, bytes_totales, archivos, staging, modo):
+        # Copia: limitada por el más lento entre leer la USB y escribir el staging
+        copia = bytes_totales / min(self.throughput_lectura, self.throughput_staging)
+        restauracion = bytes_totales / min(self.throughput_staging, self.throughput_escritura)
+        # En modo archivo el staging escribe un solo archivo: el coste por
+        # archivo solo se paga en la USB
+        lados = 1 if modo == MODO_ARCHIVO else 2
+        sobrecoste = archivos * self.coste_por_archivo * lados / 2
+        pasos = [(FASE_COPIA, copia + sobrecoste)]
+        pasos += self._pasos_formateo()
+        pasos.append((FASE_RESTAURACION, restauracion + sobrecoste))
+        return Plan(ESTRATEGIA_COPIA, pasos, staging=staging, modo=modo)
+
+    def planificar(self, fs_actual, fs_destino, bytes_totales, archivos, tiene_datos, stagings,
+                   histograma=None, tamano_volumen=0):
+        """Devuelve el Plan más rápido con las alternativas viables en plan.alternativas.
+
+        stagings es una lista de (directorio, espacio_libre). Con el
+        histograma de tamaños de archivo se elige también el clúster para
+        los planes que formatean. Lanza ValueError si no hay ningún camino
+        seguro (p. ej. sin espacio para el backup).
+        """
+        fs_actual = (fs_actual or "").upper()
+        fs_destino = fs_destino.upper()
+        datos = {'fs_actual': fs_actual, 'fs_destino': fs_destino,
+                 'bytes': bytes_totales, 'archivos': archivos, 'tiene_datos': tiene_datos}
+
+        if formatos_equivalentes(fs_actual, fs_destino):
+            plan = Plan(ESTRATEGIA_SIN_CAMBIOS, [], motivo="formato equivalente")
+            plan.datos = datos
+            return plan
+
+        candidatos = []
+        if (fs_actual, fs_destino) in _CONVERSIONES_IN_SITU:
+            candidatos.append(Plan(ESTRATEGIA_IN_SITU,
+                                   [(FASE_CONVERSION, config.CONVERT_ESTIMATE_SECONDS),
+                                    (FASE_ESPERA, config.MOUNT_ESTIMATE_SECONDS)],
+                                   motivo="convert.exe conserva los datos"))
+        if not tiene_datos:
+            candidatos.append(Plan(ESTRATEGIA_SOLO_FORMATO, self._pasos_formateo(),
+                                   motivo="unidad vacía"))
+        else:
+            necesario = bytes_totales * FACTOR_ESPACIO
+            for directorio, libre in stagings:
+                if libre < necesario:
+                    logger.debug(f"Staging {directorio} descartado: {libre} bytes libres "
+                                 f"de {necesario:.0f} necesarios")
+                    continue
+                # Ante un empate gana el modo configurado
+                modos = sorted((MODO_DIRECTORIO, MODO_ARCHIVO), key=lambda m: m != config.BACKUP_MODE)
+                for modo in modos:
+                    plan = self._plan_copia(bytes_totales, archivos, directorio, modo)
+                    plan.motivo = f"{libre} bytes libres en el staging"
+                    candidatos.append(plan)
+
+        if not candidatos:
+            raise ValueError("No hay espacio suficiente para la copia de seguridad en "
+                             "ningún directorio de staging")
+
+        if histograma is not None:
+            cluster = elegir_tamano_cluster(histograma, fs_destino, tamano_volumen,
+                                            self.throughput_escritura)
+            for plan in candidatos:
+                if plan.estrategia == ESTRATEGIA_COPIA:
+                    plan.cluster = cluster
+
+        candidatos.sort(key=lambda plan: plan.segundos)
+        elegido = candidatos[0]
+        elegido.alternativas = candidatos[1:]
+        elegido.datos = datos
+        logger.info(f"Plan elegido: {elegido} entre {len(candidatos)} candidatos")
+        return elegido
@@ -0,0 +1,227 @@
+import time
+import threading
+import logging
+import config
+from core.journal import FASE_COPIA, FASE_FORMATEO, FASE_RESTAURACION
+
+logger = logging.getLogger(__name__)
+
+# Fases del progreso que no se registran en el diario
+FASE_ESPERA = "espera"
+FASE_CONVERSION = "conversion"
+
+# Fases que mueven datos y cuyo progreso se mide en bytes
+FASES_DE_DATOS = (FASE_COPIA, FASE_RESTAURACION)
+
+# Ventana mínima para calcular el throughput instantáneo
+_VENTANA_INSTANTANEA = 0.5  # segundos
+# Peso de cada muestra nueva en la media exponencial
+_ALFA_SUAVIZADO = 0.2
+
+
+class ProgressTracker:
+    """Acumula el progreso de una conversión y calcula throughput y ETA.
+
+    El porcentaje total se pondera por la duración estimada de cada fase,
+    de modo que una copia de 30 minutos pesa más que un formateo rápido.
+    Las estimaciones se corrigen con el throughput medido a medida que
+    avanza la copia. add() es seguro desde varios hilos y solo actualiza
+    contadores: el callback recibe un snapshot en los cambios de fase y de
+    avance, y el progreso de los bytes lo muestrea quien lee (ProgressBus
+    con esta instancia como fuente) llamando a snapshot() a su ritmo.
+    """
+
+    def __init__(self, fases, bytes_totales=0, archivos_totales=0, callback=None,
+                 throughput_lectura=None, throughput_escritura=None):
+        self.fases = list(fases)
+        # Throughputs medidos del dispositivo (benchmark) o los de config
+        self.throughput_lectura = throughput_lectura or config.DEFAULT_READ_THROUGHPUT
+        self.throughput_escritura = throughput_escritura or config.DEFAULT_WRITE_THROUGHPUT
+        self.bytes_totales = bytes_totales
+        self.archivos_totales = archivos_totales
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._inicio = time.monotonic()
+        # Crece con cada cambio; el lector sabe si hay algo nuevo sin calcular nada
+        self.cambios = 0
+
+        self.fase = None
+        self._indice_fase = -1
+        self._inicio_fase = self._inicio
+        self._bytes_fase = 0
+        self._archivos_fase = 0
+        self._porcentaje = 0.0
+        self._avance = None
+
+        self._muestra_tiempo = self._inicio
+        self._muestra_bytes = 0
+        self._instantaneo = 0.0
+        self._suavizado = 0.0
+
+        self._estimaciones = {fase: self._estimacion_inicial(fase) for fase in self.fases}
+
+    def _estimacion_inicial(self, fase):
+        """Duración estimada en segundos antes de tener mediciones"""
+        if fase == FASE_COPIA:
+            return self.bytes_totales / self.throughput_lectura
+        if fase == FASE_RESTAURACION:
+            return self.bytes_totales / self.throughput_escritura
+        if fase == FASE_FORMATEO:
+            return config.FORMAT_ESTIMATE_SECONDS
+        if fase == FASE_ESPERA:
+            return config.MOUNT_ESTIMATE_SECONDS
+        if fase == FASE_CONVERSION:
+            return config.CONVERT_ESTIMATE_SECONDS
+        return 1.0
+
+    def establecer_totales(self, bytes_totales, archivos_totales):
+        """Fija el volumen de datos a mover cuando se conoce tras el escaneo"""
+        with self._lock:
+            self.bytes_totales = bytes_totales
+            self.archivos_totales = archivos_totales
+            for fase in FASES_DE_DATOS:
+                if fase in self._estimaciones and fase != self.fase:
+                    self._estimaciones[fase] = self._estimacion_inicial(fase)
+            self.cambios += 1
+        self._publicar()
+
+    def iniciar_fase(self, fase):
+        """Pasa a la fase indicada; las anteriores se dan por completadas"""
+        with self._lock:
+            ahora = time.monotonic()
+            if self.fase is not None:
+                # Se conservan las correcciones por throughput y la duración
+                # real sustituye a la estimación
+                self._estimaciones = self._estimaciones_actuales(ahora)
+                self._estimaciones[self.fase] = ahora - self._inicio_fase
+            self.fase = fase
+            self._indice_fase = self.fases.index(fase) if fase in self.fases else self._indice_fase
+            self._inicio_fase = ahora
+            self._bytes_fase = 0
+            self._archivos_fase = 0
+            self._avance = None
+            self._muestra_tiempo = ahora
+            self._muestra_bytes = 0
+            self._instantaneo = 0.0
+            self._suavizado = 0.0
+            self.cambios += 1
+        self._publicar()
+
+    def add(self, bytes_hechos=0, archivos=0):
+        """Suma bytes y archivos a la fase actual (llamado desde hilos de copia)"""
+        with self._lock:
+            self._bytes_fase += bytes_hechos
+            self._archivos_fase += archivos
+            ahora = time.monotonic()
+            intervalo = ahora - self._muestra_tiempo
+            if intervalo >= _VENTANA_INSTANTANEA:
+                self._instantaneo = (self._bytes_fase - self._muestra_bytes) / intervalo
+                if self._suavizado:
+                    self._suavizado += _ALFA_SUAVIZADO * (self._instantaneo - self._suavizado)
+                else:
+                    self._suavizado = self._instantaneo
+                self._muestra_tiempo = ahora
+                self._muestra_bytes = self._bytes_fase
+            self.cambios += 1
+
+    def avance(self, fraccion):
+        """Fracción completada que informa la propia fase (p. ej. el % de format)"""
+        with self._lock:
+            self._avance = min(1.0, max(0.0, fraccion))
+            self.cambios += 1
+        self._publicar()
+
+    def saltar(self, bytes_hechos, archivos):
+        """Cuenta como hechos datos ya procesados en una ejecución anterior"""
+        with self._lock:
+            self._bytes_fase += bytes_hechos
+            self._archivos_fase += archivos
+            self._muestra_bytes = self._bytes_fase
+            self._muestra_tiempo = time.monotonic()
+            self.cambios += 1
+        self._publicar()
+
+    def _fraccion_fase(self, ahora):
+        """Fracción completada de la fase actual"""
+        if self.fase in FASES_DE_DATOS and self.bytes_totales:
+            return min(1.0, self._bytes_fase / self.bytes_totales)
+        if self._avance is not None:
+            return self._avance
+        estimada = self._estimaciones.get(self.fase, 1.0)
+        if estimada <= 0:
+            return 1.0
+        # Fases sin medida propia: avanzar con el tiempo sin llegar al final
+        return min(0.95, (ahora - self._inicio_fase) / estimada)
+
+    def _restante_fase(self, ahora):
+        """Segundos restantes estimados de la fase actual"""
+        if self.fase in FASES_DE_DATOS:
+            velocidad = self._suavizado or self._instantaneo
+            if velocidad > 0:
+                return max(0.0, (self.bytes_totales - self._bytes_fase) / velocidad)
+        elif self._avance:
+            transcurrido = ahora - self._inicio_fase
+            return transcurrido / self._avance * (1.0 - self._avance)
+        return max(0.0, self._estimaciones.get(self.fase, 0.0) - (ahora - self._inicio_fase))
+
+    def _estimaciones_actuales(self, ahora):
+        """Estimaciones corregidas con el throughput medido, sin modificar las guardadas"""
+        estimaciones = dict(self._estimaciones)
+        if self.fase in FASES_DE_DATOS and self._suavizado:
+            # Ajustar la estimación de la fase con el throughput medido
+            estimaciones[self.fase] = ahora - self._inicio_fase + self._restante_fase(ahora)
+            if self.fase == FASE_COPIA and FASE_RESTAURACION in estimaciones:
+                # La escritura en USB suele ser más lenta que la lectura
+                factor = config.DEFAULT_READ_THROUGHPUT / config.DEFAULT_WRITE_THROUGHPUT
+                estimaciones[FASE_RESTAURACION] = self.bytes_totales / self._suavizado * factor
+        return estimaciones
+
+    def snapshot(self):
+        """Estado actual del progreso como diccionario"""
+        with self._lock:
+            ahora = time.monotonic()
+            estimaciones = self._estimaciones_actuales(ahora)
+            total_estimado = sum(estimaciones.values()) or 1.0
+            hecho = 0.0
+            restante = 0.0
+            for indice, fase in enumerate(self.fases):
+                peso = estimaciones[fase] / total_estimado
+                if indice < self._indice_fase:
+                    hecho += peso
+                elif indice == self._indice_fase:
+                    hecho += peso * self._fraccion_fase(ahora)
+                    restante += self._restante_fase(ahora)
+                else:
+                    restante += estimaciones[fase]
+
+            # El porcentaje no retrocede aunque cambien las estimaciones
+            self._porcentaje = max(self._porcentaje, min(hecho * 100.0, 100.0))
+            return {
+                'fase': self.fase,
+                'porcentaje': self._porcentaje,
+                'bytes_hechos': self._bytes_fase,
+                'bytes_totales': self.bytes_totales,
+                'archivos_hechos': self._archivos_fase,
+                'archivos_totales': self.archivos_totales,
+                'throughput_instantaneo': self._instantaneo,
+                'throughput_medio': self._suavizado,
+                'eta': restante,
+                'transcurrido': ahora - self._inicio,
+            }
+
+    def completar(self):
+        """Marca la conversión como terminada"""
+        with self._lock:
+            if self.fase is not None:
+                self._estimaciones[self.fase] = time.monotonic() - self._inicio_fase
+            self._indice_fase = len(self.fases)
+            self._porcentaje = 100.0
+            self.cambios += 1
+        self._publicar()
+
+    def _publicar(self):
+        if self.callback:
+            try:
+                self.callback(self.snapshot())
+            except Exception as e:
+                logger.warning("Error publicando progreso: %s", e)
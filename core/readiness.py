@@ -0,0 +1,97 @@
+import os
+import time
+import threading
+import logging
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def volumen_montado(letra_unidad):
+    """True si la unidad existe y se puede listar su raíz"""
+    raiz = os.path.join(letra_unidad, '')
+    if not os.path.exists(raiz):
+        return False
+    try:
+        os.listdir(raiz)
+        return True
+    except OSError:
+        return False
+
+
+class ReadinessWaiter:
+    """Esperas hasta que se cumple una condición, sin pausas fijas.
+
+    La condición se comprueba con un intervalo que empieza en milisegundos
+    y crece exponencialmente hasta un máximo; un evento de dispositivo
+    (notificar()) despierta la espera para comprobarla enseguida. Acumula
+    el tiempo total esperado para poder informarlo por conversión.
+    """
+
+    def __init__(self, inicial=None, maximo=None, factor=2.0):
+        self.inicial = inicial or config.READY_WAIT_INITIAL
+        self.maximo = maximo or config.READY_WAIT_MAX_INTERVAL
+        self.factor = factor
+        self._despertar = threading.Event()
+        self.total_esperado = 0.0
+        self.esperas = 0
+
+    def notificar(self, evento=None):
+        """Despierta la espera en curso (p. ej. al llegar un evento de volumen)"""
+        self._despertar.set()
+
+    def observar(self, device_watcher):
+        """Suscribe la espera a los eventos de un DeviceWatcher"""
+        if device_watcher is not None:
+            device_watcher.suscribir(self.notificar)
+
+    def dejar_de_observar(self, device_watcher):
+        if device_watcher is not None:
+            device_watcher.desuscribir(self.notificar)
+
+    def reiniciar(self):
+        """Pone a cero el contador al empezar una conversión nueva"""
+        self.total_esperado = 0.0
+        self.esperas = 0
+
+    def esperar(self, condicion, timeout, descripcion=""):
+        """Espera hasta que condicion() sea cierta o pase timeout; devuelve si se cumplió"""
+        inicio = time.monotonic()
+        limite = inicio + timeout
+        intervalo = self.inicial
+        self._despertar.clear()
+        try:
+            while True:
+                try:
+                    if condicion():
+                        return True
+                except OSError as e:
+                    logger.debug("Condición de espera '%s' falló: %s", descripcion, e)
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    logger.warning(f"Tiempo agotado esperando {descripcion} ({timeout}s)")
+                    return False
+                if self._despertar.wait(min(intervalo, restante)):
+                    # Tras un evento se vuelve a empezar con intervalos cortos
+                    self._despertar.clear()
+                    intervalo = self.inicial
+                else:
+                    intervalo = min(intervalo * self.factor, self.maximo)
+        finally:
+            duracion = time.monotonic() - inicio
+            self.total_esperado += duracion
+            self.esperas += 1
+            logger.debug("Espera '%s': %.3fs", descripcion, duracion)
+
+    def pausa(self, intento):
+        """Pausa exponencial entre reintentos tras un error.
+
+        Un evento de dispositivo la acorta: si la unidad vuelve a aparecer
+        no tiene sentido seguir esperando.
+        """
+        duracion = min(config.RETRY_BACKOFF_INITIAL * (2 ** intento), config.RETRY_BACKOFF_MAX)
+        inicio = time.monotonic()
+        self._despertar.clear()
+        self._despertar.wait(duracion)
+        self.total_esperado += time.monotonic() - inicio
+        self.esperas += 1
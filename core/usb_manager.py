@@ -1,33 +1,251 @@
-import wmi
-import psutil
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+import config
+from core.metrics import medir
+
+logger = logging.getLogger(__name__)
+
+# Estados de un dispositivo en la instantánea
+STATE_READY = "ready"
+STATE_PROBING = "probing"
+
+def probe_drive(letter):
+    """Lee uso, sistema de archivos y etiqueta de una unidad.
+
+    Puede bloquear varios segundos con unidades o hubs lentos, por eso se
+    ejecuta en el pool de sondeo y nunca en el hilo de enumeración.
+    """
+    import psutil
+    import win32api
+    from core.volumes import obtener_tipo_fs
+    from core.device_history import formato_serial
+
+    usage = psutil.disk_usage(letter)
+    try:
+        label, serial = win32api.GetVolumeInformation(letter + '\\')[:2]
+    except Exception:
+        label = serial = None
+    return {
+        'filesystem': obtener_tipo_fs(letter),
+        'size': usage.total,
+        'free': usage.free,
+        'label': label,
+        'serial': formato_serial(serial),
+    }
 
 class USBManager:
-    def __init__(self):
+    def __init__(self, ttl=None):
         self.cached_devices = []
-        
-    def get_usb_devices(self):
-        """Obtiene dispositivos USB con información detallada usando WMI y psutil"""
+        # Instantánea versionada de los dispositivos con índice por letra
+        self.ttl = config.DEVICE_CACHE_TTL if ttl is None else ttl
+        self.version = 0
+        self.devices_by_letter = {}
+        self._snapshot_time = 0.0
+        self._snapshot_valid = False
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Sondeo de unidades en paralelo con plazo por unidad
+        self.probe_timeout = config.DEVICE_PROBE_TIMEOUT
+        self._probe_pool = ThreadPoolExecutor(max_workers=config.DEVICE_PROBE_WORKERS,
+                                              thread_name_prefix="probe")
+        self._probes = {}
+        # Sondeos terminados por letra: (momento, future); la siguiente
+        # enumeración los usa en lugar de volver a sondear y esperar
+        self.probe_result_ttl = config.DEVICE_PROBE_RESULT_TTL
+        self._probe_results = {}
+        self._change_callbacks = []
+        # Historial persistente: cada serial se registra una vez por sesión.
+        # sqlite3 se importa aquí: la interfaz crea el gestor tras el primer pintado
+        import sqlite3
+        from core.device_history import DeviceHistory
+
+        try:
+            self.history = DeviceHistory()
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"Historial de dispositivos no disponible: {e}")
+            self.history = None
+        self._registered_serials = set()
+        self._degraded_serials = set()
+
+    def add_change_callback(self, callback):
+        """callback() se llama (desde otro hilo) cuando termina un sondeo tardío"""
+        self._change_callbacks.append(callback)
+
+    def get_usb_devices(self, force=False):
+        """Devuelve los dispositivos USB, usando la instantánea si sigue vigente"""
+        with self._lock:
+            if (not force and self._snapshot_valid
+                    and time.monotonic() - self._snapshot_time < self.ttl):
+                self.cache_hits += 1
+                return list(self.cached_devices)
+            self.cache_misses += 1
+
+        with medir("enumeracion_dispositivos"):
+            usb_drives = self._enumerate_devices()
+        if usb_drives is None:
+            return list(self.cached_devices)  # Devuelve caché en caso de error
+
+        with self._lock:
+            if usb_drives != self.cached_devices:
+                self.version += 1
+            self.cached_devices = usb_drives
+            self.devices_by_letter = {drive['letter']: drive for drive in usb_drives}
+            self._snapshot_time = time.monotonic()
+            self._snapshot_valid = True
+            # Sondeos que terminaron mientras se preparaba esta instantánea:
+            # _probe_done no vio la unidad como pendiente y no avisó
+            late = [drive['letter'] for drive in usb_drives
+                    if drive.get('state') == STATE_PROBING and drive['letter'] in self._probe_results]
+        if late:
+            self._notify_change(f"sondeo de {', '.join(late)} terminado")
+        return list(usb_drives)
+
+    def get_device(self, letter, refresh=True):
+        """Busca un dispositivo por letra de unidad en la instantánea.
+
+        Con refresh=False no se enumera aunque la instantánea haya caducado.
+        """
+        if refresh:
+            self.get_usb_devices()
+        return self.devices_by_letter.get(letter)
+
+    def invalidate(self, reason=""):
+        """Fuerza una nueva enumeración en la próxima consulta"""
+        with self._lock:
+            self._snapshot_valid = False
+        logger.debug("Instantánea de dispositivos invalidada: %s", reason)
+
+    def cache_stats(self):
+        return {
+            'version': self.version,
+            'hits': self.cache_hits,
+            'misses': self.cache_misses,
+            'devices': len(self.cached_devices),
+        }
+
+    def shutdown(self):
+        """Libera el pool de sondeo sin esperar a unidades colgadas"""
+        self._change_callbacks.clear()
+        self._probe_pool.shutdown(wait=False, cancel_futures=True)
+
+    def _enumerate_devices(self):
+        """Lista las unidades extraíbles con WMI y las sondea en paralelo.
+
+        Las unidades que no responden dentro de probe_timeout se devuelven
+        con state="probing" y los datos de WMI; su sondeo sigue en segundo
+        plano y al terminar invalida la instantánea. Su resultado se guarda
+        probe_result_ttl segundos para que la siguiente enumeración lo use
+        sin sondear ni esperar de nuevo.
+        """
+        # WMI (y pythoncom) tarda en cargarse: solo al enumerar, fuera del hilo de la interfaz
+        import wmi
+
         try:
-            usb_drives = []
             c = wmi.WMI()
+            found = []
             for drive in c.Win32_LogicalDisk(DriveType=2):
-                try:
-                    # Obtener información adicional con psutil
-                    usage = psutil.disk_usage(drive.DeviceID)
-                    
-                    device_info = {
-                        'letter': drive.DeviceID,
-                        'filesystem': drive.FileSystem or "Desconocido",
-                        'size': drive.Size or usage.total,
-                        'free': drive.FreeSpace or usage.free,
-                        'label': drive.VolumeName or "Sin etiqueta"
-                    }
-                    usb_drives.append(device_info)
-                except Exception as e:
-                    print(f"Error procesando dispositivo: {e}")
-                    continue
-            self.cached_devices = usb_drives
-            return usb_drives
+                found.append({
+                    'letter': drive.DeviceID,
+                    'filesystem': drive.FileSystem or "Desconocido",
+                    'size': drive.Size or 0,
+                    'free': drive.FreeSpace or 0,
+                    'label': drive.VolumeName or "Sin etiqueta",
+                })
         except Exception as e:
-            print(f"Error obteniendo dispositivos USB: {e}")
-            return self.cached_devices  # Devuelve caché en caso de error
\ No newline at end of file
+            logger.error(f"Error obteniendo dispositivos USB: {e}")
+            return None
+
+        futures = {}
+        with self._lock:
+            ahora = time.monotonic()
+            for letter, (momento, _) in list(self._probe_results.items()):
+                if ahora - momento > self.probe_result_ttl:
+                    del self._probe_results[letter]
+            for base in found:
+                future = self._probes.get(base['letter'])
+                if future is None and base['letter'] in self._probe_results:
+                    future = self._probe_results[base['letter']][1]
+                if future is None:
+                    future = self._probe_pool.submit(probe_drive, base['letter'])
+                    future.add_done_callback(
+                        lambda f, letter=base['letter']: self._probe_done(letter, f))
+                    self._probes[base['letter']] = future
+                futures[base['letter']] = future
+
+        wait(futures.values(), timeout=self.probe_timeout)
+
+        usb_drives = []
+        for base in found:
+            future = futures[base['letter']]
+            if not future.done():
+                logger.warning(f"Sondeo lento de {base['letter']}; se mostrará como pendiente")
+                usb_drives.append(dict(base, state=STATE_PROBING))
+                continue
+            try:
+                probe = future.result()
+            except Exception as e:
+                logger.warning(f"Error procesando dispositivo {base['letter']}: {e}")
+                continue
+            usb_drives.append({
+                'letter': base['letter'],
+                'filesystem': probe['filesystem'] or base['filesystem'],
+                'size': probe['size'] or base['size'],
+                'free': probe['free'],
+                'label': probe['label'] or base['label'],
+                'serial': probe['serial'],
+                'degraded': probe['serial'] in self._degraded_serials,
+                'state': STATE_READY,
+            })
+            self._register_in_history(base['letter'], probe['serial'])
+        return usb_drives
+
+    def _register_in_history(self, letter, serial):
+        """Registra en segundo plano una unidad no vista en esta sesión"""
+        if self.history is None or not serial:
+            return
+        with self._lock:
+            if serial in self._registered_serials:
+                return
+            self._registered_serials.add(serial)
+        self._probe_pool.submit(self._record_device, letter, serial)
+
+    def _record_device(self, letter, serial):
+        import sqlite3
+
+        try:
+            device_id = self.history.dispositivo_de_unidad(letter)
+            degraded = self.history.degradado(device_id)
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"Error registrando {letter} en el historial: {e}")
+            return
+        if degraded:
+            logger.warning(f"{letter} (serial {serial}) escribe mucho más lento que antes; "
+                           f"puede estar degradada")
+            with self._lock:
+                self._degraded_serials.add(serial)
+            self._notify_change(f"{letter} marcada como degradada")
+
+    def _probe_done(self, letter, future):
+        with self._lock:
+            if self._probes.get(letter) is future:
+                del self._probes[letter]
+            if future.cancelled():
+                return
+            self._probe_results[letter] = (time.monotonic(), future)
+            # Si la instantánea pendiente aún no se ha publicado, avisa get_usb_devices
+            late = any(d['letter'] == letter and d.get('state') == STATE_PROBING
+                       for d in self.cached_devices)
+        if late:
+            # El sondeo terminó después de publicar la unidad como pendiente
+            self._notify_change(f"sondeo de {letter} terminado")
+
+    def _notify_change(self, reason):
+        self.invalidate(reason)
+        for callback in list(self._change_callbacks):
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Error notificando cambio de dispositivos: {e}")
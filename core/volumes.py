@@ -0,0 +1,120 @@
+import os
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def nombre_archivo(unidad):
+    """Texto de la unidad apto para nombres de archivo: 'E:' -> 'E', un directorio -> su nombre"""
+    base = os.path.basename((unidad or "").rstrip('\\/:')) or (unidad or "")
+    return re.sub(r'[^0-9A-Za-z_-]+', '_', base).strip('_') or "unidad"
+
+
+class VolumenesWindows:
+    """Operaciones de sistema sobre volúmenes que necesita FormatConverter.
+
+    Es la única parte del convertidor que habla con pywin32, que se importa
+    al usarlo (sin él no hay desmontaje ni información de volumen). Con
+    core.fake_drive.VolumenesSimulados y un FakeCommandRunner el flujo
+    completo (copia, formateo y restauración) funciona sobre directorios.
+    """
+
+    def normalizar(self, letra_unidad):
+        """Normaliza la letra de unidad a formato 'X:', o None si no es válida"""
+        if not letra_unidad:
+            return None
+
+        letra_unidad = letra_unidad.strip().upper()
+        if len(letra_unidad) == 1:
+            return f"{letra_unidad}:"
+        elif len(letra_unidad) == 2 and letra_unidad[1] == ':':
+            return letra_unidad
+        return None
+
+    def sistema_archivos(self, letra_unidad):
+        return obtener_tipo_fs(letra_unidad)
+
+    def serial(self, letra_unidad):
+        return obtener_serial_volumen(letra_unidad)
+
+    def uso(self, letra_unidad):
+        """(total, used, free) del volumen como psutil.disk_usage"""
+        import psutil
+        return psutil.disk_usage(os.path.join(letra_unidad, ''))
+
+    def directorio_staging(self):
+        """Directorio base para los backups temporales y los diarios"""
+        unidad_sistema = os.environ.get('SystemDrive', 'C:')
+        # CORRECCIÓN: Asegurar que la unidad termine con \
+        if not unidad_sistema.endswith('\\'):
+            unidad_sistema += '\\'
+        return os.path.join(unidad_sistema, "Temp")
+
+    def desmontar(self, letra_unidad):
+        """Abre el volumen y envía FSCTL_DISMOUNT_VOLUME; lanza excepción si falla"""
+        import win32con
+        import win32file
+
+        ruta_dispositivo = f"\\\\.\\{letra_unidad.replace(':', '').strip().upper()}:"
+        handle = win32file.CreateFile(
+            ruta_dispositivo,
+            win32con.GENERIC_READ | win32con.GENERIC_WRITE,
+            win32con.FILE_SHARE_READ | win32con.FILE_SHARE_WRITE | win32con.FILE_SHARE_DELETE,
+            None,
+            win32con.OPEN_EXISTING,
+            0,
+            None
+        )
+        try:
+            win32file.DeviceIoControl(
+                handle,
+                0x90020,  # FSCTL_DISMOUNT_VOLUME
+                None,
+                None
+            )
+        finally:
+            win32file.CloseHandle(handle)
+
+    def actualizar(self, letra_unidad):
+        """Actualiza la unidad en el sistema"""
+        import ctypes
+
+        try:
+            logger.debug(f"Actualizando unidad: {letra_unidad}")
+            ctypes.windll.win32api.SetVolumeMountPointW(
+                f"{letra_unidad}\\",
+                f"{letra_unidad}\\"
+            )
+            logger.info(f"Unidad {letra_unidad} actualizada en el sistema")
+        except Exception as e:
+            logger.warning(f"Error al actualizar unidad: {str(e)}")
+
+
+# Función para obtener tipo de sistema de archivos
+def obtener_tipo_fs(letra_unidad):
+    try:
+        import win32api
+
+        # Asegurar formato correcto X:
+        if len(letra_unidad) == 1:
+            letra_unidad += ':'
+        elif len(letra_unidad) == 2 and letra_unidad[1] != ':':
+            letra_unidad = letra_unidad[0] + ':'
+
+        info_volumen = win32api.GetVolumeInformation(letra_unidad)
+        return info_volumen[4]  # Tipo de sistema de archivos
+    except Exception as e:
+        logger.error(f"Error obteniendo sistema de archivos: {str(e)}")
+        return None
+
+
+def obtener_serial_volumen(letra_unidad):
+    """Devuelve el número de serie del volumen o None si no se puede leer"""
+    try:
+        import win32api
+
+        return win32api.GetVolumeInformation(os.path.join(letra_unidad, ''))[1]
+    except Exception as e:
+        logger.warning(f"Error obteniendo serial de volumen: {str(e)}")
+        return None
@@ -1,26 +1,126 @@
+import atexit
+import copy
+import glob
 import logging
+import logging.handlers
 import os
-from datetime import datetime
+import queue
+import threading
+from collections import deque
+import config
+from core.log_index import JsonlIndexedHandler, FiltroContexto
+
+
+class RingBufferHandler(logging.Handler):
+    """Guarda en memoria los últimos registros para consultarlos sin leer el archivo"""
+
+    def __init__(self, capacidad=None):
+        super().__init__()
+        self.registros = deque(maxlen=capacidad or config.LOG_RING_SIZE)
+        self._lock_registros = threading.Lock()
+        self.total = 0  # registros recibidos desde el arranque
+
+    def emit(self, record):
+        with self._lock_registros:
+            self.registros.append(record)
+            self.total += 1
+
+    def recientes(self, cantidad=None):
+        """Los últimos registros, del más antiguo al más reciente"""
+        with self._lock_registros:
+            registros = list(self.registros)
+        return registros[-cantidad:] if cantidad else registros
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que deja el formateo del mensaje al hilo del listener.
+
+    El QueueHandler estándar formatea (msg % args y la traza) en el hilo
+    que llama al logger; aquí solo se encola una copia del registro, así
+    el coste de formatear tampoco recae en los hilos de copia o de
+    enumeración. Los argumentos no deben mutarse después de registrarlos.
+    """
+
+    def prepare(self, record):
+        return copy.copy(record)
+
+
+def _limpiar_logs_antiguos(log_dir):
+    """Borra los debug_<fecha>.log de versiones anteriores, salvo los más recientes"""
+    antiguos = sorted(glob.glob(os.path.join(log_dir, "debug_*.log")), key=os.path.getmtime)
+    for ruta in antiguos[:-config.LOG_BACKUP_COUNT or None]:
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+
+
+# True mientras el listener de setup_logger() está en marcha
+_listener_activo = False
+_lock_listener = threading.Lock()
+
+
+def detener_registro(listener):
+    """Escribe los registros pendientes y detiene el listener (se puede llamar varias veces)"""
+    global _listener_activo
+    with _lock_listener:
+        if not _listener_activo:
+            return
+        _listener_activo = False
+    listener.stop()
+
 
 def setup_logger():
-    log_dir = "logs"
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
-    
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    log_file = os.path.join(log_dir, f"debug_{timestamp}.log")
-    
-    logger = logging.getLogger("ChangeFormatUSB")
-    logger.setLevel(logging.DEBUG)
-    
-    # Formato
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    
-    # Handler para archivo
-    file_handler = logging.FileHandler(log_file)
+    """Envía todos los registros a una cola que vacía un hilo en segundo plano.
+
+    El archivo rota por tamaño conservando LOG_BACKUP_COUNT copias y un
+    búfer circular en memoria guarda los registros más recientes. En
+    paralelo se escribe un JSONL indexado con la fase y la unidad de cada
+    registro para el visor de logs. Los handlers se ponen en el logger
+    raíz para recoger también los de core.*.
+    """
+    log_dir = config.LOG_DIR
+    os.makedirs(log_dir, exist_ok=True)
+    _limpiar_logs_antiguos(log_dir)
+
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(name)s - %(message)s')
+
+    # Handler para archivo, con rotación por tamaño
+    file_handler = logging.handlers.RotatingFileHandler(
+        os.path.join(log_dir, config.LOG_FILE),
+        maxBytes=config.LOG_MAX_BYTES,
+        backupCount=config.LOG_BACKUP_COUNT,
+        encoding='utf-8',
+        delay=True
+    )
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-    
-    return logger
 
-logger = setup_logger()
\ No newline at end of file
+    jsonl_handler = JsonlIndexedHandler(os.path.join(log_dir, config.LOG_JSONL_FILE),
+                                        config.LOG_JSONL_MAX_BYTES, config.LOG_BACKUP_COUNT)
+
+    ring_buffer = RingBufferHandler()
+    ring_buffer.setFormatter(formatter)
+
+    cola = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(cola, file_handler, jsonl_handler, ring_buffer,
+                                              respect_handler_level=True)
+    global _listener_activo
+    with _lock_listener:
+        listener.start()
+        _listener_activo = True
+    # Vaciar la cola antes de salir para no perder los últimos registros
+    atexit.register(detener_registro, listener)
+
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, config.LOG_LEVEL))
+    queue_handler = LazyQueueHandler(cola)
+    # La fase y la unidad se leen del contexto en el hilo que registra
+    queue_handler.addFilter(FiltroContexto())
+    root.addHandler(queue_handler)
+
+    logger = logging.getLogger("ChangeFormatUSB")
+    logger.setLevel(getattr(logging, config.LOG_LEVEL))
+    return logger, ring_buffer, listener
+
+
+logger, ring_buffer, listener = setup_logger()
@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def directorios_temporales(tmp_path, monkeypatch):
+    """Métricas e historial de cada prueba van a un directorio propio"""
+    metricas = tmp_path / "metrics"
+    monkeypatch.setattr(config, "METRICS_DIR", str(metricas))
+    monkeypatch.setattr(config, "METRICS_PROMETHEUS_FILE", str(metricas / "changeformatusb.prom"))
+    monkeypatch.setattr(config, "DEVICE_HISTORY_DB", str(metricas / "device_history.sqlite3"))
+    monkeypatch.setattr(config, "RETRY_BACKOFF_INITIAL", 0.01)
+    return tmp_path
+
+
+def crear_arbol(raiz, archivos):
+    """Escribe {ruta_relativa: bytes} bajo raiz"""
+    for relativo, contenido in archivos.items():
+        ruta = os.path.join(raiz, relativo)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        with open(ruta, 'wb') as f:
+            f.write(contenido)
+
+
+def leer_arbol(raiz, omitir=()):
+    """{ruta_relativa con '/': bytes} de todos los archivos bajo raiz"""
+    contenido = {}
+    for directorio, _, nombres in os.walk(raiz):
+        for nombre in nombres:
+            ruta = os.path.join(directorio, nombre)
+            relativo = os.path.relpath(ruta, raiz).replace(os.sep, '/')
+            if relativo not in omitir:
+                with open(ruta, 'rb') as f:
+                    contenido[relativo] = f.read()
+    return contenido
@@ -0,0 +1,62 @@
+import os
+
+from conftest import crear_arbol, leer_arbol
+from core.clone import FanOutCloner
+from core.fake_drive import VolumenesSimulados
+
+ARCHIVOS = {
+    "a.bin": os.urandom(700_000),
+    "sub/b.bin": os.urandom(300_000),
+    "sub/vacio.txt": b"",
+}
+
+
+def test_clona_el_origen_en_todos_los_destinos(tmp_path):
+    origen = str(tmp_path / "origen")
+    crear_arbol(origen, ARCHIVOS)
+    destinos = [str(tmp_path / nombre) for nombre in ("D", "E", "F")]
+
+    resultados = FanOutCloner(origen, destinos, bloque=64 * 1024, ventana=2).clonar()
+
+    assert [r['estado'] for r in resultados] == ["completado"] * 3
+    for destino in destinos:
+        assert leer_arbol(destino) == ARCHIVOS
+
+
+def test_archivo_ilegible_se_marca_en_cada_destino(tmp_path):
+    origen = str(tmp_path / "origen")
+    crear_arbol(origen, ARCHIVOS)
+    destinos = [str(tmp_path / nombre) for nombre in ("D", "E")]
+
+    def formatear(destino, archivos):
+        # Desaparece del origen entre el escaneo y la lectura
+        try:
+            os.remove(os.path.join(origen, "sub", "b.bin"))
+        except FileNotFoundError:
+            pass
+
+    clonador = FanOutCloner(origen, destinos, formatear=formatear, bloque=64 * 1024)
+    resultados = clonador.clonar()
+
+    assert [relativo for relativo, _ in clonador.errores_origen] == [os.path.join("sub", "b.bin")]
+    for resultado, destino in zip(resultados, destinos):
+        assert resultado['estado'] == "incompleto"
+        assert [relativo for relativo, _ in resultado['incompletos']] == [os.path.join("sub", "b.bin")]
+        esperado = {k: v for k, v in ARCHIVOS.items() if k != "sub/b.bin"}
+        assert leer_arbol(destino) == esperado
+
+
+def test_clona_una_unidad_simulada_en_varias(tmp_path):
+    volumenes = VolumenesSimulados(str(tmp_path / "staging"))
+    origen = volumenes.crear(tmp_path / "E", "FAT32")
+    crear_arbol(origen, ARCHIVOS)
+    destinos = [volumenes.crear(tmp_path / nombre, "FAT32") for nombre in "FGH"]
+
+    resultados = FanOutCloner(origen, destinos,
+                              formatear=lambda destino, archivos: volumenes.formatear(destino, "EXFAT"),
+                              bloque=64 * 1024, ventana=2).clonar()
+
+    assert [r['estado'] for r in resultados] == ["completado"] * 3
+    for destino in destinos:
+        assert volumenes.sistema_archivos(destino) == "EXFAT"
+        assert leer_arbol(destino) == ARCHIVOS
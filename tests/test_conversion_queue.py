@@ -0,0 +1,125 @@
+import os
+import time
+import itertools
+import threading
+
+import pytest
+
+from conftest import crear_arbol, leer_arbol
+from core.conversion_queue import ConversionQueue, EN_CURSO, COMPLETADO, CANCELADO
+from core.fake_drive import VolumenesSimulados
+from core.format_converter import FormatConverter
+from core.journal import ConversionJournal, FASE_FORMATEO as DIARIO_FORMATEO
+from core.progress import FASE_FORMATEO
+
+ARCHIVOS = {
+    "a.bin": os.urandom(200_000),
+    "docs/b.txt": b"contenido" * 500,
+}
+
+
+@pytest.fixture
+def volumenes(tmp_path):
+    return VolumenesSimulados(str(tmp_path / "staging"))
+
+
+def fabrica(volumenes, segundos_formateo):
+    """Convertidores reales sobre los volúmenes simulados; segundos_formateo es un número o un iterable"""
+    if isinstance(segundos_formateo, (int, float)):
+        segundos_formateo = itertools.repeat(segundos_formateo)
+
+    def crear(turno):
+        return FormatConverter(runner=volumenes.ejecutor(next(segundos_formateo)), turno=turno,
+                               volumenes=volumenes)
+    return crear
+
+
+def unidad_con_datos(tmp_path, volumenes, nombre):
+    unidad = volumenes.crear(tmp_path / nombre, "FAT32")
+    crear_arbol(unidad, ARCHIVOS)
+    return unidad
+
+
+def staging_vacio(volumenes):
+    staging = volumenes.directorio_staging()
+    return not os.path.exists(staging) or os.listdir(staging) == []
+
+
+def esperar_a(condicion, limite=10.0):
+    final = time.monotonic() + limite
+    while not condicion():
+        assert time.monotonic() < final, "la condición no se cumplió a tiempo"
+        time.sleep(0.01)
+
+
+def test_convierte_varias_unidades_sin_pasar_del_limite(tmp_path, volumenes):
+    unidades = [unidad_con_datos(tmp_path, volumenes, nombre) for nombre in "DEFG"]
+    en_curso_max = []
+    lock = threading.Lock()
+
+    def al_cambiar(trabajo):
+        with lock:
+            en_curso_max.append(sum(t.estado == EN_CURSO for t in cola.trabajos()))
+
+    cola = ConversionQueue(max_concurrentes=2, al_cambiar=al_cambiar,
+                           fabrica_convertidor=fabrica(volumenes, 0.2))
+    trabajos = [cola.encolar(unidad, "NTFS") for unidad in unidades]
+
+    assert cola.esperar(timeout=30)
+    assert [t.estado for t in trabajos] == [COMPLETADO] * 4
+    assert max(en_curso_max) == 2
+    for unidad in unidades:
+        assert volumenes.sistema_archivos(unidad) == "NTFS"
+        assert leer_arbol(unidad) == ARCHIVOS
+    assert staging_vacio(volumenes)
+
+
+def test_una_unidad_no_se_encola_dos_veces(tmp_path, volumenes):
+    unidad = unidad_con_datos(tmp_path, volumenes, "E")
+    cola = ConversionQueue(fabrica_convertidor=fabrica(volumenes, 0.5))
+    cola.encolar(unidad, "NTFS")
+
+    with pytest.raises(ValueError):
+        cola.encolar(unidad + os.sep, "EXFAT")
+    assert cola.esperar(timeout=30)
+
+
+def test_cancelar_un_trabajo_en_curso_no_afecta_a_los_demas(tmp_path, volumenes):
+    lenta, rapida = unidad_con_datos(tmp_path, volumenes, "E"), unidad_con_datos(tmp_path, volumenes, "F")
+    # El format.com del primer convertidor tarda lo bastante para cancelarlo
+    segundos = itertools.chain([30.0], itertools.repeat(0.05))
+    cola = ConversionQueue(max_concurrentes=2, fabrica_convertidor=fabrica(volumenes, segundos))
+    cancelada = cola.encolar(lenta, "NTFS")
+    completada = cola.encolar(rapida, "NTFS")
+    esperar_a(lambda: (cancelada.progreso.tomar() or {}).get('fase') == FASE_FORMATEO)
+
+    inicio = time.monotonic()
+    assert cola.cancelar(cancelada.id)
+    assert cola.esperar(timeout=10)
+
+    assert time.monotonic() - inicio < 5
+    assert cancelada.estado == CANCELADO
+    assert completada.estado == COMPLETADO
+    # Se canceló antes de que format.com terminara: la unidad queda como estaba
+    assert volumenes.sistema_archivos(lenta) == "FAT32"
+    assert leer_arbol(lenta) == ARCHIVOS
+    assert volumenes.sistema_archivos(rapida) == "NTFS"
+    # Cancelar durante el formateo conserva backup y diario para reanudar, solo de esa unidad
+    pendientes = ConversionJournal.pendientes(volumenes.directorio_staging())
+    assert [(journal.estado['unidad'], journal.fase) for journal in pendientes] == [(lenta, DIARIO_FORMATEO)]
+
+
+def test_cancelar_un_trabajo_en_cola_no_lo_ejecuta(tmp_path, volumenes):
+    primera, segunda = unidad_con_datos(tmp_path, volumenes, "E"), unidad_con_datos(tmp_path, volumenes, "F")
+    cola = ConversionQueue(max_concurrentes=1, fabrica_convertidor=fabrica(volumenes, 0.2))
+    en_curso = cola.encolar(primera, "NTFS")
+    en_cola = cola.encolar(segunda, "NTFS")
+
+    assert cola.cancelar(en_cola.id)
+    assert en_cola.estado == CANCELADO
+    assert cola.esperar(timeout=30)
+    assert en_curso.estado == COMPLETADO
+    assert en_cola.inicio is None
+    assert volumenes.sistema_archivos(segunda) == "FAT32"
+    assert not cola.cancelar(en_cola.id)
+
@@ -0,0 +1,165 @@
+import os
+
+import pytest
+
+import config
+
+from conftest import crear_arbol, leer_arbol
+from core.device_history import DeviceHistory, formato_serial
+from core.fake_drive import VolumenesSimulados
+from core.format_converter import FormatConverter, MSG_CANCELADA
+from core.journal import ConversionJournal, FASE_COPIA
+
+ARCHIVOS = {
+    "documento.txt": b"hola" * 1000,
+    "fotos/a.jpg": os.urandom(300_000),
+    "fotos/vacaciones/b.jpg": os.urandom(50_000),
+    "vacio.bin": b"",
+}
+
+
+@pytest.fixture
+def volumenes(tmp_path):
+    return VolumenesSimulados(str(tmp_path / "staging"))
+
+
+def convertir(convertidor, unidad, fs):
+    resultado = {}
+    try:
+        convertidor.convertir(unidad, fs, lambda u: resultado.setdefault('exito', u),
+                              lambda mensaje: resultado.setdefault('error', mensaje))
+    finally:
+        convertidor.cerrar()
+    return resultado
+
+
+def test_convierte_copiando_formateando_y_restaurando(tmp_path, volumenes):
+    unidad = volumenes.crear(tmp_path / "E", "FAT32")
+    crear_arbol(unidad, ARCHIVOS)
+    serial = volumenes.serial(unidad)
+    runner = volumenes.ejecutor()
+
+    resultado = convertir(FormatConverter(runner=runner, volumenes=volumenes), unidad, "exFAT")
+
+    assert resultado == {'exito': unidad}
+    assert volumenes.sistema_archivos(unidad) == "EXFAT"
+    assert volumenes.serial(unidad) != serial
+    assert leer_arbol(unidad) == ARCHIVOS
+    assert [args[0] for args, _ in runner.ejecutados] == ["format.com"]
+    # Sin backup ni diario pendientes
+    assert os.listdir(volumenes.directorio_staging()) == []
+
+
+def test_el_historial_sigue_a_la_unidad_tras_el_cambio_de_serial(tmp_path, volumenes):
+    unidad = volumenes.crear(tmp_path / "E", "FAT32")
+    crear_arbol(unidad, ARCHIVOS)
+    serial = volumenes.serial(unidad)
+
+    convertir(FormatConverter(runner=volumenes.ejecutor(), volumenes=volumenes), unidad, "NTFS")
+
+    historial = DeviceHistory()
+    try:
+        [dispositivo] = historial.resumen()
+        assert sorted(dispositivo['seriales']) == sorted(
+            [formato_serial(serial), formato_serial(volumenes.serial(unidad))])
+        [conversion] = historial.conversiones(dispositivo['id'])
+        assert (conversion['fs_destino'], conversion['exito']) == ("NTFS", 1)
+    finally:
+        historial.cerrar()
+
+
+def test_unidad_vacia_solo_se_formatea(tmp_path, volumenes):
+    unidad = volumenes.crear(tmp_path / "E", "FAT32")
+    runner = volumenes.ejecutor()
+
+    resultado = convertir(FormatConverter(runner=runner, volumenes=volumenes), unidad, "NTFS")
+
+    assert resultado == {'exito': unidad}
+    assert volumenes.sistema_archivos(unidad) == "NTFS"
+    assert not os.path.exists(volumenes.directorio_staging())
+
+
+def test_cancelar_durante_el_desmontaje_no_formatea(tmp_path, volumenes):
+    unidad = volumenes.crear(tmp_path / "E", "FAT32")
+    crear_arbol(unidad, ARCHIVOS)
+    runner = volumenes.ejecutor()
+    convertidor = FormatConverter(runner=runner, volumenes=volumenes)
+    desmontar = volumenes.desmontar
+
+    def desmontar_y_cancelar(letra):
+        desmontar(letra)
+        convertidor.cancelar_conversion()
+    volumenes.desmontar = desmontar_y_cancelar
+
+    resultado = convertir(convertidor, unidad, "exFAT")
+
+    assert resultado == {'error': MSG_CANCELADA}
+    assert runner.ejecutados == []
+    assert volumenes.sistema_archivos(unidad) == "FAT32"
+    assert leer_arbol(unidad) == ARCHIVOS
+
+
+def test_copia_interrumpida_de_otra_memoria_no_bloquea_la_unidad(tmp_path, volumenes):
+    unidad = volumenes.crear(tmp_path / "E", "FAT32")
+    crear_arbol(unidad, ARCHIVOS)
+    staging = volumenes.directorio_staging()
+    backup = tmp_path / "staging" / "USB_BACKUP_viejo"
+    backup.mkdir(parents=True)
+    ConversionJournal.crear(staging, unidad, fs_destino="NTFS", backup_dir=str(backup),
+                            serial_original=0xDEAD)
+
+    resultado = convertir(FormatConverter(runner=volumenes.ejecutor(), volumenes=volumenes),
+                          unidad, "exFAT")
+
+    assert resultado == {'exito': unidad}
+    assert volumenes.sistema_archivos(unidad) == "EXFAT"
+    assert not backup.exists()
+    assert ConversionJournal.pendientes(staging) == []
+    assert leer_arbol(unidad) == ARCHIVOS
+
+
+def test_formato_fallido_conserva_el_backup_para_reanudar(tmp_path, volumenes):
+    unidad = volumenes.crear(tmp_path / "E", "FAT32")
+    crear_arbol(unidad, ARCHIVOS)
+    runner = volumenes.ejecutor()
+    runner.guiones['format.com'].codigo = 1
+
+    resultado = convertir(FormatConverter(runner=runner, volumenes=volumenes), unidad, "exFAT")
+
+    assert 'error' in resultado
+    pendientes = ConversionJournal.pendientes(volumenes.directorio_staging(), unidad)
+    assert [journal.fase for journal in pendientes] != [FASE_COPIA]
+    assert len(pendientes) == 1
+
+    # Al reintentar se reanuda desde el formateo con el backup existente
+    runner.guiones['format.com'].codigo = 0
+    resultado = convertir(FormatConverter(runner=runner, volumenes=volumenes), unidad, "exFAT")
+    assert resultado == {'exito': unidad}
+    assert leer_arbol(unidad) == ARCHIVOS
+    assert ConversionJournal.pendientes(volumenes.directorio_staging()) == []
+
+
+def test_sin_el_archivo_de_backup_no_se_reanuda_el_formateo(tmp_path, volumenes, monkeypatch):
+    monkeypatch.setattr(config, "BACKUP_MODE", "archivo")
+    monkeypatch.setattr(config, "DISMOUNT_TIMEOUT", 0.2)
+    unidad = volumenes.crear(tmp_path / "E", "FAT32")
+    crear_arbol(unidad, ARCHIVOS)
+    runner = volumenes.ejecutor()
+    # La primera vez se queda tras la copia, sin poder desmontar
+    desmontar = volumenes.desmontar
+
+    def desmontar_fallido(letra):
+        raise OSError("volumen en uso")
+    volumenes.desmontar = desmontar_fallido
+    convertir(FormatConverter(runner=runner, volumenes=volumenes), unidad, "exFAT")
+    [journal] = ConversionJournal.pendientes(volumenes.directorio_staging(), unidad)
+    for nombre in os.listdir(journal.estado['backup_dir']):
+        os.remove(os.path.join(journal.estado['backup_dir'], nombre))
+
+    volumenes.desmontar = desmontar
+    resultado = convertir(FormatConverter(runner=runner, volumenes=volumenes), unidad, "exFAT")
+
+    assert 'error' in resultado
+    assert runner.ejecutados == []
+    assert volumenes.sistema_archivos(unidad) == "FAT32"
+    assert leer_arbol(unidad) == ARCHIVOS
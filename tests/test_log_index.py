@@ -0,0 +1,23 @@
+import logging
+
+from core.log_index import JsonlIndexedHandler, LogIndex
+
+
+def test_filtra_por_unidad_aunque_las_rutas_empiecen_igual(tmp_path):
+    ruta = str(tmp_path / "registro.jsonl")
+    handler = JsonlIndexedHandler(ruta)
+    registro = logging.getLogger("prueba_log_index")
+    registro.addHandler(handler)
+    registro.setLevel(logging.INFO)
+    try:
+        for unidad in ("/media/usb1", "/media/usb2", "E:"):
+            registro.info("conversión de %s", unidad, extra={'unidad': unidad})
+        registro.info("sin unidad")
+    finally:
+        registro.removeHandler(handler)
+        handler.close()
+
+    assert [r['mensaje'] for r in LogIndex(ruta, unidad="/media/usb2/").leer(0, 10)] == [
+        "conversión de /media/usb2"]
+    assert [r['unidad'] for r in LogIndex(ruta, unidad="e:\\").leer(0, 10)] == ["E:"]
+    assert len(LogIndex(ruta)) == 4
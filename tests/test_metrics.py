@@ -0,0 +1,56 @@
+import os
+import threading
+
+import config
+from core.metrics import ConversionMetrics, texto_prometheus
+
+
+def exportar(unidad, fs):
+    metricas = ConversionMetrics(unidad, fs)
+    with metricas.span("copia") as tramo:
+        tramo.anotar(bytes=1024, archivos=2)
+    metricas.finalizar(True)
+    return metricas.exportar()
+
+
+def test_exportaciones_concurrentes_conservan_todas_las_unidades():
+    unidades = [f"{letra}:" for letra in "DEFGHIJK"]
+    hilos = [threading.Thread(target=exportar, args=(unidad, "NTFS")) for unidad in unidades]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    with open(config.METRICS_PROMETHEUS_FILE, encoding='utf-8') as f:
+        texto = f.read()
+    for unidad in unidades:
+        assert f'changeformatusb_conversion_success{{drive="{unidad}",fs="NTFS"}} 1' in texto
+    directorio = os.path.dirname(config.METRICS_PROMETHEUS_FILE)
+    assert not [nombre for nombre in os.listdir(directorio) if nombre.endswith(".tmp")]
+
+
+def test_unidad_como_ruta_no_crea_subdirectorios(tmp_path):
+    ruta = exportar(str(tmp_path / "montajes" / "usb 1"), "EXFAT")
+
+    assert os.path.dirname(ruta) == config.METRICS_DIR
+    assert ruta.endswith("_usb_1.json")
+    assert os.path.exists(ruta)
+
+
+def test_el_archivo_conserva_las_unidades_de_otros_procesos():
+    # Lo que dejó otro proceso (o una ejecución anterior) con una unidad que este no ha tocado
+    otra = ConversionMetrics("Z:", "FAT32")
+    otra.finalizar(False)
+    os.makedirs(os.path.dirname(config.METRICS_PROMETHEUS_FILE), exist_ok=True)
+    with open(config.METRICS_PROMETHEUS_FILE, 'w', encoding='utf-8') as f:
+        f.write(texto_prometheus([otra, ConversionMetrics("Y:", "NTFS")]))
+
+    exportar("Y:", "EXFAT")
+
+    with open(config.METRICS_PROMETHEUS_FILE, encoding='utf-8') as f:
+        texto = f.read()
+    assert 'changeformatusb_conversion_success{drive="Z:",fs="FAT32"} 0' in texto
+    # La unidad exportada de nuevo se sustituye, no se duplica
+    assert 'changeformatusb_conversion_success{drive="Y:",fs="EXFAT"} 1' in texto
+    assert 'drive="Y:",fs="NTFS"' not in texto
+    assert texto.count("# TYPE changeformatusb_conversion_success ") == 1
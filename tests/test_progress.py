@@ -0,0 +1,40 @@
+from core import progress
+from core.journal import FASE_COPIA, FASE_FORMATEO, FASE_RESTAURACION
+from core.progress import ProgressTracker
+from utils.progress_bus import ProgressBus
+
+
+def test_add_no_calcula_snapshots_y_el_bus_los_muestrea_al_leer():
+    publicados = []
+    tracker = ProgressTracker([FASE_COPIA, FASE_FORMATEO, FASE_RESTAURACION], 1000, 10,
+                              callback=publicados.append)
+    tracker.iniciar_fase(FASE_COPIA)
+    bus = ProgressBus()
+    bus.fuente = lambda: tracker
+
+    for _ in range(10):
+        tracker.add(100, 1)
+
+    assert len(publicados) == 1
+    estado = bus.tomar()
+    assert (estado['bytes_hechos'], estado['archivos_hechos']) == (1000, 10)
+    # Sin cambios no hay nada nuevo que entregar
+    assert bus.tomar() is None
+    tracker.add(0, 0)
+    assert bus.tomar() is not None
+
+
+def test_snapshot_no_modifica_las_estimaciones(monkeypatch):
+    reloj = [1000.0]
+    monkeypatch.setattr(progress.time, "monotonic", lambda: reloj[0])
+    tracker = ProgressTracker([FASE_COPIA, FASE_RESTAURACION], 10_000, 1)
+    tracker.iniciar_fase(FASE_COPIA)
+    reloj[0] += 1.0
+    tracker.add(1000)
+
+    primero = tracker.snapshot()
+    reloj[0] += 0.1
+    segundo = tracker.snapshot()
+
+    assert primero['throughput_medio'] == segundo['throughput_medio'] == 1000.0
+    assert primero['eta'] == segundo['eta']
@@ -0,0 +1,90 @@
+import sys
+import time
+import types
+import threading
+
+import pytest
+
+import core.usb_manager as usb_manager
+from core.usb_manager import USBManager, STATE_PROBING, STATE_READY
+
+
+class _Disco:
+    def __init__(self, letra):
+        self.DeviceID = letra
+        self.FileSystem = "FAT32"
+        self.Size = 1000
+        self.FreeSpace = 500
+        self.VolumeName = "USB"
+
+
+@pytest.fixture
+def wmi_falso(monkeypatch):
+    modulo = types.ModuleType("wmi")
+    modulo.enumeraciones = 0
+
+    class WMI:
+        def Win32_LogicalDisk(self, DriveType):
+            modulo.enumeraciones += 1
+            return [_Disco("E:")]
+
+    modulo.WMI = WMI
+    monkeypatch.setitem(sys.modules, "wmi", modulo)
+    return modulo
+
+
+def sondeo_lento(monkeypatch, segundos):
+    llamadas = []
+
+    def probe_drive(letra):
+        llamadas.append(letra)
+        time.sleep(segundos)
+        return {'filesystem': "NTFS", 'size': 1000, 'free': 400, 'label': "DATOS", 'serial': None}
+
+    monkeypatch.setattr(usb_manager, "probe_drive", probe_drive)
+    return llamadas
+
+
+def test_unidad_lenta_usa_su_sondeo_terminado_sin_volver_a_sondear(monkeypatch, wmi_falso):
+    llamadas = sondeo_lento(monkeypatch, 0.3)
+    manager = USBManager(ttl=60)
+    manager.probe_timeout = 0.05
+    avisos = threading.Semaphore(0)
+    manager.add_change_callback(avisos.release)
+    try:
+        [pendiente] = manager.get_usb_devices()
+        assert pendiente['state'] == STATE_PROBING
+
+        assert avisos.acquire(timeout=5)
+        [lista] = manager.get_usb_devices()
+        assert lista['state'] == STATE_READY
+        assert lista['filesystem'] == "NTFS"
+        assert llamadas == ["E:"]
+        # Ya lista: no hay más avisos ni enumeraciones encadenadas
+        assert not avisos.acquire(timeout=0.5)
+        assert wmi_falso.enumeraciones == 2
+    finally:
+        manager.shutdown()
+
+
+def test_sondeo_terminado_antes_de_publicar_la_instantanea_avisa(monkeypatch, wmi_falso):
+    sondeo_lento(monkeypatch, 0.1)
+    manager = USBManager(ttl=60)
+    manager.probe_timeout = 0.01
+    avisos = threading.Semaphore(0)
+    manager.add_change_callback(avisos.release)
+    enumerar = manager._enumerate_devices
+
+    def enumerar_y_tardar_en_publicar():
+        drives = enumerar()
+        time.sleep(0.3)  # el sondeo termina antes de guardar la instantánea
+        return drives
+
+    monkeypatch.setattr(manager, "_enumerate_devices", enumerar_y_tardar_en_publicar)
+    try:
+        [pendiente] = manager.get_usb_devices()
+        assert pendiente['state'] == STATE_PROBING
+        assert avisos.acquire(timeout=5)
+        assert manager.get_usb_devices()[0]['state'] == STATE_READY
+    finally:
+        manager.shutdown()
@@ -0,0 +1,119 @@
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QObject, pyqtSignal, pyqtSlot
+from logger import logger
+from core.usb_manager import STATE_PROBING
+
+
+def device_text(drive):
+    """Texto de una unidad en la lista de dispositivos"""
+    size_gb = int(drive['size']) / (1024**3) if drive['size'] else 0
+    text = f"{drive['letter']} - {drive['label']} ({size_gb:.1f} GB, {drive['filesystem']})"
+    if drive.get('state') == STATE_PROBING:
+        text += " - detectando..."
+    elif drive.get('degraded'):
+        text += " - lenta (posiblemente degradada)"
+    return text
+
+
+class DeviceListModel(QAbstractListModel):
+    """Modelo de la lista de unidades que aplica solo las diferencias.
+
+    apply_devices() compara por letra con el contenido actual y emite
+    inserciones, eliminaciones y dataChanged para las unidades que han
+    cambiado, así la selección y el scroll de la vista se conservan.
+    """
+    DeviceRole = Qt.UserRole + 1
+    LetterRole = Qt.UserRole + 2
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._devices = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._devices)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._devices):
+            return None
+        drive = self._devices[index.row()]
+        if role == Qt.DisplayRole:
+            return device_text(drive)
+        if role == self.DeviceRole:
+            return drive
+        if role == self.LetterRole:
+            return drive['letter']
+        return None
+
+    def device_at(self, row):
+        if 0 <= row < len(self._devices):
+            return self._devices[row]
+        return None
+
+    def row_for_letter(self, letter):
+        for row, drive in enumerate(self._devices):
+            if drive['letter'] == letter:
+                return row
+        return -1
+
+    def apply_devices(self, devices):
+        """Actualiza el modelo con la nueva lista; devuelve el número de cambios"""
+        nuevos = {drive['letter']: drive for drive in devices}
+        cambios = 0
+
+        # Eliminar de abajo arriba para no desplazar las filas pendientes
+        for row in reversed(range(len(self._devices))):
+            if self._devices[row]['letter'] not in nuevos:
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self._devices[row]
+                self.endRemoveRows()
+                cambios += 1
+
+        # Actualizar las que siguen presentes
+        for row, drive in enumerate(self._devices):
+            nuevo = nuevos[drive['letter']]
+            if nuevo != drive:
+                self._devices[row] = nuevo
+                indice = self.index(row)
+                self.dataChanged.emit(indice, indice)
+                cambios += 1
+
+        # Insertar las nuevas manteniendo el orden por letra
+        actuales = {drive['letter'] for drive in self._devices}
+        for drive in sorted(devices, key=lambda d: d['letter']):
+            if drive['letter'] in actuales:
+                continue
+            row = 0
+            while row < len(self._devices) and self._devices[row]['letter'] < drive['letter']:
+                row += 1
+            self.beginInsertRows(QModelIndex(), row, row)
+            self._devices.insert(row, drive)
+            self.endInsertRows()
+            cambios += 1
+
+        return cambios
+
+
+class DeviceEnumerator(QObject):
+    """Enumera dispositivos en su propio hilo para no bloquear la interfaz"""
+    devices_ready = pyqtSignal(object, int)
+
+    def __init__(self, usb_manager):
+        super().__init__()
+        self.usb_manager = usb_manager
+        self._com_ready = False
+
+    @pyqtSlot(bool)
+    def enumerate(self, force):
+        if not self._com_ready:
+            # WMI necesita COM inicializado en el hilo que lo usa
+            try:
+                import pythoncom
+                pythoncom.CoInitialize()
+            except ImportError:
+                pass
+            self._com_ready = True
+        try:
+            devices = self.usb_manager.get_usb_devices(force=force)
+        except Exception as e:
+            logger.error(f"Error enumerando dispositivos: {str(e)}")
+            devices = self.usb_manager.cached_devices
+        self.devices_ready.emit(devices, self.usb_manager.version)
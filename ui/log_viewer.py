@@ -0,0 +1,303 @@
+import os
+import logging
+from datetime import datetime
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QTimer
+from PyQt5.QtGui import QColor
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QComboBox, QLineEdit,
+                             QTableView, QHeaderView, QPushButton, QLabel, QAbstractItemView)
+from core.log_index import LogIndex, FASES_REGISTRO, generaciones, registro_a_dict
+import config
+
+COLUMNS = ("Hora", "Nivel", "Fase", "Unidad", "Mensaje")
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+LEVEL_COLORS = {
+    "WARNING": QColor(241, 196, 15),
+    "ERROR": QColor(231, 76, 60),
+    "CRITICAL": QColor(231, 76, 60),
+}
+# Páginas leídas del disco que se conservan en memoria
+MAX_CACHED_PAGES = 20
+LIVE_SOURCE = "live"
+
+
+def record_matches(record, min_level, phase, drive):
+    if logging.getLevelName(record['nivel']) < min_level:
+        return False
+    if phase and record.get('fase') != phase:
+        return False
+    if drive and (record.get('unidad') or "").upper() != drive:
+        return False
+    return True
+
+
+class LogRecordsModel(QAbstractTableModel):
+    """Columnas comunes a los registros del archivo y a los del búfer en memoria"""
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return COLUMNS[section]
+        return None
+
+    def record(self, row):
+        raise NotImplementedError
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        record = self.record(index.row())
+        if record is None:
+            return None
+        if role == Qt.DisplayRole:
+            column = index.column()
+            if column == 0:
+                return datetime.fromtimestamp(record['t']).strftime("%Y-%m-%d %H:%M:%S")
+            if column == 1:
+                return record['nivel']
+            if column == 2:
+                return record.get('fase') or ""
+            if column == 3:
+                return record.get('unidad') or ""
+            mensaje = record['mensaje']
+            return mensaje.splitlines()[0] if mensaje else ""
+        if role == Qt.ToolTipRole and index.column() == 4:
+            return "\n".join(filter(None, (record['mensaje'], record.get('excepcion'))))
+        if role == Qt.ForegroundRole:
+            return LEVEL_COLORS.get(record['nivel'])
+        return None
+
+
+class LogFileModel(LogRecordsModel):
+    """Registros de un JSONL leídos por páginas a través de su índice.
+
+    La vista solo pide las filas visibles: rowCount crece con fetchMore y
+    cada página se lee del disco la primera vez que se muestra.
+    """
+
+    def __init__(self, path, parent=None):
+        super().__init__(parent)
+        self.page_size = config.LOG_VIEWER_PAGE_SIZE
+        self.index = LogIndex(path)
+        self._loaded = 0
+        self._pages = {}
+
+    def set_filter(self, min_level, phase, drive):
+        self.beginResetModel()
+        self.index.filtrar(min_level, phase, drive)
+        self._loaded = min(len(self.index), self.page_size)
+        self._pages.clear()
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._loaded
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._loaded < len(self.index)
+
+    def fetchMore(self, parent=QModelIndex()):
+        count = min(self.page_size, len(self.index) - self._loaded)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self._loaded, self._loaded + count - 1)
+        self._loaded += count
+        self.endInsertRows()
+
+    def record(self, row):
+        page_number, offset = divmod(row, self.page_size)
+        page = self._pages.get(page_number)
+        if page is None:
+            if len(self._pages) >= MAX_CACHED_PAGES:
+                self._pages.pop(next(iter(self._pages)))
+            page = self.index.leer(page_number * self.page_size, self.page_size)
+            self._pages[page_number] = page
+        return page[offset] if offset < len(page) else None
+
+    def refresh(self):
+        """Incorpora los registros escritos desde la última lectura; devuelve si hubo nuevos"""
+        total_before = len(self.index)
+        if self.index.actualizar() == 0 and len(self.index) >= total_before:
+            return False
+        if len(self.index) < total_before:
+            # El archivo rotó
+            self.set_filter(self.index.nivel_minimo, self.index.fase, self.index.unidad)
+            return True
+        # La última página pudo quedar incompleta en la caché
+        self._pages.pop(max(0, total_before - 1) // self.page_size, None)
+        if self._loaded == total_before:
+            self.fetchMore()
+        return True
+
+
+class LogTailModel(LogRecordsModel):
+    """Cola en vivo: los registros más recientes del búfer circular en memoria"""
+
+    def __init__(self, ring_buffer, parent=None):
+        super().__init__(parent)
+        self.ring_buffer = ring_buffer
+        self._records = []
+        self._seen = 0
+        self._filter = (logging.NOTSET, None, None)
+
+    def set_filter(self, min_level, phase, drive):
+        self.beginResetModel()
+        self._filter = (min_level, phase, drive)
+        self._records = [record for record in map(registro_a_dict, self.ring_buffer.recientes())
+                         if record_matches(record, *self._filter)]
+        self._seen = self.ring_buffer.total
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._records)
+
+    def record(self, row):
+        return self._records[row] if row < len(self._records) else None
+
+    def refresh(self):
+        new = self.ring_buffer.total - self._seen
+        if new <= 0:
+            return False
+        self._seen = self.ring_buffer.total
+        records = [record for record in map(registro_a_dict, self.ring_buffer.recientes(new))
+                   if record_matches(record, *self._filter)]
+        if not records:
+            return False
+        # El búfer es circular: la vista tampoco crece sin límite
+        overflow = len(self._records) + len(records) - self.ring_buffer.registros.maxlen
+        if overflow > 0:
+            self.beginRemoveRows(QModelIndex(), 0, min(overflow, len(self._records)) - 1)
+            del self._records[:overflow]
+            self.endRemoveRows()
+        start = len(self._records)
+        self.beginInsertRows(QModelIndex(), start, start + len(records) - 1)
+        self._records.extend(records)
+        self.endInsertRows()
+        return True
+
+
+class LogViewer(QDialog):
+    """Visor de logs con filtros por nivel, fase y unidad y cola en vivo"""
+
+    def __init__(self, ring_buffer, parent=None):
+        super().__init__(parent)
+        self.ring_buffer = ring_buffer
+        self.log_path = os.path.join(config.LOG_DIR, config.LOG_JSONL_FILE)
+        self.setWindowTitle("Logs")
+        self.resize(1000, 600)
+
+        layout = QVBoxLayout(self)
+        filters = QHBoxLayout()
+
+        self.source_combo = QComboBox()
+        self.source_combo.addItem("En vivo", LIVE_SOURCE)
+        for path in generaciones(self.log_path):
+            self.source_combo.addItem(os.path.basename(path), path)
+        filters.addWidget(QLabel("Origen:"))
+        filters.addWidget(self.source_combo)
+
+        self.level_combo = QComboBox()
+        for level in LEVELS:
+            self.level_combo.addItem(level, logging.getLevelName(level))
+        filters.addWidget(QLabel("Nivel mínimo:"))
+        filters.addWidget(self.level_combo)
+
+        self.phase_combo = QComboBox()
+        self.phase_combo.addItem("Todas", None)
+        for phase in FASES_REGISTRO:
+            self.phase_combo.addItem(phase, phase)
+        filters.addWidget(QLabel("Fase:"))
+        filters.addWidget(self.phase_combo)
+
+        self.drive_edit = QLineEdit()
+        self.drive_edit.setPlaceholderText("E:")
+        self.drive_edit.setMaxLength(2)
+        self.drive_edit.setFixedWidth(50)
+        filters.addWidget(QLabel("Unidad:"))
+        filters.addWidget(self.drive_edit)
+        filters.addStretch()
+
+        open_folder_btn = QPushButton("Abrir carpeta")
+        open_folder_btn.clicked.connect(self.open_folder)
+        filters.addWidget(open_folder_btn)
+        layout.addLayout(filters)
+
+        self.table = QTableView()
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        self.table.verticalHeader().setDefaultSectionSize(20)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        layout.addWidget(self.table)
+
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+
+        self.model = None
+        self.source_combo.currentIndexChanged.connect(self.change_source)
+        self.level_combo.currentIndexChanged.connect(self.apply_filter)
+        self.phase_combo.currentIndexChanged.connect(self.apply_filter)
+        self.drive_edit.editingFinished.connect(self.apply_filter)
+
+        # Registros nuevos: la cola en vivo y el archivo actual crecen mientras se mira
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.change_source()
+
+    def current_filter(self):
+        drive = self.drive_edit.text().strip().upper()
+        if len(drive) == 1:
+            drive += ":"
+        return self.level_combo.currentData(), self.phase_combo.currentData(), drive or None
+
+    def change_source(self):
+        source = self.source_combo.currentData()
+        if source == LIVE_SOURCE:
+            self.model = LogTailModel(self.ring_buffer, self)
+        else:
+            self.model = LogFileModel(source, self)
+        self.table.setModel(self.model)
+        self.table.setColumnWidth(0, 140)
+        self.table.setColumnWidth(1, 70)
+        self.table.setColumnWidth(2, 100)
+        self.table.setColumnWidth(3, 60)
+        self.apply_filter()
+
+    def apply_filter(self):
+        self.model.set_filter(*self.current_filter())
+        self.update_status()
+        if isinstance(self.model, LogTailModel):
+            self.table.scrollToBottom()
+
+    def refresh(self):
+        source = self.source_combo.currentData()
+        # Los archivos rotados ya no cambian
+        if source not in (LIVE_SOURCE, self.log_path):
+            return
+        scrollbar = self.table.verticalScrollBar()
+        at_bottom = scrollbar.value() >= scrollbar.maximum()
+        if self.model.refresh():
+            self.update_status()
+            if at_bottom and isinstance(self.model, LogTailModel):
+                self.table.scrollToBottom()
+
+    def update_status(self):
+        if isinstance(self.model, LogFileModel):
+            self.status_label.setText(f"{len(self.model.index)} registros")
+        else:
+            self.status_label.setText(f"{self.model.rowCount()} registros recientes")
+
+    def open_folder(self):
+        log_dir = os.path.abspath(config.LOG_DIR)
+        if os.path.exists(log_dir):
+            os.startfile(log_dir)
+
+    def showEvent(self, event):
+        self.timer.start(1000)
+        self.refresh()
+        super().showEvent(event)
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        super().closeEvent(event)
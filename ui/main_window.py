@@ -1,23 +1,64 @@
 from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
-                             QComboBox, QPushButton, QListWidget, QProgressBar, 
+                             QComboBox, QPushButton, QListView, QProgressBar, 
                              QMenuBar, QMenu, QAction, QMessageBox, QStyleFactory,
                              QDialog, QTextBrowser, QTabWidget, QGroupBox, QFormLayout,
-                             QSizePolicy, QFrame, QSpacerItem, QApplication)
+                             QSizePolicy, QFrame, QSpacerItem, QApplication, QListWidget,
+                             QListWidgetItem, QInputDialog)
 from PyQt5.QtCore import Qt, QTimer, QSize, QUrl, QThread, QMetaObject, Q_ARG, pyqtSlot, pyqtSignal
 from PyQt5.QtGui import QFont, QPalette, QColor, QIcon, QDesktopServices
 from ui.components import StyledItemDelegate, DarkPalette, MessageBox
+from ui.device_model import DeviceListModel, DeviceEnumerator
 from core.usb_manager import USBManager
-from core.format_converter import FormatConverter
+from core.device_watcher import DeviceWatcher
+from core.cluster_size import TAMANOS_VALIDOS, formato_argumento
+from core.log_index import contexto_registro
 from core.admin_check import is_admin
 from utils.i18n import resource_path
 from utils.i18n import Translator
-from logger import logger
+from logger import logger, ring_buffer
 import config
-import webbrowser
 import time
 import os
 import sys
 
+# Nombres de las fases de conversión para la barra de progreso
+PHASE_NAMES = {
+    "copia": "Copiando datos",
+    "formateo": "Formateando",
+    "espera": "Esperando la unidad",
+    "restauracion": "Restaurando datos",
+    "conversion": "Convirtiendo",
+}
+
+def job_state_key(state):
+    """Clave de traducción del estado de un trabajo de la cola"""
+    # La cola se carga tras el primer pintado; cuando hay trabajos ya está importada
+    from core.conversion_queue import EN_COLA, EN_CURSO, COMPLETADO, ERROR, CANCELADO
+    return {
+        EN_COLA: "JOB_QUEUED",
+        EN_CURSO: "JOB_RUNNING",
+        COMPLETADO: "JOB_DONE",
+        ERROR: "JOB_FAILED",
+        CANCELADO: "JOB_CANCELLED",
+    }[state]
+
+def format_size(num_bytes):
+    """Formatea bytes a una representación legible"""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if num_bytes < 1024:
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} TB"
+
+def format_duration(seconds):
+    """Formatea segundos como h:mm:ss o mm:ss"""
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes:02d}:{secs:02d}"
+
 class AboutDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -132,12 +173,13 @@ class AboutDialog(QDialog):
         
         donate_btn = QPushButton(QIcon(resource_path("resources/donate.png")), "Donar")
         donate_btn.setIconSize(QSize(24, 24))
-        donate_btn.clicked.connect(lambda: webbrowser.open("https://paypal.me/vicemi"))
+        donate_btn.clicked.connect(lambda: QDesktopServices.openUrl(QUrl("https://paypal.me/vicemi")))
         buttons_layout.addWidget(donate_btn)
         
         repo_btn = QPushButton(QIcon(resource_path("resources/github.png")), "Repositorio")
         repo_btn.setIconSize(QSize(24, 24))
-        repo_btn.clicked.connect(lambda: webbrowser.open("https://github.com/vicemi/ChangeFormatUSB"))
+        repo_btn.clicked.connect(
+            lambda: QDesktopServices.openUrl(QUrl("https://github.com/vicemi/ChangeFormatUSB")))
         buttons_layout.addWidget(repo_btn)
         
         credits_layout.addLayout(buttons_layout)
@@ -153,56 +195,138 @@ class AboutDialog(QDialog):
         close_btn.clicked.connect(self.accept)
         layout.addWidget(close_btn, alignment=Qt.AlignCenter)
 
-class ConversionWorker(QThread):
-    finished = pyqtSignal(str)
-    error = pyqtSignal(str)
-    progress_updated = pyqtSignal(int)
+class PlanWorker(QThread):
+    """Calcula el plan de conversión fuera del hilo de la interfaz"""
+    planned = pyqtSignal(object)
+    failed = pyqtSignal(str)
 
-    def __init__(self, drive_letter, new_fs, parent=None):
+    def __init__(self, drive_letter, new_fs, parent=None, cluster_size=None):
         super().__init__(parent)
         self.drive_letter = drive_letter
         self.new_fs = new_fs
-        self.running = True
+        self.cluster_size = cluster_size
 
     def run(self):
+        from core.format_converter import FormatConverter
+
+        convertidor = FormatConverter()
         try:
-            def on_success(drive_letter):
-                self.progress_updated.emit(100)
-                self.finished.emit(drive_letter)
-
-            def on_error(error_msg):
-                self.error.emit(error_msg)
-
-            # Llama al convertidor real
-            FormatConverter().iniciar_conversion(
-                self.drive_letter,
-                self.new_fs,
-                on_success,
-                on_error
-            )
+            self.planned.emit(convertidor.planificar(self.drive_letter, self.new_fs,
+                                                     self.cluster_size))
         except Exception as e:
-            self.error.emit(str(e))
+            logger.error(f"Error planificando la conversión: {str(e)}")
+            self.failed.emit(str(e))
         finally:
-            self.running = False
+            convertidor.cerrar()
+
+class BenchmarkWorker(QThread):
+    """Mide el rendimiento de la unidad y guarda el resultado para las estimaciones"""
+    measured = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    progress_updated = pyqtSignal(int)
+
+    def __init__(self, drive_letter, parent=None):
+        super().__init__(parent)
+        self.drive_letter = drive_letter
+        from core.benchmark import DriveBenchmark
+        self.benchmark = DriveBenchmark(os.path.join(drive_letter, ''))
+
+    def run(self):
+        from core.device_history import DeviceHistory
+
+        try:
+            with contexto_registro(fase="benchmark", unidad=self.drive_letter):
+                resultado = self.benchmark.ejecutar(
+                    lambda prueba, fraccion: self.progress_updated.emit(int(fraccion * 100)))
+            historial = DeviceHistory()
+            try:
+                historial.registrar_benchmark(historial.dispositivo_de_unidad(self.drive_letter),
+                                              resultado)
+            finally:
+                historial.cerrar()
+            self.measured.emit(resultado)
+        except Exception as e:
+            logger.error(f"Error en el benchmark de {self.drive_letter}: {str(e)}")
+            self.failed.emit(str(e))
 
     def cancel(self):
-        self.running = False
+        self.benchmark.detener()
 
 class ChangeFormatUSB(QMainWindow):
+    # Eventos del DeviceWatcher, reenviados desde su hilo al de la interfaz
+    device_event = pyqtSignal(object)
+    # Petición de enumeración al hilo de DeviceEnumerator (force)
+    enumeration_requested = pyqtSignal(bool)
+    # Un sondeo lento terminó y la instantánea quedó invalidada
+    devices_changed = pyqtSignal()
+    # Un trabajo de la cola cambió de estado (desde el hilo de la conversión)
+    job_changed = pyqtSignal(object)
+    # El arranque diferido terminó (watcher y primera enumeración lanzados)
+    startup_finished = pyqtSignal()
+
     def __init__(self):
         super().__init__()
         self.translator = Translator()
-        self.usb_manager = USBManager()
+        # El gestor de dispositivos (historial en SQLite y pool de sondeo), el
+        # watcher, la primera enumeración y la comprobación de permisos
+        # esperan al primer pintado (finish_startup)
+        self.usb_manager = None
+        self.enumeration_thread = None
+        self.device_watcher = None
         self.setup_ui()
         self.setup_menu()
         self.setWindowIcon(QIcon(resource_path("resources/icon.ico")))
         self.refresh_timer = QTimer(self)
-        self.refresh_timer.timeout.connect(self.refresh_usb_list)
-        self.refresh_timer.start(config.REFRESH_INTERVAL)
-        self.refresh_usb_list()
+        self.refresh_timer.timeout.connect(self.on_refresh_timer)
+        self.device_event.connect(self.on_device_event)
+        self.devices_changed.connect(self.refresh_usb_list)
+        self.startup_scheduled = False
+        # Conversiones en segundo plano, varias unidades a la vez; la cola se
+        # crea en finish_startup
+        self.conversion_queue = None
+        self.job_changed.connect(self.on_job_changed)
+        self.job_items = {}
+        self.reported_jobs = set()
+        # Trabajos terminados desde el último resumen; se muestra al vaciarse la cola
+        self.finished_batch = []
+        self.batch_summary = None
+        # El progreso de los trabajos se recoge a ritmo limitado, no por cada evento
+        self.jobs_timer = QTimer(self)
+        self.jobs_timer.setInterval(max(1, int(1000 / config.PROGRESS_MAX_UPDATES_PER_SEC)))
+        self.jobs_timer.timeout.connect(self.update_jobs_progress)
         self.debug_mode = False
-        self.conversion_thread = None
-        
+        self.benchmark_thread = None
+        self.log_viewer = None
+        self.about_dialog = None
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.startup_scheduled:
+            # Un temporizador lanzado desde showEvent puede atenderse antes del
+            # primer pintado; desde aquí se atiende cuando la ventana ya se ha
+            # pintado entera (los hijos se pintan en la misma pasada)
+            self.startup_scheduled = True
+            QTimer.singleShot(0, self.finish_startup)
+
+    def finish_startup(self):
+        """Arranque diferido: lo que carga WMI o bloquea no retrasa la primera imagen"""
+        from core.conversion_queue import ConversionQueue
+
+        self.conversion_queue = ConversionQueue(fabrica_convertidor=self.create_converter,
+                                                al_cambiar=self.job_changed.emit)
+        self.usb_manager = USBManager()
+        self.usb_manager.add_change_callback(self.devices_changed.emit)
+        self.setup_enumerator()
+        self.device_watcher = DeviceWatcher()
+        self.device_watcher.suscribir(self.device_event.emit)
+        if self.device_watcher.start():
+            # Con notificaciones el temporizador solo es una red de seguridad
+            self.refresh_timer.start(config.DEVICE_FALLBACK_REFRESH_INTERVAL)
+        else:
+            self.refresh_timer.start(config.REFRESH_INTERVAL)
+        self.refresh_usb_list()
+        self.startup_finished.emit()
+
         # Verificar permisos de administrador
         if not is_admin():
             self.show_admin_warning()
@@ -244,7 +368,7 @@ class ChangeFormatUSB(QMainWindow):
             QPushButton:disabled {
                 background-color: #7f8c8d;
             }
-            QListWidget {
+            QListView {
                 font-size: 11pt;
             }
             QComboBox {
@@ -283,7 +407,10 @@ class ChangeFormatUSB(QMainWindow):
         self.usb_label.setFont(QFont("Segoe UI", 10))
         device_layout.addWidget(self.usb_label)
         
-        self.usb_list = QListWidget()
+        self.device_model = DeviceListModel(self)
+        self.usb_list = QListView()
+        self.usb_list.setModel(self.device_model)
+        self.usb_list.setSelectionMode(QListView.SingleSelection)
         self.usb_list.setItemDelegate(StyledItemDelegate())
         self.usb_list.setStyleSheet("""
             QListView {
@@ -374,6 +501,20 @@ class ChangeFormatUSB(QMainWindow):
         format_controls.addStretch()
         
         format_layout.addLayout(format_controls)
+
+        # Tamaño de clúster: automático según el histograma o fijado a mano
+        cluster_controls = QHBoxLayout()
+        cluster_controls.setSpacing(15)
+        self.cluster_label = QLabel(self.translator.gettext("CLUSTER_SIZE"))
+        self.cluster_label.setFont(QFont("Segoe UI", 10))
+        self.cluster_combo = QComboBox()
+        self.cluster_combo.setStyleSheet(self.format_combo.styleSheet())
+        self.format_combo.currentTextChanged.connect(self.update_cluster_options)
+        self.update_cluster_options(self.format_combo.currentText())
+        cluster_controls.addWidget(self.cluster_label)
+        cluster_controls.addWidget(self.cluster_combo)
+        cluster_controls.addStretch()
+        format_layout.addLayout(cluster_controls)
         
         self.convert_btn = QPushButton(self.translator.gettext("CONVERT_BTN"))
         self.convert_btn.setFont(QFont("Segoe UI", 11, QFont.Bold))
@@ -392,9 +533,56 @@ class ChangeFormatUSB(QMainWindow):
         """)
         self.convert_btn.clicked.connect(self.convert_format)
         self.convert_btn.setEnabled(False)
-        format_layout.addWidget(self.convert_btn, alignment=Qt.AlignCenter)
+
+        self.benchmark_btn = QPushButton(self.translator.gettext("BENCHMARK_BTN"))
+        self.benchmark_btn.setFont(QFont("Segoe UI", 11))
+        self.benchmark_btn.setStyleSheet("""
+            QPushButton {
+                background-color: #2980b9;
+                padding: 12px 24px;
+                font-size: 12pt;
+            }
+            QPushButton:hover {
+                background-color: #3498db;
+            }
+            QPushButton:disabled {
+                background-color: #7f8c8d;
+            }
+        """)
+        self.benchmark_btn.clicked.connect(self.run_benchmark)
+        self.benchmark_btn.setEnabled(False)
+
+        action_buttons = QHBoxLayout()
+        action_buttons.addStretch()
+        action_buttons.addWidget(self.convert_btn)
+        action_buttons.addWidget(self.benchmark_btn)
+        action_buttons.addStretch()
+        format_layout.addLayout(action_buttons)
         
         right_panel.addWidget(format_group)
+
+        # Cola de conversiones: una fila por trabajo con su estado y progreso
+        queue_group = QGroupBox(self.translator.gettext("QUEUE_GROUP"))
+        queue_group.setObjectName("queueGroup")
+        queue_layout = QVBoxLayout(queue_group)
+        self.jobs_list = QListWidget()
+        self.jobs_list.setMinimumHeight(100)
+        self.jobs_list.currentItemChanged.connect(self.update_job_buttons)
+        queue_layout.addWidget(self.jobs_list)
+
+        queue_buttons = QHBoxLayout()
+        queue_buttons.addStretch()
+        self.cancel_job_btn = QPushButton(self.translator.gettext("CANCEL_JOB_BTN"))
+        self.cancel_job_btn.clicked.connect(self.cancel_selected_job)
+        self.cancel_job_btn.setEnabled(False)
+        queue_buttons.addWidget(self.cancel_job_btn)
+        self.clear_jobs_btn = QPushButton(self.translator.gettext("CLEAR_JOBS_BTN"))
+        self.clear_jobs_btn.clicked.connect(self.clear_finished_jobs)
+        self.clear_jobs_btn.setEnabled(False)
+        queue_buttons.addWidget(self.clear_jobs_btn)
+        queue_layout.addLayout(queue_buttons)
+
+        right_panel.addWidget(queue_group)
         
         # Barra de progreso
         self.progress = QProgressBar()
@@ -416,6 +604,12 @@ class ChangeFormatUSB(QMainWindow):
             }
         """)
         right_panel.addWidget(self.progress)
+
+        self.progress_label = QLabel()
+        self.progress_label.setFont(QFont("Segoe UI", 9))
+        self.progress_label.setAlignment(Qt.AlignCenter)
+        self.progress_label.setVisible(False)
+        right_panel.addWidget(self.progress_label)
         
         # Añadir paneles al contenedor
         container.addLayout(left_panel, 55)
@@ -423,7 +617,7 @@ class ChangeFormatUSB(QMainWindow):
         main_layout.addLayout(container)
 
         # Conexiones
-        self.usb_list.itemSelectionChanged.connect(self.update_device_info)
+        self.usb_list.selectionModel().selectionChanged.connect(self.update_device_info)
 
         # Establecer paleta de colores
         self.setPalette(DarkPalette())
@@ -478,6 +672,10 @@ class ChangeFormatUSB(QMainWindow):
         view_logs_action.triggered.connect(self.view_logs)
         debug_menu.addAction(view_logs_action)
 
+        pending_action = QAction("Conversiones interrumpidas...", self)
+        pending_action.triggered.connect(self.manage_pending_conversions)
+        debug_menu.addAction(pending_action)
+
         # Menú de idioma
         language_menu = menu_bar.addMenu("🌐 " + self.translator.gettext("LANGUAGE_MENU"))
         language_menu.setObjectName("languageMenu")
@@ -501,15 +699,54 @@ class ChangeFormatUSB(QMainWindow):
         QMessageBox.information(self, "Modo Debug", msg)
         
     def view_logs(self):
-        log_dir = os.path.abspath("logs")
-        if os.path.exists(log_dir):
-            os.startfile(log_dir)
-        else:
-            QMessageBox.warning(self, "Logs", "No se encontró el directorio de logs")
+        if self.log_viewer is None:
+            from ui.log_viewer import LogViewer
+            self.log_viewer = LogViewer(ring_buffer, self)
+        self.log_viewer.show()
+        self.log_viewer.raise_()
+        self.log_viewer.activateWindow()
+
+    def manage_pending_conversions(self):
+        """Permite descartar el diario y el backup de una conversión que no se va a reanudar"""
+        from core.format_converter import FormatConverter
+
+        converter = FormatConverter()
+        try:
+            journals = [journal for journal in converter.conversiones_pendientes()
+                        if self.conversion_queue is None
+                        or self.conversion_queue.trabajo_de_unidad(journal.estado.get('unidad', '')) is None]
+            title = self.translator.gettext("PENDING_TITLE")
+            if not journals:
+                MessageBox(self, title, self.translator.gettext("PENDING_NONE"),
+                           QMessageBox.Information).exec_()
+                return
+            items = [self.translator.gettext("PENDING_ITEM").format(
+                         drive=journal.estado.get('unidad'), phase=journal.fase,
+                         date=time.strftime("%Y-%m-%d %H:%M", time.localtime(journal.estado.get('inicio', 0))),
+                         backup=journal.estado.get('backup_dir'))
+                     for journal in journals]
+            item, ok = QInputDialog.getItem(self, title, self.translator.gettext("PENDING_SELECT"),
+                                            items, 0, False)
+            if not ok:
+                return
+            journal = journals[items.index(item)]
+            confirm = MessageBox(self, title,
+                                 self.translator.gettext("PENDING_DISCARD_MSG").format(
+                                     drive=journal.estado.get('unidad'),
+                                     backup=journal.estado.get('backup_dir')),
+                                 QMessageBox.Warning)
+            confirm.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
+            confirm.setDefaultButton(QMessageBox.No)
+            if confirm.exec_() == QMessageBox.Yes:
+                converter.descartar_conversion(journal)
+        finally:
+            converter.cerrar()
 
     def show_credits(self):
-        dialog = AboutDialog(self)
-        dialog.exec_()
+        # Se construye al abrirlo por primera vez y se reutiliza
+        if self.about_dialog is None:
+            self.about_dialog = AboutDialog(self)
+        self.about_dialog.exec_()
 
     def change_language(self, lang_code):
         self.translator.set_language(lang_code)
@@ -519,6 +756,8 @@ class ChangeFormatUSB(QMainWindow):
         try:
             self.title_label.setText(f"{config.APP_NAME} (By {config.AUTHOR})")
             self.format_label.setText(self.translator.gettext("NEW_FORMAT"))
+            self.cluster_label.setText(self.translator.gettext("CLUSTER_SIZE"))
+            self.cluster_combo.setItemText(0, self.translator.gettext("CLUSTER_AUTO"))
             self.setWindowTitle(f"{config.APP_NAME} (By {config.AUTHOR})")
             self.usb_label.setText(self.translator.gettext("DISCONNECTED_DEVICES"))
             
@@ -533,10 +772,20 @@ class ChangeFormatUSB(QMainWindow):
             format_group = self.findChild(QGroupBox, "formatGroup")
             if format_group:
                 format_group.setTitle(self.translator.gettext("CONVERT_GROUP"))
+
+            queue_group = self.findChild(QGroupBox, "queueGroup")
+            if queue_group:
+                queue_group.setTitle(self.translator.gettext("QUEUE_GROUP"))
+            self.cancel_job_btn.setText(self.translator.gettext("CANCEL_JOB_BTN"))
+            self.clear_jobs_btn.setText(self.translator.gettext("CLEAR_JOBS_BTN"))
+            for job in (self.conversion_queue.trabajos() if self.conversion_queue else []):
+                if job.id in self.job_items:
+                    self.job_items[job.id].setText(self.job_text(job, job.progreso.ultimo()))
             
             self.convert_btn.setText(self.translator.gettext("CONVERT_BTN"))
+            self.benchmark_btn.setText(self.translator.gettext("BENCHMARK_BTN"))
             
-            if self.usb_list.selectedItems():
+            if self.selected_drive_letter():
                 self.update_device_info()
             else:
                 self.clear_device_info()
@@ -558,62 +807,106 @@ class ChangeFormatUSB(QMainWindow):
         )
         msg.exec_()
 
-    def refresh_usb_list(self):
-        current_selection = self.usb_list.currentItem()
-        current_drive = current_selection.text().split()[0] if current_selection else None
-        
-        self.usb_list.clear()
-        usb_drives = self.usb_manager.get_usb_devices()
-        
+    def on_device_event(self, evento):
+        logger.info(f"Dispositivo {evento['tipo']}: {evento['unidad']}")
+        self.usb_manager.invalidate(f"evento {evento['tipo']} {evento['unidad']}")
+        self.refresh_usb_list()
+
+    def on_refresh_timer(self):
+        # Si el backend de notificaciones se cae, volver al sondeo normal
+        if (self.refresh_timer.interval() != config.REFRESH_INTERVAL
+                and not self.device_watcher.activo):
+            logger.warning("Watcher de dispositivos inactivo; volviendo al sondeo")
+            self.refresh_timer.setInterval(config.REFRESH_INTERVAL)
+        self.refresh_usb_list()
+
+    def setup_enumerator(self):
+        """Hilo propio para la enumeración de dispositivos"""
+        self.enumeration_thread = QThread(self)
+        self.enumerator = DeviceEnumerator(self.usb_manager)
+        self.enumerator.moveToThread(self.enumeration_thread)
+        self.enumeration_requested.connect(self.enumerator.enumerate)
+        self.enumerator.devices_ready.connect(self.on_devices_ready)
+        self.enumeration_thread.finished.connect(self.enumerator.deleteLater)
+        self.enumeration_busy = False
+        self.enumeration_pending = False
+        self.shown_version = -1
+        self.enumeration_thread.start()
+
+    def refresh_usb_list(self, force=False):
+        """Pide una enumeración en segundo plano; no bloquea la interfaz"""
+        if self.usb_manager is None:
+            # Aún no ha terminado el arranque; finish_startup enumera
+            return
+        if self.enumeration_busy:
+            # Una sola enumeración a la vez; la siguiente se lanza al terminar
+            self.enumeration_pending = True
+            return
+        self.enumeration_busy = True
+        self.enumeration_requested.emit(force)
+
+    def on_devices_ready(self, usb_drives, version):
+        self.enumeration_busy = False
+        if self.enumeration_pending:
+            self.enumeration_pending = False
+            self.refresh_usb_list()
+
+        if version == self.shown_version:
+            return
+        self.shown_version = version
+
         if usb_drives:
             self.usb_label.setText(self.translator.gettext("CONNECTED_DEVICES"))
         else:
             self.usb_label.setText(self.translator.gettext("DISCONNECTED_DEVICES"))
-        
-        for drive in usb_drives:
-            size_gb = int(drive['size']) / (1024**3) if drive['size'] else 0
-            free_gb = int(drive['free']) / (1024**3) if drive['free'] else 0
-            item_text = f"{drive['letter']} - {drive['label']} ({size_gb:.1f} GB, {drive['filesystem']})"
-            self.usb_list.addItem(item_text)
-            
-            if current_drive == drive['letter']:
-                self.usb_list.setCurrentRow(self.usb_list.count() - 1)
 
-    def update_device_info(self):
-        if not self.usb_list.selectedItems():
+        self.device_model.apply_devices(usb_drives)
+        # Refrescar el panel si cambió la unidad seleccionada
+        self.update_device_info()
+
+    def selected_drive_letter(self):
+        indexes = self.usb_list.selectionModel().selectedIndexes()
+        if not indexes:
+            return None
+        return self.device_model.data(indexes[0], DeviceListModel.LetterRole)
+
+    def update_device_info(self, *args):
+        drive_letter = self.selected_drive_letter()
+        if not drive_letter:
             self.clear_device_info()
             return
-            
-        selected_text = self.usb_list.currentItem().text()
-        drive_letter = selected_text.split()[0]
-        
-        for drive in self.usb_manager.get_usb_devices():
-            if drive['letter'] == drive_letter:
-                size_gb = int(drive['size']) / (1024**3) if drive['size'] else 0
-                free_gb = int(drive['free']) / (1024**3) if drive['free'] else 0
-                
-                self.drive_label.setText(
-                    self.translator.gettext("DRIVE_LABEL_FORMAT").format(
-                        letter=drive['letter'], label=drive['label']
-                    )
-                )
-                self.fs_label.setText(
-                    self.translator.gettext("FS_LABEL_FORMAT").format(
-                        fs=drive['filesystem']
-                    )
-                )
-                self.size_label.setText(
-                    self.translator.gettext("SIZE_LABEL_FORMAT").format(
-                        size=size_gb
-                    )
-                )
-                self.free_label.setText(
-                    self.translator.gettext("FREE_LABEL_FORMAT").format(
-                        free=free_gb
-                    )
-                )
-                self.convert_btn.setEnabled(True)
-                break
+
+        # Solo la instantánea: nunca enumerar desde el hilo de la interfaz
+        drive = self.usb_manager.get_device(drive_letter, refresh=False)
+        if drive is None:
+            self.clear_device_info()
+            return
+
+        size_gb = int(drive['size']) / (1024**3) if drive['size'] else 0
+        free_gb = int(drive['free']) / (1024**3) if drive['free'] else 0
+
+        self.drive_label.setText(
+            self.translator.gettext("DRIVE_LABEL_FORMAT").format(
+                letter=drive['letter'], label=drive['label']
+            )
+        )
+        self.fs_label.setText(
+            self.translator.gettext("FS_LABEL_FORMAT").format(
+                fs=drive['filesystem']
+            )
+        )
+        self.size_label.setText(
+            self.translator.gettext("SIZE_LABEL_FORMAT").format(
+                size=size_gb
+            )
+        )
+        self.free_label.setText(
+            self.translator.gettext("FREE_LABEL_FORMAT").format(
+                free=free_gb
+            )
+        )
+        self.convert_btn.setEnabled(True)
+        self.benchmark_btn.setEnabled(True)
 
     def clear_device_info(self):
         self.drive_label.setText(self.translator.gettext("DRIVE_LABEL"))
@@ -621,103 +914,316 @@ class ChangeFormatUSB(QMainWindow):
         self.size_label.setText(self.translator.gettext("SIZE_LABEL"))
         self.free_label.setText(self.translator.gettext("FREE_LABEL"))
         self.convert_btn.setEnabled(False)
+        self.benchmark_btn.setEnabled(False)
+
+    def update_cluster_options(self, fs):
+        """Rellena el combo de clúster con los tamaños válidos para el formato"""
+        self.cluster_combo.clear()
+        self.cluster_combo.addItem(self.translator.gettext("CLUSTER_AUTO"), None)
+        for size in TAMANOS_VALIDOS.get(fs.upper(), []):
+            self.cluster_combo.addItem(formato_argumento(size), size)
+
+    def set_controls_enabled(self, enabled):
+        self.convert_btn.setEnabled(enabled)
+        self.benchmark_btn.setEnabled(enabled)
+        self.usb_list.setEnabled(enabled)
+        self.format_combo.setEnabled(enabled)
+        self.cluster_combo.setEnabled(enabled)
 
     def convert_format(self):
         logger.debug("Iniciando proceso de conversión...")
-        if not self.usb_list.selectedItems():
+        drive_letter = self.selected_drive_letter()
+        if not drive_letter:
             return
-            
-        selected_text = self.usb_list.currentItem().text()
-        drive_letter = selected_text.split()[0]
+
+        if self.conversion_queue.trabajo_de_unidad(drive_letter):
+            MessageBox(
+                self,
+                self.translator.gettext("PLAN_ERROR_TITLE"),
+                self.translator.gettext("QUEUE_BUSY_MSG").format(drive=drive_letter),
+                QMessageBox.Warning
+            ).exec_()
+            return
+
         new_fs = self.format_combo.currentText()
-        
+        cluster_size = self.cluster_combo.currentData()
+
+        # El plan se calcula en segundo plano: escanear la unidad puede tardar
+        self.set_controls_enabled(False)
+        self.progress_label.setText(self.translator.gettext("PLANNING_MSG"))
+        self.progress_label.setVisible(True)
+        self.plan_thread = PlanWorker(drive_letter, new_fs, parent=self, cluster_size=cluster_size)
+        self.plan_thread.planned.connect(
+            lambda plan: self.confirm_conversion(drive_letter, new_fs, plan, cluster_size))
+        self.plan_thread.failed.connect(self.plan_failed)
+        self.plan_thread.finished.connect(self.plan_thread.deleteLater)
+        self.plan_thread.start()
+
+    def run_benchmark(self):
+        drive_letter = self.selected_drive_letter()
+        if not drive_letter:
+            return
+
+        self.set_controls_enabled(False)
+        self.progress.setVisible(True)
+        self.progress.setValue(0)
+        self.progress_label.setText(self.translator.gettext("BENCHMARK_RUNNING").format(drive=drive_letter))
+        self.progress_label.setVisible(True)
+        self.benchmark_thread = BenchmarkWorker(drive_letter, parent=self)
+        self.benchmark_thread.progress_updated.connect(self.update_progress)
+        self.benchmark_thread.measured.connect(
+            lambda resultado: self.benchmark_completed(drive_letter, resultado))
+        self.benchmark_thread.failed.connect(self.benchmark_failed)
+        self.benchmark_thread.finished.connect(self.benchmark_thread.deleteLater)
+        self.benchmark_thread.start()
+
+    def benchmark_completed(self, drive_letter, resultado):
+        self.benchmark_thread = None
+        self.progress.setVisible(False)
+        self.progress_label.setVisible(False)
+        self.set_controls_enabled(True)
+        MessageBox(
+            self,
+            self.translator.gettext("BENCHMARK_TITLE"),
+            self.translator.gettext("BENCHMARK_RESULT").format(
+                drive=drive_letter,
+                seq_write=resultado['escritura_secuencial'] / (1024 * 1024),
+                seq_read=resultado['lectura_secuencial'] / (1024 * 1024),
+                rand_write=resultado['escritura_aleatoria_iops'],
+                rand_read=resultado['lectura_aleatoria_iops']),
+            QMessageBox.Information
+        ).exec_()
+
+    def benchmark_failed(self, error_msg):
+        self.benchmark_thread = None
+        self.progress.setVisible(False)
+        self.progress_label.setVisible(False)
+        self.set_controls_enabled(True)
+        MessageBox(
+            self,
+            self.translator.gettext("ERROR_TITLE"),
+            self.translator.gettext("ERROR_MSG").format(error=error_msg),
+            QMessageBox.Critical
+        ).exec_()
+
+    def plan_failed(self, error_msg):
+        self.progress_label.setVisible(False)
+        self.set_controls_enabled(True)
+        MessageBox(
+            self,
+            self.translator.gettext("PLAN_ERROR_TITLE"),
+            error_msg,
+            QMessageBox.Warning
+        ).exec_()
+
+    def confirm_conversion(self, drive_letter, new_fs, plan, cluster_size=None):
+        self.progress_label.setVisible(False)
+        # Las conversiones no bloquean la interfaz: se puede encolar otra unidad
+        self.set_controls_enabled(True)
+        logger.info(f"Plan para {drive_letter}: {plan.como_dict()}")
+        mensaje = self.translator.gettext("CONFIRM_MSG").format(drive=drive_letter, format=new_fs)
+        mensaje += "\n\n" + self.translator.gettext("PLAN_MSG").format(
+            plan=plan.descripcion(), eta=format_duration(plan.segundos))
+        cluster = plan.descripcion_cluster()
+        if cluster:
+            mensaje += "\n" + self.translator.gettext("PLAN_CLUSTER_MSG").format(cluster=cluster)
+
         reply = MessageBox(
             self,
             self.translator.gettext("CONFIRM_TITLE"),
-            self.translator.gettext("CONFIRM_MSG").format(drive=drive_letter, format=new_fs),
+            mensaje,
             QMessageBox.Question
         ).exec_()
         
         if reply == QMessageBox.No:
             return
-            
-        # Deshabilitar controles durante la conversión
-        self.convert_btn.setEnabled(False)
-        self.usb_list.setEnabled(False)
-        self.format_combo.setEnabled(False)
-        self.progress.setVisible(True)
-        self.progress.setValue(0)
-        
-        # Crear y configurar el hilo de conversión
-        self.conversion_thread = ConversionWorker(drive_letter, new_fs)
-        self.conversion_thread.finished.connect(self.conversion_completed)
-        self.conversion_thread.error.connect(self.conversion_error)
-        self.conversion_thread.progress_updated.connect(self.update_progress)
-        self.conversion_thread.start()
+
+        try:
+            self.conversion_queue.encolar(drive_letter, new_fs, plan=plan, tamano_cluster=cluster_size)
+        except ValueError:
+            MessageBox(
+                self,
+                self.translator.gettext("PLAN_ERROR_TITLE"),
+                self.translator.gettext("QUEUE_BUSY_MSG").format(drive=drive_letter),
+                QMessageBox.Warning
+            ).exec_()
+
+    def create_converter(self, turno):
+        """Convertidor de cada trabajo de la cola (se llama desde su hilo)"""
+        from core.format_converter import FormatConverter
+        return FormatConverter(self.device_watcher, turno=turno)
 
     def update_progress(self, value):
         self.progress.setValue(value)
 
+    def progress_text(self, estado):
+        fase = PHASE_NAMES.get(estado['fase'], estado['fase'] or "")
+        partes = [f"{fase} {int(estado['porcentaje'])}%"]
+        if estado['bytes_totales'] and estado['fase'] in ("copia", "restauracion"):
+            partes.append(f"{format_size(estado['bytes_hechos'])} / {format_size(estado['bytes_totales'])}"
+                          f" ({estado['archivos_hechos']}/{estado['archivos_totales']} archivos)")
+        if estado['throughput_medio']:
+            partes.append(f"{format_size(estado['throughput_medio'])}/s")
+        partes.append(f"ETA {format_duration(estado['eta'])}")
+        return " · ".join(partes)
+
+    def job_text(self, job, estado=None):
+        from core.conversion_queue import EN_CURSO, ERROR
+
+        text = f"{job.unidad} → {job.nuevo_fs}: {self.translator.gettext(job_state_key(job.estado))}"
+        if job.estado == EN_CURSO and estado:
+            text += " · " + self.progress_text(estado)
+        elif job.estado == ERROR and job.mensaje:
+            text += " · " + job.mensaje.splitlines()[0]
+        return text
+
+    def selected_job(self):
+        item = self.jobs_list.currentItem()
+        if item is None:
+            return None
+        return self.conversion_queue.trabajo(item.data(Qt.UserRole))
+
+    def update_job_buttons(self, *args):
+        job = self.selected_job()
+        self.cancel_job_btn.setEnabled(bool(job and job.activo and not job.cancelado))
+        self.clear_jobs_btn.setEnabled(
+            any(not job.activo for job in self.conversion_queue.trabajos()))
+
+    def on_job_changed(self, job):
+        from core.conversion_queue import EN_CURSO, COMPLETADO, ERROR
+
+        item = self.job_items.get(job.id)
+        if item is None:
+            item = QListWidgetItem()
+            item.setData(Qt.UserRole, job.id)
+            self.jobs_list.addItem(item)
+            self.job_items[job.id] = item
+        # El estado se lee al entregar la señal: puede ir por delante del aviso
+        item.setText(self.job_text(job, job.progreso.ultimo()))
+        if job.estado == EN_CURSO and not self.jobs_timer.isActive():
+            self.jobs_timer.start()
+        self.update_job_buttons()
+
+        if job.activo or job.id in self.reported_jobs:
+            return
+        self.reported_jobs.add(job.id)
+        self.finished_batch.append(job)
+        if job.estado == COMPLETADO:
+            self.conversion_completed(job.unidad)
+        elif job.estado == ERROR:
+            item.setToolTip(job.mensaje or "")
+            self.conversion_error(job.unidad, job.mensaje)
+        else:
+            logger.info(f"Conversión de {job.unidad} cancelada")
+            self.usb_manager.invalidate(f"cancelación de {job.unidad}")
+            self.refresh_usb_list()
+        if not self.conversion_queue.activos():
+            self.show_batch_summary()
+
+    def update_jobs_progress(self):
+        from core.conversion_queue import EN_CURSO
+
+        running = False
+        for job in self.conversion_queue.activos():
+            if job.estado != EN_CURSO:
+                continue
+            running = True
+            estado = job.progreso.tomar()
+            if estado is not None and job.id in self.job_items:
+                self.job_items[job.id].setText(self.job_text(job, estado))
+        if not running:
+            self.jobs_timer.stop()
+
+    def cancel_selected_job(self):
+        job = self.selected_job()
+        if job is not None:
+            self.conversion_queue.cancelar(job.id)
+            self.update_job_buttons()
+
+    def clear_finished_jobs(self):
+        self.conversion_queue.retirar_terminados()
+        for job_id in list(self.job_items):
+            if self.conversion_queue.trabajo(job_id) is None:
+                item = self.job_items.pop(job_id)
+                self.jobs_list.takeItem(self.jobs_list.row(item))
+                self.reported_jobs.discard(job_id)
+        self.update_job_buttons()
+
     def conversion_completed(self, drive_letter):
         logger.info(f"Conversión completada exitosamente para {drive_letter}")
-        
-        # Restaurar UI
-        self.progress.setVisible(False)
-        self.convert_btn.setEnabled(True)
-        self.usb_list.setEnabled(True)
-        self.format_combo.setEnabled(True)
-        
-        # Limpiar referencia al hilo
-        self.conversion_thread = None
-        
-        # Mostrar mensaje de éxito
-        MessageBox(
-            self,
-            self.translator.gettext("SUCCESS_TITLE"),
-            self.translator.gettext("SUCCESS_MSG").format(drive=drive_letter),
-            QMessageBox.Information
-        ).exec_()
-        
+        # El resultado queda en la lista de la cola; el resumen sale al terminar el lote
         # Actualizar lista después de un tiempo
+        self.usb_manager.invalidate(f"conversión de {drive_letter}")
         QTimer.singleShot(1000, self.refresh_usb_list)
     
-    def conversion_error(self, error_msg):
-        logger.error(f"Error en conversión: {error_msg}")
-        
-        # Restaurar UI
-        self.progress.setVisible(False)
-        self.convert_btn.setEnabled(True)
-        self.usb_list.setEnabled(True)
-        self.format_combo.setEnabled(True)
-        
-        # Limpiar referencia al hilo
-        self.conversion_thread = None
-        
-        # Mostrar mensaje de error
-        MessageBox(
+    def conversion_error(self, drive_letter, error_msg):
+        logger.error(f"Error en conversión de {drive_letter}: {error_msg}")
+        self.usb_manager.invalidate("error de conversión")
+
+    def show_batch_summary(self):
+        """Resumen no modal de los trabajos terminados desde que la cola estaba vacía"""
+        from core.conversion_queue import COMPLETADO, ERROR
+
+        jobs, self.finished_batch = self.finished_batch, []
+        if not jobs:
+            return
+        done = [job for job in jobs if job.estado == COMPLETADO]
+        failed = [job for job in jobs if job.estado == ERROR]
+        if not done and not failed:
+            # Solo cancelaciones: las ha pedido el usuario
+            return
+        if len(jobs) == 1 and done:
+            text = self.translator.gettext("SUCCESS_MSG").format(drive=done[0].unidad)
+        elif len(jobs) == 1 and failed:
+            text = self.translator.gettext("ERROR_MSG").format(error=failed[0].mensaje)
+        else:
+            text = self.translator.gettext("BATCH_SUMMARY_MSG").format(
+                done=len(done), failed=len(failed), cancelled=len(jobs) - len(done) - len(failed))
+            for job in failed:
+                error = job.mensaje.splitlines()[0] if job.mensaje else ""
+                text += f"\n{job.unidad} - {error}"
+
+        if self.batch_summary is not None:
+            self.batch_summary.close()
+        self.batch_summary = MessageBox(
             self,
-            self.translator.gettext("ERROR_TITLE"),
-            self.translator.gettext("ERROR_MSG").format(error=error_msg),
-            QMessageBox.Critical
-        ).exec_()
-    
+            self.translator.gettext("ERROR_TITLE" if failed else "SUCCESS_TITLE"),
+            text,
+            QMessageBox.Warning if failed else QMessageBox.Information
+        )
+        self.batch_summary.setModal(False)
+        self.batch_summary.show()
+
+    def shutdown_background(self):
+        if self.benchmark_thread and self.benchmark_thread.isRunning():
+            # Borra su archivo temporal al detenerse
+            self.benchmark_thread.cancel()
+            self.benchmark_thread.wait(5000)
+        if self.device_watcher is not None:
+            self.device_watcher.stop()
+        if self.enumeration_thread is not None:
+            self.enumeration_thread.quit()
+            self.enumeration_thread.wait(2000)
+        if self.usb_manager is not None:
+            self.usb_manager.shutdown()
+
     def closeEvent(self, event):
-        if self.conversion_thread and self.conversion_thread.isRunning():
+        if self.conversion_queue is not None and self.conversion_queue.activos():
             reply = QMessageBox.question(
                 self,
                 "Operación en progreso",
-                "Una conversión está en curso. ¿Estás seguro de que quieres salir?",
+                "Hay conversiones en curso. ¿Estás seguro de que quieres salir?",
                 QMessageBox.Yes | QMessageBox.No
             )
             
             if reply == QMessageBox.Yes:
-                self.conversion_thread.cancel()
-                self.conversion_thread.quit()
-                self.conversion_thread.wait(2000)
+                self.conversion_queue.detener(timeout=5)
+                self.shutdown_background()
                 event.accept()
             else:
                 event.ignore()
         else:
+            self.shutdown_background()
             event.accept()
 
 if __name__ == "__main__":
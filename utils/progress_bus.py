@@ -0,0 +1,93 @@
+import threading
+
+
+class ProgressBus:
+    """Punto de encuentro entre los hilos que publican progreso y la interfaz.
+
+    Los productores solo sustituyen la referencia al último estado; el
+    consumidor la recoge a su ritmo con tomar(), así que cualquier número
+    de publicaciones entre dos lecturas se fusiona en una sola
+    actualización. La lectura del estado no toma ningún lock: la tupla
+    (version, marca, estado) se reemplaza entera en cada publicación.
+
+    fuente, si se asigna, es una función que devuelve el ProgressTracker en
+    curso (o None): tomar() le pide un snapshot solo si ha cambiado desde la
+    última lectura, así los hilos de copia no calculan ninguno por bloque.
+    """
+
+    def __init__(self):
+        self._ultimo = (0, None, None)
+        self._lock = threading.Lock()
+        self._version_tomada = 0
+        self.publicados = 0
+        self.descartados = 0
+        self.emitidos = 0
+        self.cerrado = False
+        self.fuente = None
+        self._fuente_tomada = (None, None)
+
+    def publicar(self, estado, marca=None):
+        """Publica un estado nuevo desde cualquier hilo.
+
+        marca es un valor creciente opcional (p. ej. el tiempo transcurrido):
+        si un productor llega tarde con un estado más antiguo que el actual,
+        se descarta en lugar de pisar al más reciente.
+        """
+        with self._lock:
+            if self.cerrado:
+                self.descartados += 1
+                return
+            self.publicados += 1
+            version, marca_actual, _ = self._ultimo
+            if marca is not None and marca_actual is not None and marca < marca_actual:
+                self.descartados += 1
+                return
+            self._ultimo = (version + 1, marca, estado)
+
+    def ultimo(self):
+        """Último estado publicado (lectura sin bloqueo)"""
+        return self._ultimo[2]
+
+    def tomar(self):
+        """Devuelve el último estado si es nuevo desde la anterior llamada, o None.
+
+        Pensado para un único consumidor (el hilo de la interfaz).
+        """
+        self._muestrear()
+        version, _, estado = self._ultimo
+        if version == self._version_tomada:
+            return None
+        self._version_tomada = version
+        self.emitidos += 1
+        return estado
+
+    def _muestrear(self):
+        """Publica un snapshot de la fuente si ha cambiado desde la última lectura"""
+        fuente = self.fuente
+        seguidor = fuente() if fuente is not None else None
+        if seguidor is None:
+            return
+        cambios = seguidor.cambios
+        if self._fuente_tomada == (seguidor, cambios):
+            return
+        self._fuente_tomada = (seguidor, cambios)
+        estado = seguidor.snapshot()
+        self.publicar(estado, estado.get('transcurrido'))
+
+    def cerrar(self):
+        """Deja de aceptar publicaciones; las que lleguen después se descartan"""
+        with self._lock:
+            self.cerrado = True
+            self.fuente = None
+            self._fuente_tomada = (None, None)
+
+    def contadores(self):
+        """Publicados, emitidos, fusionados y descartados hasta ahora"""
+        publicados = self.publicados
+        descartados = self.descartados
+        return {
+            'publicados': publicados,
+            'emitidos': self.emitidos,
+            'fusionados': max(0, publicados - descartados - self.emitidos),
+            'descartados': descartados,
+        }